@@ -15,7 +15,7 @@ import yaml
 
 from closure_collector.closures import index_reference
 from flock.closures import lookup
-from flock.core import FlockAggregator, FlockDict
+from flock.core import FlockAggregator, FlockDict, SourceList
 from flock.util import FlockException
 
 GENERAL = "General"
@@ -64,7 +64,7 @@ def apply_attribute_table(character):
         character["Attribute_Bonuses"][bonus] = lookup(character, attribute, table)
     character["base_bonuses"] = {"Spell Points Multiple": {"General": 1}}
     character["bonuses"] = FlockAggregator(
-        [character["Attribute_Bonuses"], character["base_bonuses"]], cross_total
+        SourceList([character["Attribute_Bonuses"], character["base_bonuses"]]), cross_total
     )
 
 
@@ -164,24 +164,25 @@ def apply_heroics(character):
 
 
 def apply_rules(character):
-    # pprint(ret.resolve())
-    apply_attribs(character)
-    # pprint(ret.resolve())
-    apply_attribute_table(character)
-    # pprint(ret.check())
-    # pprint(ret.resolve())
-    apply_racial_bonuses(character)
-    # pprint(ret.resolve())
-    apply_level_allotments(character)
-    # pprint(ret.resolve())
-    apply_skills(character)
-    # pprint(ret.resolve())
-    apply_heroics(character)
-    # pprint(ret.resolve())
-    character["Spell Points"] = FlockAggregator(
-        [character["bonuses"]["Spell Points Multiple"]],
-        lambda x: sum(x) * character["bonuses"]["Spell Points"],
-    )
+    with character.batch():
+        # pprint(ret.resolve())
+        apply_attribs(character)
+        # pprint(ret.resolve())
+        apply_attribute_table(character)
+        # pprint(ret.check())
+        # pprint(ret.resolve())
+        apply_racial_bonuses(character)
+        # pprint(ret.resolve())
+        apply_level_allotments(character)
+        # pprint(ret.resolve())
+        apply_skills(character)
+        # pprint(ret.resolve())
+        apply_heroics(character)
+        # pprint(ret.resolve())
+        character["Spell Points"] = FlockAggregator(
+            SourceList([character["bonuses"]["Spell Points Multiple"]]),
+            lambda x: sum(x) * character["bonuses"]["Spell Points"],
+        )
     return character
 
 
@@ -1,13 +1,16 @@
 """EXPERIMENTAL simulate characters"""
 
 import random
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
 import mythica.model
 
 from flock.core import FlockDict
+from flock.simulation import simulate
 
-sheet = {"seed": 42}
+sheet = {"seed": 42, "Race": "Human", "level": 1, "skills": [], "practice_sessions": {}}
+stats = ["Combat Skill", "Dexterity", "Health", "Intelligence", "Magic", "Perception", "Presence", "Speed", "Spirit", "Strength", "Luck"]
 
 
 def die(num, sides, rnd=None):
@@ -20,9 +23,18 @@ def die(num, sides, rnd=None):
 def model():
     """create and return a character"""
     char = FlockDict(sheet)
-    mythica.model.apply_rules(char)
     char["rand"] = lambda: random.Random(char["seed"])
     char["roll"] = lambda: partial(die, rnd=char["rand"])
     char["rolls"] = lambda: [char["roll"](1, 10) + char["roll"](1, 10) for _ in range(12)]
     char["sorted_rolls"] = lambda: sorted(char["rolls"])
+    # the best eleven rolls, in the order the stats are listed
+    char["base_stats"] = {stat: (lambda i: lambda: char["sorted_rolls"][i])(i) for i, stat in enumerate(stats, 1)}
+    mythica.model.apply_rules(char)
     return char
+
+
+if __name__ == "__main__":
+    with ProcessPoolExecutor() as executor:
+        results = simulate(model, range(10000), stats + [("points", "available", "universal")], executor)
+    for key, statistics in results.items():
+        print(f"{key}: {statistics}")
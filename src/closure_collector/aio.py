@@ -0,0 +1,87 @@
+"""
+Evaluating collectors whose promises include coroutine functions.
+
+Reading a coroutine promise with the usual synchronous access raises a TypeError, as its value can only be had by
+awaiting it; ``aget()`` awaits it instead and caches the result like any other value.  Once cached, the value can be read
+synchronously as well, so ordinary promises may depend on values computed by coroutines.
+
+``ashear()`` first awaits every coroutine promise in the collector and those nested in it concurrently, then builds the
+sheared result in the same order as ``shear()``, with errors raised or recorded exactly as they are there.  Coroutine
+promises that read each other with ``aget()`` are each only awaited once, and one that fails is not awaited again to
+raise or record its error.
+
+Promises must be coroutine functions themselves to be awaited, a function that only returns a coroutine, such as
+``lambda: load(name)``, raises a TypeError saying so.
+"""
+
+import asyncio
+import inspect
+
+from closure_collector.parallel import promise_items
+
+
+def is_async(promise) -> bool:
+    """Check whether calling promise gives a coroutine to be awaited."""
+    return inspect.iscoroutinefunction(promise)
+
+
+def async_keys(collector):
+    """
+    Find the coroutine promises in collector and in every collector nested in it.
+
+    :return: a list of (collector, key) pairs
+    """
+    found = []
+    pending = [collector]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        for key, promise in promise_items(current):
+            if is_async(promise):
+                found.append((current, key))
+            elif hasattr(promise, "sheared_items"):
+                pending.append(promise)
+    return found
+
+
+async def ashear(collector, record_errors=False):
+    """
+    Shear collector, awaiting all of its coroutine promises concurrently.
+
+    :param collector: a collector providing aget(), sheared_items() and assemble(), such as a FlockDict or FlockList
+    :param record_errors: as for shear()
+    :return: the same value as collector.shear(record_errors) would give if every promise were synchronous
+    """
+    keys = async_keys(collector)
+    results = await asyncio.gather(*(owner.aget(key) for owner, key in keys), return_exceptions=True)
+    failed = {(id(owner), key): result for (owner, key), result in zip(keys, results, strict=True) if isinstance(result, Exception)}
+    return await build(collector, record_errors, failed)
+
+
+async def build(collector, record_errors, failed):
+    """
+    Shear collector key by key, awaiting the values of coroutine promises, most of which are cached by now.
+
+    :param failed: the errors raised by coroutine promises already awaited, by the id() of their collector and their key
+    """
+    sheared = {}
+    for key in collector.shear_keys():
+        promise = collector.promises[key]
+        if is_async(promise):
+            try:
+                error = failed.get((id(collector), key))
+                if error is not None:
+                    raise error
+                sheared[key] = await collector.aget(key)
+            except Exception as e:
+                if not record_errors:
+                    raise
+                sheared[key] = e
+        elif hasattr(promise, "sheared_items"):
+            sheared[key] = await build(promise, record_errors, failed)
+        else:
+            sheared.update(collector.sheared_items((key,), record_errors=record_errors))
+    return collector.assemble(sheared)
@@ -0,0 +1,262 @@
+"""
+Bounded caches for closure collectors.
+
+By default a collector caches every value it computes in a plain dict until a write drops it.  A collector given a
+CachePolicy instead caches values in a BoundedCache, which holds at most a number of entries and/or an estimated number of
+bytes, evicting the least recently or least frequently used values to stay within them.
+
+Eviction only forgets a value, it does not change its version or anything computed from it, so an evicted key is simply
+computed again the next time it is read.
+
+A policy may also decide what to cache from how long each value took to compute, not counting the time spent computing
+the values it read, which are cached or not on their own account: values cheaper than min_cost are not cached at all, and
+values costing at least pin_cost are pinned, never to be evicted.  The decision is made again each
+time a key is computed, and the latest decision and cost for each key are kept in BoundedCache.decisions until the key
+is forgotten.
+"""
+
+import heapq
+import sys
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+EVICTIONS = ("lru", "lfu")
+SKIP = "skip"
+CACHE = "cache"
+PIN = "pin"
+NOTHING = object()
+
+
+class CachePolicy:
+    """
+    The limits and eviction order for the caches of collectors, nested collectors are given a cache of their own.
+
+    :param max_entries: the most values each cache may hold, None for no limit
+    :param max_bytes: the most bytes the values in each cache may take, as estimated by sizeof, None for no limit
+    :param eviction: "lru" to evict the least recently used value first, or "lfu" for the least frequently used value,
+        with ties going to the least recently used
+    :param sizeof: function estimating the size of a value in bytes, sys.getsizeof by default, which does not include
+        the size of anything the value refers to
+    :param min_cost: values computed in fewer seconds than this are not cached, None to cache values however cheap
+    :param pin_cost: values taking at least this many seconds to compute are never evicted, None to pin nothing
+    :param persistent: a PersistentCache storing computed values on disk for later processes, see
+        closure_collector.persistent, None to keep values only in memory
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        eviction: str = "lru",
+        sizeof=sys.getsizeof,
+        min_cost: float | None = None,
+        pin_cost: float | None = None,
+        persistent=None,
+    ):
+        if eviction not in EVICTIONS:
+            raise ValueError(f"eviction must be one of {EVICTIONS}, not {eviction!r}")
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("max_bytes cannot be negative")
+        if min_cost is not None and pin_cost is not None and min_cost > pin_cost:
+            raise ValueError("min_cost cannot be more than pin_cost")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.sizeof = sizeof
+        self.min_cost = min_cost
+        self.pin_cost = pin_cost
+        self.persistent = persistent
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(max_entries={self.max_entries}, max_bytes={self.max_bytes}, eviction={self.eviction!r}, "
+            f"min_cost={self.min_cost}, pin_cost={self.pin_cost}, persistent={self.persistent!r})"
+        )
+
+    def strategy(self, cost: float) -> str:
+        """
+        Decide how to cache a value from the seconds it took to compute.
+
+        :return: SKIP, CACHE or PIN
+        """
+        if self.min_cost is not None and cost < self.min_cost:
+            return SKIP
+        if self.pin_cost is not None and cost >= self.pin_cost:
+            return PIN
+        return CACHE
+
+    def new_cache(self) -> "BoundedCache":
+        """Create an empty cache following this policy."""
+        return BoundedCache(self)
+
+
+class BoundedCache(MutableMapping):
+    """
+    A cache mapping keys to computed values that evicts values to stay within the limits of its CachePolicy.
+
+    Reading a value counts as a hit and storing one as a miss, since values are only stored after being computed.  Values
+    offered through put() but not cached count as misses as well.
+
+    For LFU eviction the keys that may be evicted are kept in buckets by their number of uses, each bucket in order of
+    use, with a heap of the use counts that have buckets, so that the next victim is found without scanning every entry.
+    """
+
+    def __init__(self, policy: CachePolicy):
+        self.policy = policy
+        self.entries: OrderedDict = OrderedDict()
+        self.sizes: dict = {}
+        self.uses: dict = {}
+        self.buckets: dict = {}
+        self.counts: list = []
+        self.pinned: set = set()
+        self.decisions: dict = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        self.hits += 1
+        self.entries.move_to_end(key)
+        uses = self.uses[key]
+        self.uses[key] = uses + 1
+        if key in self.buckets.get(uses, ()):
+            self.unbucket(key, uses)
+            self.bucket(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store(key, value, pin=False)
+
+    def __delitem__(self, key):
+        if key not in self.entries:
+            raise KeyError(key)
+        self.discard(key)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.policy!r}, {self.stats()})"
+
+    def put(self, key, value, cost: float):
+        """
+        Store value as computed in cost seconds, if the policy decides it is worth caching.
+
+        The decision and the cost are recorded in decisions as a (strategy, cost) pair.
+        """
+        strategy = self.policy.strategy(cost)
+        self.decisions[key] = (strategy, cost)
+        if strategy == SKIP:
+            self.discard(key)
+            self.misses += 1
+        else:
+            self.store(key, value, pin=strategy == PIN)
+
+    def store(self, key, value, pin: bool):
+        """Cache value under key, pinning it if pin is True, then evict whatever no longer fits."""
+        self.discard(key)
+        self.misses += 1
+        self.entries[key] = value
+        self.sizes[key] = self.policy.sizeof(value)
+        self.uses[key] = 1
+        self.size += self.sizes[key]
+        if pin:
+            self.pinned.add(key)
+        self.evict(key)
+        if self.policy.eviction == "lfu" and key in self.entries and not pin:
+            self.bucket(key)
+
+    def pop(self, key, *default):
+        """Remove key, and the decision made for it, returning its value, without counting it as a hit."""
+        self.decisions.pop(key, None)
+        if key not in self.entries:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self.entries[key]
+        self.discard(key)
+        return value
+
+    def discard(self, key):
+        """Remove key if present, leaving the counters alone."""
+        if self.entries.pop(key, NOTHING) is not NOTHING:
+            self.size -= self.sizes.pop(key)
+            if key in self.buckets.get(self.uses[key], ()):
+                self.unbucket(key, self.uses[key])
+            del self.uses[key]
+            self.pinned.discard(key)
+
+    def bucket(self, key):
+        """Add key to the bucket of the keys used as often, as the most recently used of them."""
+        uses = self.uses[key]
+        found = self.buckets.get(uses)
+        if found is None:
+            found = self.buckets[uses] = OrderedDict()
+            heapq.heappush(self.counts, uses)
+        found[key] = None
+
+    def unbucket(self, key, uses):
+        """Remove key from the bucket of the keys used uses times, dropping the bucket once empty."""
+        found = self.buckets[uses]
+        del found[key]
+        if not found:
+            del self.buckets[uses]
+            if len(self.counts) > 2 * len(self.buckets) + 8:  # drop the counts of buckets since emptied
+                self.counts = list(self.buckets)
+                heapq.heapify(self.counts)
+
+    def over_limit(self) -> bool:
+        """Check whether the cache holds more entries or bytes than its policy allows."""
+        policy = self.policy
+        return (policy.max_entries is not None and len(self.entries) > policy.max_entries) or (policy.max_bytes is not None and self.size > policy.max_bytes)
+
+    def victim(self, keep):
+        """
+        Choose the key to evict next, the least recently used or the least frequently used.
+
+        :return: the key, or NOTHING if everything other than keep is pinned
+        """
+        if self.policy.eviction == "lfu":  # keep is only added to a bucket once it has been stored
+            while self.counts:
+                found = self.buckets.get(self.counts[0])
+                if found:
+                    return next(iter(found))
+                heapq.heappop(self.counts)
+            return NOTHING
+        return next((key for key in self.entries if key != keep and key not in self.pinned), NOTHING)
+
+    def evict(self, keep):
+        """
+        Evict values until the cache is within its limits.
+
+        The value just stored under keep is only evicted if it is too large to be cached at all, so that a new value is
+        never evicted for not having been used yet.  Pinned values are never evicted, even if that leaves the cache over
+        its limits.
+        """
+        if self.policy.max_bytes is not None and self.sizes[keep] > self.policy.max_bytes and keep not in self.pinned:
+            self.discard(keep)
+            self.evictions += 1
+        while self.over_limit():
+            key = self.victim(keep)
+            if key is NOTHING:
+                return
+            self.discard(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Report how well this cache is doing.
+
+        :return: a dict of the hits, misses and evictions so far and the current number of entries and estimated bytes
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self.entries), "bytes": self.size}
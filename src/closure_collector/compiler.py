@@ -0,0 +1,335 @@
+"""
+Compiling the rules behind chosen keys of a flock into one generated function.
+
+Reading a derived key goes through __getitem__ at every hop: the read is recorded, the cache checked and any error
+wrapped, and index_reference() hops run glom as well.  compile() instead traces the keys asked for through every rule
+they read, then generates straight-line Python calling each of those rules in dependency order.  Values are kept in
+locals, and in plain dicts that the rules, rebound from their flocks, read in place of the flocks.  index_reference()
+hops become plain subscripts.  Data, and anything that is not a rule of a FlockDict, such as an aggregator, is still
+read through its flock, so writes to data are seen by the next call.
+
+The generated function depends only on the shape of what was traced, not on the rules or keys themselves, so it is
+cached by that shape and shared by every flock built by the same ruleset, such as every character of a model.
+
+Compiled rules are not tracked: they record no reads, and the values they compute are not cached, but a value the flock
+has cached, and that is still current, is used rather than calling its rule again.  When a rule or nested flock on the
+traced path is replaced, or a flock gains or loses keys it was checked for, the keys are traced again on the next call.
+A rule reading a key that was not traced, such as one on the other side of an ``if``, reads it through the flock, as it
+does the keys of a flock and anything else about it but the values traced, see Env.  An error raised by a rule is raised
+again by reading the keys through the flock, so that it is raised exactly as the flock would, or as it is if the flock
+raises nothing.  Calls made while a promise is being evaluated read the flock too, so that what they read is recorded.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache
+
+from closure_collector.aio import is_async
+from closure_collector.closures import index_reference
+from closure_collector.dependencies import KEYS, current_evaluation, evaluate
+from closure_collector.util import Constant, rebound
+
+LIVE = "live"
+RULE = "rule"
+REFERENCE = "reference"
+INDEX_REFERENCE = index_reference(None).__code__
+
+
+class _Stale:
+    """Sentinel returned by a generated function that finds the rules it was compiled from have changed."""
+
+    def __repr__(self):
+        return "STALE"
+
+
+STALE = _Stale()
+
+
+class Env(dict):
+    """
+    The values of a flock's traced keys, which its rules, once rebound, read in place of the flock.
+
+    Anything else is read through the flock: the values of keys that were not traced, its keys, which are always those
+    of the flock in order, and its attributes.  The generated function resets every env before computing anything, so
+    a rule reading a traced key that, on the path it took when traced, it did not read, reads it through the flock too
+    rather than the value left from the last call.
+    """
+
+    __slots__ = ("collector", "links")
+
+    def __init__(self, collector):
+        super().__init__()
+        self.collector = collector
+        self.links: dict = {}
+
+    def reset(self):
+        """Drop the values of the last call, keeping the envs of nested flocks."""
+        self.clear()
+        self.update(self.links)
+
+    def __missing__(self, key):
+        return self.collector[key]
+
+    def __getattr__(self, name):
+        return getattr(self.collector, name)
+
+    def __iter__(self):
+        return iter(self.collector)
+
+    def __len__(self):
+        return len(self.collector)
+
+    def __contains__(self, key):
+        return key in self.collector
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return self.collector.keys()
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+
+def is_traceable(collector) -> bool:
+    """Check whether collector holds its promises in a dict and is read by key, as a FlockDict is, so it can be traced."""
+    return isinstance(collector, Mapping) and isinstance(getattr(collector, "promises", None), dict) and hasattr(collector, "sheared_items")
+
+
+class Tracer:
+    """
+    Collects the rules and data that some keys depend on, in the order they must be computed.
+
+    Each flock traced gets an env, the dict its rules read once rebound.  Each (env, key) node is either LIVE, read
+    through the flock, a RULE called with its flock replaced by envs, or a REFERENCE, an index_reference() hop.
+    """
+
+    def __init__(self):
+        self.envs: dict = {}
+        self.collectors: list = []
+        self.env_dicts: list = []
+        self.links: list = []
+        self.keys_read: set = set()
+        self.nodes: dict = {}
+        self.visiting: set = set()
+        self.visited: set = set()
+
+    def env(self, collector) -> int:
+        """The index of the env of collector, adding one for it if needed."""
+        if id(collector) not in self.envs:
+            self.envs[id(collector)] = len(self.collectors)
+            self.collectors.append(collector)
+            self.env_dicts.append(Env(collector))
+        return self.envs[id(collector)]
+
+    def target(self, collector, key):
+        """
+        Trace a key asked for.
+
+        :return: its layout, the node computing it, or a dict of the layouts of every key of the nested flock it holds
+        """
+        promise = collector.promises[key]
+        self.visit(collector, key)
+        if is_traceable(promise):
+            self.iterate(promise)
+            return OrderedDict((child, self.target(promise, child)) for child in promise.shear_keys())
+        return self.nodes[self.env(collector), key]
+
+    def iterate(self, collector):
+        """Note that the keys of collector were read, so that they are traced again once collector gains or loses keys."""
+        self.keys_read.add(self.env(collector))
+
+    def visit(self, collector, key):
+        """Trace key of collector and everything it reads, before adding a node for it."""
+        index = self.env(collector)
+        if (index, key) in self.visited:
+            return
+        if (index, key) in self.visiting:
+            raise RecursionError(f"{key!r} depends on itself")
+        self.visiting.add((index, key))
+        self.trace_key(index, collector, key)
+        self.visiting.remove((index, key))
+        self.visited.add((index, key))
+
+    def trace_key(self, index, collector, key):
+        """Trace what the promise of key reads, then add its node, or the link to the nested flock it holds."""
+        if key not in collector.promises:
+            self.keys_read.add(index)  # traced again once the key is added
+            return
+        promise = collector.promises[key]
+        if is_traceable(promise):
+            self.links.append((index, key, promise))
+            self.env_dicts[index][key] = self.env_dicts[index].links[key] = self.env_dicts[self.env(promise)]
+            return
+        if type(promise) is Constant or not callable(promise) or hasattr(promise, "promises") or is_async(promise):
+            self.add(index, key, LIVE, None)
+            return
+        _, evaluation = evaluate(collector, key, promise)
+        for reader, read in evaluation.inputs:
+            if is_traceable(reader):
+                if read is KEYS:
+                    self.iterate(reader)
+                else:
+                    self.visit(reader, read)
+        self.add(index, key, RULE, promise)
+
+    def add(self, index, key, kind, promise):
+        """Add the node for key of the env at index, after everything it reads."""
+        self.nodes[index, key] = [len(self.nodes), kind, promise]
+
+
+class CompiledRules:
+    """
+    The rules behind some keys of a flock, compiled into one function.
+
+    Calling it gives a dict mapping each key asked for to its value, a key naming a nested flock giving an OrderedDict of
+    everything in it, as shearing it would.
+
+    :param flock: the flock to compile
+    :param keys: the keys to compute, each a key of flock or a tuple of keys leading into flocks nested in it
+    """
+
+    def __init__(self, flock, keys):
+        self.flock = flock
+        self.keys = list(keys)
+        self.lock = threading.Lock()
+        self.trace()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.keys!r})"
+
+    def __call__(self) -> dict:
+        if current_evaluation() is not None:
+            return self.read()
+        with self.lock:
+            try:
+                values = self.run()
+            except Exception:
+                self.read()  # raising the error just as the flock would
+                raise
+        return {key: assemble(layout, values) for key, layout in zip(self.keys, self.layouts, strict=True)}
+
+    def run(self) -> tuple:
+        """Call the generated function, tracing again first if it finds the rules have changed."""
+        values = self.function(*self.arguments)
+        if values is STALE:
+            self.trace()
+            values = self.function(*self.arguments)
+        return values
+
+    def read(self) -> dict:
+        """Read every key through the flock, as if it had not been compiled."""
+        ret = {}
+        for key in self.keys:
+            value = self.flock
+            for step in key if type(key) is tuple else (key,):
+                value = value[step]
+            ret[key] = value.shear() if is_traceable(value) else value
+        return ret
+
+    def trace(self):
+        """Trace the keys, then rebind their rules and find the function computing them."""
+        self.read()  # raising any errors just as the flock would
+        tracer = Tracer()
+        self.layouts = []
+        for key in self.keys:
+            collector = self.flock
+            path = key if type(key) is tuple else (key,)
+            for step in path[:-1]:
+                tracer.visit(collector, step)
+                collector = collector.promises[step]
+                if not is_traceable(collector):
+                    raise TypeError(f"{key!r} leads into a {type(collector).__name__}, only keys of nested FlockDicts can be compiled")
+            self.layouts.append(tracer.target(collector, path[-1]))
+        substitutes = {id(collector): env for collector, env in zip(tracer.collectors, tracer.env_dicts, strict=True)}
+        rules = []
+        references = []
+        for node in tracer.nodes.values():
+            position, kind, promise = node
+            if kind == RULE and getattr(promise, "__code__", None) is INDEX_REFERENCE:
+                reference = dict(zip(INDEX_REFERENCE.co_freevars, (cell.cell_contents for cell in promise.__closure__), strict=True))
+                if not reference["kwargs"] and id(reference["flock"]) in substitutes:
+                    node[1] = REFERENCE
+                    node[2] = (tracer.envs[id(reference["flock"])], len(references))
+                    references.append(reference["indexes"])
+                    continue
+            if kind == RULE:
+                try:
+                    node[2] = len(rules)
+                    rules.append(rebound(promise, substitutes))
+                except TypeError:
+                    node[1] = LIVE
+        keys = [key for (_, key) in tracer.nodes]
+        guards = [(index, key, promise) for index, key, promise in tracer.links]
+        guards += [(index, key, tracer.collectors[index].promises[key]) for (index, key), (_, kind, _) in tracer.nodes.items() if kind != LIVE]
+        shape = (
+            len(tracer.collectors),
+            tuple(sorted(tracer.keys_read)),
+            tuple(index for index, _, _ in guards),
+            tuple((index, node[1], node[2]) for (index, _), node in tracer.nodes.items()),
+            tuple(len(indexes) for indexes in references),
+        )
+        self.function = generate(shape)
+        self.arguments = (
+            tuple(tracer.collectors),
+            tuple(tracer.env_dicts),
+            tuple(rules),
+            tuple(keys) + tuple(key for _, key, _ in guards) + tuple(step for indexes in references for step in indexes),
+            tuple(promise for _, _, promise in guards),
+            tuple(tracer.collectors[index].versions.get(KEYS) for index in sorted(tracer.keys_read)),
+        )
+
+
+def assemble(layout, values):
+    """Build the value of a key asked for from its layout and the values computed."""
+    if isinstance(layout, dict):
+        return OrderedDict((key, assemble(child, values)) for key, child in layout.items())
+    return values[layout[0]]
+
+
+@lru_cache(maxsize=256)
+def generate(shape):
+    """
+    Generate the function computing the nodes of a shape, as Python source compiled with exec().
+
+    The function takes the collectors, their envs, the rebound rules, the keys, the guarded promises and the versions of
+    the key sets read, and returns the values of every node in a tuple, or STALE if a guard fails.  It resets the envs
+    first, then calls the rules in order, except those whose values their collector has cached and are current.  The
+    functions are cached by shape, so that every flock built by the same ruleset shares one.
+    """
+    env_count, keys_read, guarded, nodes, references = shape
+    node_count = len(nodes)
+    guard_count = len(guarded)
+    lines = ["def compiled(F, E, R, K, G, V):"]
+    for name, count in (("f", env_count), ("e", env_count), ("r", sum(kind == RULE for _, kind, _ in nodes)), ("g", guard_count), ("v", len(keys_read))):
+        if count:
+            lines.append(f"    {', '.join(f'{name}{i}' for i in range(count))}, = {name.upper()}")
+    key_count = node_count + guard_count + sum(references)
+    if key_count:
+        lines.append(f"    {', '.join(f'k{i}' for i in range(key_count))}, = K")
+    checks = [f"f{index}.promises.get(k{node_count + i}) is not g{i}" for i, index in enumerate(guarded)]
+    checks += [f"f{index}.versions.get(KEYS) != v{i}" for i, index in enumerate(keys_read)]
+    if checks:
+        lines.append(f"    if {' or '.join(checks)}:")
+        lines.append("        return STALE")
+    lines.extend(f"    e{index}.reset()" for index in range(env_count))
+    offset = node_count + guard_count
+    for position, (index, kind, extra) in enumerate(nodes):
+        if kind == LIVE:
+            lines.append(f"    x{position} = e{index}[k{position}] = f{index}[k{position}]")
+        elif kind == RULE:
+            lines.append(f"    x{position} = e{index}[k{position}] = f{index}.cache[k{position}] if f{index}.is_cached(k{position}) else r{extra}()")
+        else:
+            base, reference = extra
+            start = offset + sum(references[:reference])
+            steps = "".join(f"[k{start + step}]" for step in range(references[reference]))
+            lines.append(f"    x{position} = e{index}[k{position}] = e{base}{steps}")
+    lines.append(f"    return ({''.join(f'x{position}, ' for position in range(node_count))})")
+    namespace = {"STALE": STALE, "KEYS": KEYS}
+    exec("\n".join(lines), namespace)
+    return namespace["compiled"]
@@ -1,11 +1,13 @@
-import inspect
 from abc import ABCMeta, abstractmethod
 from collections.abc import Iterable, Mapping
+from copy import copy
 from pprint import pformat
 
-from closure_collector.util import ClosureCollectorException, is_rule, rebind
+from closure_collector import dependencies
+from closure_collector.dependencies import KEYS, Versions, aevaluate, evaluate, key_lock, last_write, new_version, record_read, single_task
+from closure_collector.util import ClosureCollectorException, Constant, is_rule, rebind, takes_no_arguments
 
-CLOSURE_ATTRS = {"root", "cache", "peers", "promises"}
+CLOSURE_ATTRS = {"root", "cache", "peers", "promises", "dependents", "versions", "stamps", "lazy", "cache_policy", "in_fork"}
 
 
 class ShearedBase:
@@ -65,14 +67,219 @@ class CCBase(metaclass=ABCMeta):
 
 
 class DynamicClosureCollector(CCBase):
-    """Base class for closure collector objects that change over time."""
+    """
+    Base class for closure collector objects that change over time.
 
-    def __init__(self, root=None):
-        """ """
+    By default a write drops the cached values computed from the written key straight away.  A lazy collector only
+    changes the version of the written key, and checks the versions read by a cached value when that value is read.
+    Writes to a lazy collector are not pushed to anything, so collectors that read from a lazy collector should also be
+    lazy.
+
+    Computed values are cached without limit unless a CachePolicy is given, see closure_collector.cache.
+    """
+
+    # The Fork this collector is a view in, if it is one, see closure_collector.fork
+    in_fork = None
+
+    def __init__(self, root=None, lazy=False, cache_policy=None):
+        """
+        :param root: the collector this one is nested in, if any
+        :param lazy: if True validate cached values when they are read rather than invalidating them on write
+        :param cache_policy: limits on the number and size of the values cached, None to cache everything
+        """
         super().__init__()
-        self.cache = {}
+        self.cache_policy = cache_policy
+        self.cache = {} if cache_policy is None else cache_policy.new_cache()
         self.root = root
         self.peers = set()
+        self.dependents = {}
+        self.versions = Versions()
+        self.stamps = {}
+        self.lazy = lazy
+
+    def compute(self, key, promise):
+        """
+        Evaluate promise as the value of key, recording what it reads, and cache the result.
+
+        While other threads may be computing values the promise is only called if no other thread has cached key first.
+
+        :return: the value returned by the promise
+        """
+        if self.in_fork is not None:
+            return self.in_fork.compute(self, key, promise)
+        lock = key_lock(self, key)
+        if lock is None:
+            return self.store(key, *self.evaluate(key, promise))
+        with lock:
+            if self.is_cached(key):
+                return self.cache[key]
+            return self.store(key, *self.evaluate(key, promise))
+
+    def evaluate(self, key, promise):
+        """
+        Call promise as the value of key, recording what it reads, see dependencies.evaluate().
+
+        With a CachePolicy that has a PersistentCache, a value stored by an earlier evaluation of the same promise is
+        used instead if everything it read still has the same value, see closure_collector.persistent.
+
+        :return: a tuple of the value and the Evaluation that recorded its reads
+        """
+        persistent = getattr(self.cache_policy, "persistent", None)
+        if persistent is None:
+            return evaluate(self, key, promise)
+        return persistent.evaluate(self, key, promise)
+
+    async def acompute(self, key, promise):
+        """
+        Evaluate promise as the value of key as compute() does, awaiting its result if it is awaitable.
+
+        Tasks asking for the same key at the same time share a single evaluation.
+
+        :raises TypeError: if this collector is a view in a fork, as forks are computed synchronously
+        :return: the value of the promise
+        """
+        if self.in_fork is not None:
+            raise TypeError(f"{key!r} is computed by a coroutine function, which cannot be awaited in a fork")
+        return await single_task((self, key), lambda: self._acompute(key, promise))
+
+    async def _acompute(self, key, promise):
+        if self.is_cached(key):
+            return self.cache[key]
+        return self.store(key, *await aevaluate(self, key, promise))
+
+    def store(self, key, ret, evaluation):
+        """
+        Cache ret as the value of key, along with what the Evaluation that computed it read if this collector is lazy.
+
+        With a CachePolicy the cache decides from the time the evaluation took whether ret is cached at all.  Nothing is
+        cached if the evaluation was volatile, see dependencies.record_volatile().
+
+        :return: ret
+        """
+        if evaluation.volatile:
+            return ret
+        if self.cache_policy is None:
+            self.cache[key] = ret
+        else:
+            self.cache.put(key, ret, evaluation.elapsed())
+        if self.lazy:
+            inputs = tuple((collector, input_key, collector.versions.get(input_key)) for collector, input_key in evaluation.inputs)
+            self.stamps[key] = [evaluation.started, inputs]
+        return ret
+
+    def is_cached(self, key) -> bool:
+        """Check whether key has a cached value that is still valid, dropping the cached value if it is not."""
+        if key not in self.cache:
+            if dependencies.recorder is not None:
+                dependencies.recorder.missed(self, key)
+            return False
+        if self.is_current(key):
+            if dependencies.recorder is not None:
+                dependencies.recorder.hit(self, key)
+            return True
+        self.forget(key)
+        if dependencies.recorder is not None:
+            dependencies.recorder.missed(self, key)
+        return False
+
+    def is_current(self, key) -> bool:
+        """
+        Check that nothing read by the last value computed for key has changed since it was computed.
+
+        Only lazy collectors need the check, as other collectors drop values as soon as anything they read changes.  The
+        check is skipped when nothing at all has been written since the value was last checked.
+        """
+        if not self.lazy or key not in self.stamps:
+            return True
+        stamp = self.stamps[key]
+        if stamp[0] == last_write():
+            return True
+        for collector, input_key, version in stamp[1]:
+            if collector.refresh(input_key) != version:
+                return False
+        stamp[0] = last_write()
+        return True
+
+    def refresh(self, key) -> int:
+        """
+        Drop the cached value for key if it is out of date.
+
+        Keys whose values were evicted, or never cached, are checked too, so that whatever read them sees the change.
+
+        :return: the current version of key
+        """
+        if not self.is_current(key):
+            self.forget(key)
+        return self.versions.get(key)
+
+    def forget(self, key) -> Iterable:
+        """
+        Drop the cached value for key, giving it a new version.
+
+        :return: the (collector, key) pairs whose values were computed from key
+        """
+        if dependencies.recorder is not None and key in self.cache:
+            dependencies.recorder.invalidated(self, key)
+        self.cache.pop(key, None)
+        self.stamps.pop(key, None)
+        self.versions[key] = new_version()
+        if self.in_fork is not None:
+            return self.in_fork.forgotten(self, key)
+        return self.dependents.pop(key, ())
+
+    def prune_versions(self, live):
+        """
+        Drop the versions of keys deleted from this collector once they outnumber the keys it still has.
+
+        :param live: the keys this collector still has
+        """
+        if self.in_fork is None and len(self.versions) > 2 * len(live) + 8:
+            self.versions.prune([key for key in self.versions if key is not KEYS and key not in live])
+
+    def fork_view(self, fork):
+        """
+        Make the view of this collector in fork, see closure_collector.fork.
+
+        The view is a lazy shallow copy with caches of its own, reading its promises from this collector's until they are
+        overridden.
+        """
+        view = copy(self)
+        view.in_fork = fork
+        view.cache_policy = None
+        view.cache = {}
+        view.peers = set()
+        view.dependents = {}
+        view.stamps = {}
+        view.versions = fork.versions(self)
+        view.lazy = True
+        view.root = None if self.root is None else fork.view(self.root)
+        promises = getattr(self, "promises", None)
+        if promises is not None:
+            view.promises = fork.promises(promises)
+        return view
+
+    def invalidate(self, *keys):
+        """
+        Drop the cached value of each key and of every value computed from it, directly or indirectly.
+
+        Lazy collectors are never given dependents, so for them this only changes the versions of the keys.
+
+        Use KEYS as a key when keys have been added or removed, to reach anything that iterated over this collector.
+        """
+        dependencies.invalidate([(self, key) for key in keys])
+
+    def invalidate_all(self):
+        """Drop every cached value in this collector and everything computed from them, e.g. after keys shift."""
+        self.invalidate(KEYS, *set(self.cache).union(self.dependents))
+
+    def batch(self):
+        """
+        Open a batch of writes: invalidation is queued and carried out in one pass when the block exits.
+
+        Reading any value inside the block first processes the queue, so reads never see stale values.  The batch
+        covers every collector written in the current context, not only this one.
+        """
+        return dependencies.batch()
 
     def clear_cache(self):
         if self.root is not None:
@@ -88,7 +295,9 @@ class DynamicClosureCollector(CCBase):
                 to_collect.update(curr.get_relatives())
 
         for peer in to_clear:
-            if hasattr(peer, "cache"):
+            if isinstance(peer, DynamicClosureCollector):
+                peer.invalidate_all()
+            elif hasattr(peer, "cache"):
                 peer.cache = {}
 
     def get_relatives(self) -> Iterable:
@@ -98,10 +307,10 @@ class DynamicClosureCollector(CCBase):
 class ClosurePromiseCollector(DynamicClosureCollector):
     """A convenience class for default implementations of methods from Dynamic Closure Collector"""
 
-    def __init__(self, root=None):
+    def __init__(self, root=None, lazy=False, cache_policy=None):
         """ """
         self.promises = {}
-        super().__init__(root=root)
+        super().__init__(root=root, lazy=lazy, cache_policy=cache_policy)
 
     def __setattr__(self, item, val):
         """
@@ -115,8 +324,12 @@ class ClosurePromiseCollector(DynamicClosureCollector):
         if item in CLOSURE_ATTRS:
             return super().__setattr__(item, val)
         value = self.make_callable(val)
+        is_new = item not in self.promises
         self.promises[item] = value
-        self.clear_cache()
+        if is_new:
+            self.invalidate(item, KEYS)
+        else:
+            self.invalidate(item)
 
     def __getattr__(self, item):
         """
@@ -125,44 +338,46 @@ class ClosurePromiseCollector(DynamicClosureCollector):
         :type item: any hashable type
         :return: the value of the lamba when executed
         """
-        if item.startswith("_") or item in {"root", "cache", "peers", "promises"}:
+        if item.startswith("_") or item in CLOSURE_ATTRS:
             return super().__getattribute__(item)
-        if item in self.cache:
+        record_read(self, item)
+        if self.is_cached(item):
             return self.cache[item]
         else:
             if item in self.promises:
                 promise = self.promises[item]
             else:  # If the promise is not there, fallback ultimately to an error.
                 return super().__getattribute__(item)
+            if type(promise) is Constant:
+                return promise.value
 
             try:
-                ret = promise()
+                return self.compute(item, promise)
             except Exception as e:
                 raise ClosureCollectorException(f"Error calculating attribute:{item}") from e
-            self.cache[item] = ret
-            return ret
 
     def __delattr__(self, item):
         del self.promises[item]
-        self.clear_cache()
+        self.invalidate(item, KEYS)
+        self.prune_versions(self.promises)
 
     def __bool__(self):
         return bool(self.promises)
 
     def make_callable(self, value):
-        if callable(value) and len(inspect.signature(value).parameters) == 0:
+        if takes_no_arguments(value):
             ret = value
             if isinstance(value, DynamicClosureCollector):
                 value.peers.add(self)
                 if value.root is None:
                     value.root = self
             # if it's a closure and there is something in there
-            if hasattr(value, "__closure__") and value.__closure__:
+            if getattr(value, "__closure__", None):
                 for closure in value.__closure__:
                     if isinstance(closure.cell_contents, DynamicClosureCollector):
                         closure.cell_contents.peers.add(self)
         else:
-            ret = lambda: value
+            ret = Constant(value)
         return ret
 
 
@@ -171,20 +386,23 @@ class ClosureCollector(ClosurePromiseCollector):
     A Closure Collector  intended for use.
     """
 
-    def __init__(self, *, root=None, **indict):
+    def __init__(self, *, root=None, lazy=False, cache_policy=None, **indict):
         """
         A mutable mapping that contains lambdas which will be evaluated when indexed
 
         :type indict: Keyword arguments to add as attributes
+        :type lazy: if True validate cached values when they are read rather than invalidating them on write
+        :type cache_policy: a CachePolicy limiting the values cached, None to cache everything
 
         Values from indict are assigned to self one at a time.
 
         """
-        super().__init__()
+        super().__init__(lazy=lazy, cache_policy=cache_policy)
         for key, value in indict.items():
             setattr(self, key, value)
 
     def __dir__(self):
+        record_read(self, KEYS)
         return set(self.promises.keys()).union(self.cache.keys())
 
     def get_relatives(self):
@@ -233,8 +451,6 @@ class ClosureCollector(ClosurePromiseCollector):
             promise = self.promises[key]
             if hasattr(promise, "shear"):
                 setattr(ret, key, promise.shear(record_errors=record_errors))
-            elif key in self.cache:
-                setattr(ret, key, self.cache[key])
             else:
                 try:
                     setattr(ret, key, getattr(self, key))
@@ -245,6 +461,35 @@ class ClosureCollector(ClosurePromiseCollector):
                         raise
         return ret
 
+    def iter_shear(self, record_errors=False, path=()):
+        """
+        Walk this ClosureCollector in the order of shear(), yielding each leaf as it is read rather than building a ShearedBase.
+
+        Nested collectors and flocks are walked in turn, one with no attributes is a leaf holding its empty sheared form.
+
+        :param record_errors: as for shear()
+        :param path: the attribute names leading to this collector, prepended to every path yielded
+        :return: a generator of (path, value) pairs, path being a tuple of the attribute names leading to the value
+        """
+        keys = sorted(dir(self), key=lambda x: (str(x), repr(x)))
+        if not keys:
+            yield path, ShearedBase()
+            return
+        for key in keys:
+            promise = self.promises[key]
+            if hasattr(promise, "iter_shear"):
+                yield from promise.iter_shear(record_errors, path + (key,))
+            elif hasattr(promise, "shear"):
+                yield path + (key,), promise.shear(record_errors=record_errors)
+            else:
+                try:
+                    value = getattr(self, key)
+                except ClosureCollectorException as e:
+                    if not record_errors:
+                        raise
+                    value = e
+                yield path + (key,), value
+
     def dataset(self):
         ret = ShearedBase()
         for k, v in self.promises.items():
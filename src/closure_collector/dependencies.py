@@ -0,0 +1,351 @@
+"""
+Tracking of the reads made while a promise is evaluated.
+
+Every collector records, for each of its keys, the set of ``(collector, key)`` pairs whose promises read that key while
+they were being evaluated.  Writing a key then only has to drop the cached values reachable through that reverse graph
+rather than every cache in the model.
+
+Edges are consumed when they are followed: invalidating a key pops its dependents, and they are recorded again the
+next time the dependents are evaluated.  A promise that reads anything whose changes are not tracked this way is
+volatile, and neither its value nor any value computed from it is cached.
+
+Every key also carries a version, drawn from a single process wide counter, which changes whenever its value is written
+or dropped.  Lazy collectors use these versions instead of the reverse graph: they remember the versions of everything
+a cached value read, and compare them when the value is next read.  The versions of deleted keys are pruned once they
+outnumber the keys a collector still has, see Versions.
+
+While a batch is open, invalidation is queued rather than carried out, and the queue is processed in one pass before
+the next read or when the batch closes.
+
+While values are being computed on several threads at once, each key is computed under its own lock so that a promise
+shared by two threads is only called once, just as it would be when computed serially.  Coroutine promises awaited by
+several tasks at once are likewise only called once.
+"""
+
+import asyncio
+import inspect
+import threading
+import weakref
+from collections.abc import Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from time import perf_counter
+
+
+class _KeySet:
+    """Sentinel key standing for the set of keys in a collector, read by iteration, len() and dir()."""
+
+    def __repr__(self):
+        return "KEYS"
+
+    def __reduce__(self):
+        return "KEYS"
+
+
+KEYS = _KeySet()
+
+_evaluating: ContextVar = ContextVar("evaluating", default=None)
+_batch: ContextVar = ContextVar("batch", default=None)
+_versions = count(1)
+_last_write = 0
+_threads_active = 0
+_locks: dict = {}
+_locks_guard = threading.Lock()
+_running: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# The Metrics recording, if any, see closure_collector.metrics
+recorder = None
+
+
+class Evaluation:
+    """
+    The evaluation of one promise, collecting the (collector, key) pairs it reads in the order they are first read.
+
+    started is the version of the last write before the evaluation began and start_time the perf_counter() reading.
+    nested is the time spent in the evaluations of what it read, and finished the seconds it took once it has finished.
+    volatile is True if it read anything whose changes are not tracked, see record_volatile().
+    """
+
+    __slots__ = ("collector", "key", "node", "inputs", "started", "start_time", "nested", "finished", "volatile")
+
+    def __init__(self, collector, key):
+        self.collector = collector
+        self.key = key
+        self.node = (collector, key)
+        self.inputs = {}
+        self.started = _last_write
+        self.start_time = perf_counter()
+        self.nested = 0.0
+        self.finished: float | None = None
+        self.volatile = False
+
+    def elapsed(self) -> float:
+        """The seconds the evaluation took, or has taken so far, excluding the evaluations of what it read."""
+        return max(self.total() - self.nested, 0.0)
+
+    def total(self) -> float:
+        """The seconds the evaluation took, or has taken so far, including the evaluations of what it read."""
+        return perf_counter() - self.start_time if self.finished is None else self.finished
+
+    def finish(self):
+        """
+        Note that the evaluation has finished, adding its time to the nested time of the evaluation that read it, which
+        is volatile in turn if this evaluation was.
+        """
+        self.finished = perf_counter() - self.start_time
+        reader = _evaluating.get()
+        if reader is not None:
+            reader.nested += self.finished
+            reader.volatile = reader.volatile or self.volatile
+
+
+def current_evaluation():
+    """
+    Find the promise currently being evaluated in this context.
+
+    :return: an Evaluation, or None when no promise is being evaluated
+    """
+    return _evaluating.get()
+
+
+def record_read(collector, key):
+    """
+    Note that the promise currently being evaluated, if any, read key from collector.
+
+    Lazy collectors are not given reverse edges, as their writes are never pushed to readers.
+
+    :param collector: the DynamicClosureCollector being read
+    :param key: the key or attribute read, or KEYS if the set of keys was read
+    """
+    open_batch = _batch.get()
+    if open_batch is not None and open_batch.pending:
+        open_batch.flush()
+    reader = _evaluating.get()
+    if reader is not None:
+        reader.inputs[collector, key] = None
+        if not collector.lazy:
+            collector.dependents.setdefault(key, set()).add(reader.node)
+
+
+def record_volatile():
+    """
+    Note that the promise currently being evaluated, if any, read something whose changes are not tracked, such as an
+    aggregator over plain lists, so that neither its value nor any value computed from it may be cached.
+    """
+    reader = _evaluating.get()
+    if reader is not None:
+        reader.volatile = True
+
+
+def evaluate(collector, key, promise):
+    """
+    Call promise as the value of key in collector, so that everything it reads is recorded as a dependency of key.
+
+    :raises TypeError: if promise returned a coroutine, which can only be awaited, see aevaluate()
+    :return: a tuple of the value returned by the promise and the Evaluation that recorded its reads
+    """
+    evaluation = Evaluation(collector, key)
+    token = _evaluating.set(evaluation)
+    try:
+        ret = promise()
+        if inspect.iscoroutine(ret):
+            ret.close()
+            raise coroutine_error(key, promise)
+        return ret, evaluation
+    finally:
+        _evaluating.reset(token)
+        evaluation.finish()
+        if recorder is not None:
+            recorder.evaluated(evaluation)
+
+
+async def aevaluate(collector, key, promise):
+    """
+    Call promise as the value of key in collector, awaiting the result if it is awaitable, recording what it reads.
+
+    :raises TypeError: if promise returned a coroutine without being a coroutine function itself
+    :return: a tuple of the value and the Evaluation that recorded its reads
+    """
+    evaluation = Evaluation(collector, key)
+    token = _evaluating.set(evaluation)
+    try:
+        ret = promise()
+        if inspect.iscoroutine(ret) and not inspect.iscoroutinefunction(promise):
+            ret.close()
+            raise coroutine_error(key, promise)
+        if inspect.isawaitable(ret):
+            ret = await ret
+        return ret, evaluation
+    finally:
+        _evaluating.reset(token)
+        evaluation.finish()
+        if recorder is not None:
+            recorder.evaluated(evaluation)
+
+
+def coroutine_error(key, promise) -> TypeError:
+    """The error for the promise of key giving a coroutine where a value is needed, saying how to compute it instead."""
+    if inspect.iscoroutinefunction(promise):
+        return TypeError(f"{key!r} is computed by a coroutine function, read it with aget() or ashear()")
+    return TypeError(f"the promise of {key!r} returned a coroutine; use an async def rule")
+
+
+async def single_task(node, factory):
+    """
+    Await factory() as the computation of node, a (collector, key) pair, joining the task already running for it if any.
+
+    Tasks are only joined within the event loop that started them.
+
+    :return: the result of factory()
+    """
+    running = _running.get(asyncio.get_running_loop())
+    if running is None:
+        running = _running[asyncio.get_running_loop()] = {}
+    task = running.get(node)
+    if task is None:
+        task = running[node] = asyncio.ensure_future(factory())
+        task.add_done_callback(lambda _: running.pop(node, None))
+    return await asyncio.shield(task)
+
+
+def untracked(func, *args):
+    """Call func without attributing anything it reads to the promise currently being evaluated."""
+    token = _evaluating.set(None)
+    try:
+        return func(*args)
+    finally:
+        _evaluating.reset(token)
+
+
+class Versions(dict):
+    """
+    The versions of the keys of a collector, by key.
+
+    Keys without a version of their own share the floor, which starts at 0 and only changes when versions are pruned,
+    so that dropping a key's version never gives it back a version that a reader has already seen.
+    """
+
+    __slots__ = ("floor",)
+
+    def __init__(self):
+        super().__init__()
+        self.floor = 0
+
+    def get(self, key, default=None):
+        """The version of key, or if it has none of its own default, or the floor when no default is given."""
+        return super().get(key, self.floor if default is None else default)
+
+    def prune(self, keys: Iterable):
+        """Drop the versions of keys, giving every key without a version of its own a new one."""
+        for key in keys:
+            self.pop(key, None)
+        self.floor = new_version()
+
+
+def new_version() -> int:
+    """Draw a version number that has not been used before."""
+    return next(_versions)
+
+
+def advance_versions(version: int):
+    """
+    Make sure versions drawn from now on are after version, and that values validated before now are checked again.
+
+    Used when restoring collectors from a snapshot, whose versions were drawn by another process.
+    """
+    global _versions
+    _versions = count(max(next(_versions), version + 1))
+    record_write()
+
+
+def record_write() -> int:
+    """Note that a value has been written somewhere, so lazily validated values must be checked before use."""
+    global _last_write
+    _last_write = next(_versions)
+    return _last_write
+
+
+def last_write() -> int:
+    """The version drawn by the most recent write, values verified since then need no further checks."""
+    return _last_write
+
+
+def invalidate(nodes):
+    """
+    Drop the cached values of the (collector, key) pairs in nodes and of every value computed from them.
+
+    If a batch is open the pairs are queued on it instead.
+    """
+    record_write()
+    open_batch = _batch.get()
+    if open_batch is not None:
+        open_batch.pending.extend(nodes)
+    else:
+        _propagate(list(nodes))
+
+
+def _propagate(pending):
+    """Forget each (collector, key) pair in pending, then everything that was computed from them."""
+    while pending:
+        collector, key = pending.pop()
+        pending.extend(collector.forget(key))
+
+
+class Batch:
+    """Invalidation queued by the writes made while a batch is open."""
+
+    def __init__(self):
+        self.pending = []
+
+    def flush(self):
+        """Carry out all the queued invalidation in a single pass."""
+        pending, self.pending = self.pending, []
+        _propagate(pending)
+
+
+@contextmanager
+def batch():
+    """
+    Defer invalidation until the end of the block, or until something is read.
+
+    Batches apply to every collector written in the current context; a batch opened inside another joins it.
+    """
+    open_batch = _batch.get()
+    if open_batch is not None:
+        yield open_batch
+        return
+    open_batch = Batch()
+    token = _batch.set(open_batch)
+    try:
+        yield open_batch
+    finally:
+        _batch.reset(token)
+        open_batch.flush()
+
+
+@contextmanager
+def single_flight():
+    """Compute each key under its own lock until the block exits, for use while several threads compute values."""
+    global _threads_active
+    with _locks_guard:
+        _threads_active += 1
+    try:
+        yield
+    finally:
+        with _locks_guard:
+            _threads_active -= 1
+            if not _threads_active:
+                _locks.clear()
+
+
+def key_lock(collector, key):
+    """
+    Find the lock guarding the computation of key in collector.
+
+    :return: a lock, or None if values are not currently being computed on several threads
+    """
+    if not _threads_active:
+        return None
+    with _locks_guard:
+        return _locks.setdefault((collector, key), threading.RLock())
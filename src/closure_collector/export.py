@@ -0,0 +1,174 @@
+"""
+Writing the sheared form of a collector to a file as it is evaluated, without building it in memory first.
+
+Each writer walks a flock, aggregator or ClosureCollector with iter_shear(), so only the leaf being written and the
+containers it is nested in are held at once::
+
+    with open("character.yaml", "w") as outfile:
+        write_yaml(flock, outfile)
+
+write_json() and write_yaml() write the same structure as json.dump() and yaml.dump() would for shear(), with every
+flock written as a plain mapping or sequence in the order shear() visits it.  write_jsonl() writes one line per leaf,
+for exports too large to read back as a single document.
+"""
+
+import json
+from collections.abc import Sequence
+
+import yaml
+from yaml.events import DocumentEndEvent, DocumentStartEvent, MappingEndEvent, MappingStartEvent, SequenceEndEvent, SequenceStartEvent
+
+from closure_collector.core import ShearedBase
+
+OPEN, LEAF, CLOSE = "open", "leaf", "close"
+
+
+def walk(collector, record_errors=False):
+    """
+    Rebuild the nesting of the sheared form of collector from the leaves of its iter_shear().
+
+    :param collector: a flock, aggregator or ClosureCollector
+    :param record_errors: as for shear()
+    :return: a generator of (OPEN, key, is_sequence), (LEAF, key, value) and (CLOSE, key, is_sequence) items, in the
+        order they would be written, the outermost container having the key None.  A collector with no keys is a single
+        LEAF holding its empty sheared form.
+    """
+    stack = [collector]
+    opened: tuple = ()
+    started = False
+    for path, value in collector.iter_shear(record_errors):
+        if isinstance(value, ShearedBase):
+            value = vars(value)
+        if not path:
+            yield LEAF, None, value
+            return
+        if not started:
+            yield OPEN, None, isinstance(collector, Sequence)
+            started = True
+        *parents, key = path
+        common = 0
+        while common < min(len(opened), len(parents)) and opened[common] == parents[common]:
+            common += 1
+        while len(opened) > common:
+            yield CLOSE, opened[-1], isinstance(stack.pop(), Sequence)
+            opened = opened[:-1]
+        for step in parents[common:]:
+            stack.append(stack[-1].promises[step])
+            opened += (step,)
+            yield OPEN, step, isinstance(stack[-1], Sequence)
+        yield LEAF, key, value
+    while opened:
+        yield CLOSE, opened[-1], isinstance(stack.pop(), Sequence)
+        opened = opened[:-1]
+    yield CLOSE, None, isinstance(collector, Sequence)
+
+
+def write_jsonl(collector, stream, record_errors=False, default=None):
+    """
+    Write each leaf of the sheared form of collector to stream as a line of JSON, {"path": [keys...], "value": value}.
+
+    :param record_errors: as for shear(), errors recorded are only written if default can convert them, str for example
+    :param default: as for json.dump(), called for values that cannot otherwise be serialized
+    """
+    for path, value in collector.iter_shear(record_errors):
+        if isinstance(value, ShearedBase):
+            value = vars(value)
+        stream.write(json.dumps({"path": list(path), "value": value}, default=default))
+        stream.write("\n")
+
+
+def write_json(collector, stream, record_errors=False, indent=None, default=None):
+    """
+    Write the sheared form of collector to stream as a JSON document, as json.dump(collector.shear(), stream) would.
+
+    :param record_errors: as for shear(), errors recorded are only written if default can convert them, str for example
+    :param indent: as for json.dump(), the indent of each level as a number of spaces or a string, None for one line
+    :param default: as for json.dump(), called for values that cannot otherwise be serialized
+    """
+    encoder = json.JSONEncoder(indent=indent, default=default)
+    if isinstance(indent, int):
+        indent = " " * indent
+    separator = "," if indent is not None else ", "
+    containers: list = []
+    for kind, key, value in walk(collector, record_errors):
+        if kind == CLOSE:
+            count, _ = containers.pop()
+            if count and indent is not None:
+                stream.write("\n" + indent * len(containers))
+            stream.write("]" if value else "}")
+            continue
+        if containers:
+            count, is_sequence = containers[-1]
+            if count:
+                stream.write(separator)
+            containers[-1][0] += 1
+            if indent is not None:
+                stream.write("\n" + indent * len(containers))
+            if not is_sequence:
+                stream.write(encoder.encode(json_key(key)) + ": ")
+        if kind == OPEN:
+            stream.write("[" if value else "{")
+            containers.append([0, value])
+        else:
+            encoded = encoder.encode(value)
+            stream.write(encoded if indent is None else encoded.replace("\n", "\n" + indent * len(containers)))
+
+
+def json_key(key) -> str:
+    """Convert key to a string as json.dump() does for the keys of a dict."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, int | float):
+        return json.dumps(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def write_yaml(collector, stream, record_errors=False, Dumper=None, **options):
+    """
+    Write the sheared form of collector to stream as a YAML document, with the structure yaml.dump(collector.shear())
+    would write, each flock as a plain mapping or sequence in the order of shear().
+
+    Values are represented one leaf at a time, so a value appearing in several leaves is written in full each time
+    rather than as an alias.
+
+    :param record_errors: as for shear()
+    :param Dumper: the yaml Dumper to write with, by default the C accelerated CDumper when PyYAML was built with
+        libyaml, otherwise Dumper
+    :param options: further options for the Dumper, as for yaml.dump(), block style unless default_flow_style is given
+    """
+    if Dumper is None:
+        Dumper = getattr(yaml, "CDumper", yaml.Dumper)
+    options.setdefault("default_flow_style", False)
+    dumper = Dumper(stream, **options)
+    dumper.last_anchor_id = 0
+    tags = {True: ("tag:yaml.org,2002:seq", SequenceStartEvent, SequenceEndEvent), False: ("tag:yaml.org,2002:map", MappingStartEvent, MappingEndEvent)}
+    dumper.open()
+    dumper.emit(DocumentStartEvent(explicit=options.get("explicit_start"), version=options.get("version"), tags=options.get("tags")))
+    containers: list = []
+    for kind, key, value in walk(collector, record_errors):
+        if kind == CLOSE:
+            containers.pop()
+            dumper.emit(tags[value][2]())
+            continue
+        if containers and not containers[-1]:
+            emit_node(dumper, key)
+        if kind == OPEN:
+            tag, start, _ = tags[value]
+            dumper.emit(start(None, tag, True, flow_style=dumper.default_flow_style))
+            containers.append(value)
+        else:
+            emit_node(dumper, value)
+    dumper.emit(DocumentEndEvent(explicit=options.get("explicit_end")))
+    dumper.close()
+
+
+def emit_node(dumper, data):
+    """Represent data and emit the events for it with dumper, with anchors and aliases only within data itself."""
+    node = dumper.represent_data(data)
+    dumper.anchors = {}
+    dumper.serialized_nodes = {}
+    dumper.anchor_node(node)
+    dumper.serialize_node(node, None, None)
+    dumper.represented_objects = {}
+    dumper.object_keeper = []
+    dumper.alias_key = None
@@ -0,0 +1,256 @@
+"""
+Copy-on-write forks of collector trees, for asking what if some of a model's inputs were different without copying it.
+
+A fork is made of views of the collectors of the tree it was made from, the original, each view standing in for one
+collector of the original and reading from it::
+
+    scenario = character.fork()
+    scenario["level"] = 9
+    scenario["points"]["total"]["mental"]
+
+Nothing is copied when a fork is made.  Writing to a view overrides that key in the fork only, and a fork shares the
+promises and cached values of the original for every key not computed from an override, so that only the values that
+really depend on an override are computed again, and only they are cached by the fork.  Thousands of forks therefore
+cost memory in proportion to the number of values they change.
+
+Whether a value depends on an override is found from the reads the original recorded while computing it, see
+closure_collector.dependencies, so every value a fork reads is first computed by the original, once for all its forks.
+Values that depend on an override are computed in the fork by a copy of their promise with the collectors of the tree
+it closes over or reads as globals replaced by their views, see util.rebound(), so promises must be functions or
+partials finding the collectors they read in their closures or globals, as rules added by a function do, rather than
+methods of collectors or functions calling other functions that find them as globals.
+
+Views are lazy collectors, so later changes to the original show through in the fork wherever it has not overridden
+them.  Keys can be overridden or added in a fork, but not deleted, a FlockList is copied into its view, and a fork
+cannot itself be forked, nor compute coroutine promises.
+"""
+
+import weakref
+from collections import ChainMap
+from collections.abc import Iterable
+
+from closure_collector.core import DynamicClosureCollector
+from closure_collector.dependencies import KEYS, evaluate, last_write, untracked
+from closure_collector.metrics import find_root, nested_collectors
+from closure_collector.util import holds, rebound
+
+# The collectors of each tree forked, by the id() of its root, shared by every fork of the tree, see Fork.collectors()
+_trees: dict = {}
+
+
+class Fork:
+    """
+    The views making up one fork of a collector tree, and the keys overridden in them.
+
+    :param collector: a collector of the tree to fork, not itself a view
+    :raises ValueError: if collector is a view in a fork
+    """
+
+    def __init__(self, collector):
+        if collector.in_fork is not None:
+            raise ValueError("a fork cannot be forked, fork the original collector instead")
+        self.root = find_root(collector)
+        self.views: dict = {}
+        self.origins: dict = {}
+        self.overrides: set = set()
+        self.rules: dict = {}
+        self.reached: tuple | None = None
+        self.writes = 0
+
+    def view(self, collector):
+        """The view of collector in this fork, made the first time it is needed."""
+        found = self.views.get(id(collector))
+        if found is None:
+            found = collector.fork_view(self)
+            self.views[id(collector)] = found
+            self.origins[id(found)] = collector
+        return found
+
+    def collectors(self) -> dict:
+        """Map the id() of every collector nested in the original tree to the collector, found again after any write."""
+        found = _trees.get(id(self.root))
+        if found is None or found[0]() is not self.root or found[1] != last_write():
+            found = (weakref.ref(self.root), last_write(), {id(collector): collector for collector, _ in nested_collectors(self.root)})
+            for ident, tree in list(_trees.items()):
+                if tree[0]() is None:
+                    del _trees[ident]
+            _trees[id(self.root)] = found
+        return found[2]
+
+    def mapped(self, value):
+        """The view of value if it is a collector of the original tree, otherwise value itself."""
+        return self.view(value) if isinstance(value, DynamicClosureCollector) and id(value) in self.collectors() else value
+
+    def rebound(self, item):
+        """A copy of item, a promise or the like, reading the views of the collectors of the tree it refers to."""
+        found = self.rules.get(id(item))
+        if found is None or found[0] is not item:
+            found = self.rules[id(item)] = (item, rebound(item, Substitutes(self)))
+        return found[1]
+
+    def promises(self, promises):
+        """The promises of a view of a collector whose promises are promises, see ForkPromises and ForkList."""
+        return ForkList(self, promises) if isinstance(promises, list) else ForkPromises(self, promises)
+
+    def versions(self, collector):
+        """The versions of a view of collector, see ForkVersions."""
+        return ForkVersions(self, collector)
+
+    def compute(self, view, key, promise):
+        """
+        Compute key in view, sharing the original's value unless it was computed from anything overridden in this fork.
+
+        Values that were are computed again by their promise rebound to the views of this fork, and cached by view along
+        with the version of the original's value, so that they are computed again if the original's promise changes.
+
+        :return: the value
+        """
+        origin = self.origins[id(view)]
+        if id(promise) in self.origins:
+            return promise
+        if overridden(view, key):
+            return view.store(key, *evaluate(view, key, promise))
+        if not holds(view, key, promise):  # e.g. a sheared form or an aggregated key, shared if the original has it
+            if key in origin.cache and origin.is_current(key) and not self.affected(origin, key):
+                return origin.cache[key]
+            return view.store(key, *evaluate(view, key, promise))
+        cached = key in origin.cache
+        try:
+            value = untracked(lambda: origin[key] if hasattr(origin, "__getitem__") else getattr(origin, key))
+        except Exception:
+            if not self.affected(origin, key, cached):
+                raise
+        else:
+            value = self.mapped(value)
+            if id(value) in self.origins or not self.affected(origin, key, cached):
+                return value
+        value, evaluation = evaluate(view, key, self.rebound(promise))
+        evaluation.inputs[origin, key] = None
+        return view.store(key, value, evaluation)
+
+    def affected(self, origin, key, cached=True) -> bool:
+        """
+        Check whether the original's value for key in origin was computed from anything overridden in this fork.
+
+        :param cached: False if the value was only just computed, so that the reads it recorded have not been seen
+        """
+        if not cached:
+            self.reached = None
+        return self.reaches((origin, key))
+
+    def reaches(self, node) -> bool:
+        """Check whether node, a (collector, key) pair of the original, can be reached from an override."""
+        if self.reached is None or self.reached[0] != last_write():
+            self.reached = (last_write(), reachable(self.overrides))
+        if node in self.reached[1]:
+            return True
+        collector, key = node
+        stamp = collector.stamps.get(key) if collector.lazy else None  # lazy collectors keep no reverse edges
+        return stamp is not None and any(self.reaches((input_collector, input_key)) for input_collector, input_key, _ in stamp[1])
+
+    def forgotten(self, view, key) -> Iterable:
+        """
+        Note that view dropped its value for key, noting an override if key no longer has the original's promise.
+
+        :return: the (view, key) pairs of the values an override reaches, which must be dropped in turn
+        """
+        if not overridden(view, key):
+            return ()
+        node = (self.origins[id(view)], key)
+        self.overrides.add(node)
+        self.reached = None
+        self.writes += 1
+        reached = reachable([node])
+        reached.discard(node)
+        return [(self.views[id(collector)], read_key) for collector, read_key in reached if id(collector) in self.views]
+
+
+class Substitutes(dict):
+    """The views of a fork by the id() of the collectors they stand for, made as util.rebound() asks for them."""
+
+    def __init__(self, fork: Fork):
+        super().__init__()
+        self.fork = fork
+
+    def __contains__(self, ident):
+        return ident in self.fork.collectors()
+
+    def __missing__(self, ident):
+        return self.fork.view(self.fork.collectors()[ident])
+
+
+class ForkPromises(ChainMap):
+    """The promises of a view, its overrides ahead of the original's promises, with nested collectors read as views."""
+
+    def __init__(self, fork: Fork, promises):
+        super().__init__({}, promises)
+        self.fork = fork
+
+    def __getitem__(self, key):
+        return self.fork.mapped(super().__getitem__(key))
+
+    def overridden(self, key) -> bool:
+        """Check whether key has been given a promise of its own in the view, or for KEYS whether any key was added."""
+        if key is KEYS:
+            return any(added not in self.maps[1] for added in self.maps[0])
+        return key in self.maps[0]
+
+
+class ForkList(list):
+    """The promises of a view of a FlockList, copied from the original's, with nested collectors read as views."""
+
+    __slots__ = ("fork", "original")
+
+    def __init__(self, fork: Fork, promises: list):
+        super().__init__(promises)
+        self.fork = fork
+        self.original = promises
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        return item if isinstance(index, slice) else self.fork.mapped(item)
+
+    def overridden(self, key) -> bool:
+        """Check whether the promise at index key differs from the original's, or for KEYS whether the length does."""
+        if key is KEYS:
+            return len(self) != len(self.original)
+        if not isinstance(key, int):
+            return False
+        return key >= min(len(self), len(self.original)) or list.__getitem__(self, key) is not self.original[key]
+
+
+class ForkVersions(dict):
+    """
+    The versions of a view's keys, each paired with the version of the original's, so that changes to either are seen.
+
+    Lazy originals keep no reverse edges for overrides to be followed through, so any override in the fork changes the
+    versions of their keys.
+    """
+
+    __slots__ = ("fork", "origin")
+
+    def __init__(self, fork: Fork, origin):
+        super().__init__()
+        self.fork = fork
+        self.origin = origin
+
+    def get(self, key, default=0):
+        return super().get(key, default), self.origin.refresh(key), self.fork.writes if self.origin.lazy else 0
+
+
+def overridden(view, key) -> bool:
+    """Check whether key has been overridden in view, see ForkPromises.overridden(), never so for an aggregator."""
+    promises = getattr(view, "promises", None)
+    return isinstance(promises, ForkPromises | ForkList) and promises.overridden(key)
+
+
+def reachable(nodes: Iterable) -> set:
+    """The (collector, key) pairs in nodes and those of every value recorded as computed from them."""
+    reached: set = set()
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        if node not in reached:
+            reached.add(node)
+            pending.extend(node[0].dependents.get(node[1], ()))
+    return reached
@@ -0,0 +1,235 @@
+"""
+Per key metrics of the evaluations made by closure collectors.
+
+Recording is opt in, and applies to every collector in the process, on every thread, while a Metrics is recording::
+
+    with Metrics() as metrics:
+        flock.shear()
+    print(metrics.table())
+
+A Metrics given a root, as ``flock.metrics()`` gives, records only the keys of that root and of the collectors nested in
+it, still on every thread.
+
+For each key read it records how many times the key's promise was evaluated, the seconds those evaluations took in
+total, including the evaluations of everything they read, and their self time, excluding those nested evaluations.  It
+also counts the reads that found a cached value, the hits, the reads that did not, the misses, and the invalidations,
+how often a cached value of the key was dropped as out of date.  Reads of data, which is never cached, are not counted.
+
+Keys are identified by their path from their root collector, with the sheared forms of flocks, their key sets and the
+like under sentinel keys such as SHEARED.
+When the keys of more than one root are recorded, such as those of an aggregator that is only read by rules and so is a
+root itself, each path starts with its root's type and id().
+
+When no Metrics is recording, the cost is a check of dependencies.recorder in evaluate(), is_cached() and forget().
+Counts are not locked, so those made on several threads at once may be slightly low.
+"""
+
+from collections.abc import Mapping
+
+from closure_collector import dependencies
+from closure_collector.core import DynamicClosureCollector
+from closure_collector.util import Constant
+
+EVALUATIONS, TIME, SELF_TIME, HITS, MISSES, INVALIDATIONS = range(6)
+COLUMNS = ("evaluations", "time", "self_time", "hits", "misses", "invalidations")
+
+
+class KeyMetrics:
+    """
+    The metrics of one key.
+
+    :param path: the keys leading to the key from its root collector, ending with the key itself
+    """
+
+    __slots__ = ("path", *COLUMNS)
+
+    def __init__(self, path: tuple, evaluations=0, time=0.0, self_time=0.0, hits=0, misses=0, invalidations=0):
+        self.path = path
+        self.evaluations = evaluations
+        self.time = time
+        self.self_time = self_time
+        self.hits = hits
+        self.misses = misses
+        self.invalidations = invalidations
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r}, {', '.join(f'{column}={getattr(self, column)!r}' for column in COLUMNS)})"
+
+
+class Metrics:
+    """
+    Records the metrics of every key read while it is recording, either as a context manager or between start() and
+    stop().  Starting a Metrics while another is recording pauses the other until this one stops.
+
+    :param root: the root collector whose keys, and those of the collectors nested in it, are the only ones recorded, or
+        None to record every collector in the process
+    """
+
+    def __init__(self, root=None):
+        self.records: dict = {}
+        self.paused = None
+        self.root = root
+        self.included: dict = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start recording."""
+        self.paused = dependencies.recorder
+        dependencies.recorder = self
+
+    def stop(self):
+        """Stop recording, resuming whatever Metrics was recording before."""
+        if dependencies.recorder is self:
+            dependencies.recorder = self.paused
+        self.paused = None
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.records.clear()
+
+    def includes(self, collector) -> bool:
+        """Check whether the keys of collector are recorded, that is whether it is root or nested in root, if given."""
+        if self.root is None:
+            return True
+        found = self.included.get(collector)
+        if found is None:
+            found = self.included[collector] = find_root(collector) is self.root or id(collector) in nested_paths(self.root)
+        return found
+
+    def record(self, collector, key) -> list:
+        """The counts of key in collector, in the order of COLUMNS."""
+        counts = self.records.get((collector, key))
+        if counts is None:
+            counts = self.records[collector, key] = [0, 0.0, 0.0, 0, 0, 0]
+        return counts
+
+    def evaluated(self, evaluation):
+        """Count a finished Evaluation."""
+        if not self.includes(evaluation.collector):
+            return
+        counts = self.record(evaluation.collector, evaluation.key)
+        counts[EVALUATIONS] += 1
+        counts[TIME] += evaluation.total()
+        counts[SELF_TIME] += evaluation.elapsed()
+
+    def hit(self, collector, key):
+        """Count a read of key in collector that found a valid cached value."""
+        if self.includes(collector):
+            self.record(collector, key)[HITS] += 1
+
+    def missed(self, collector, key):
+        """Count a read of key in collector that found no valid cached value, unless key holds data."""
+        if not self.includes(collector):
+            return
+        promises = getattr(collector, "promises", None)
+        try:
+            if type(promises[key]) is Constant:  # type: ignore[index]
+                return
+        except (KeyError, IndexError, TypeError):
+            pass
+        self.record(collector, key)[MISSES] += 1
+
+    def invalidated(self, collector, key):
+        """Count the dropping of the cached value of key in collector."""
+        if self.includes(collector):
+            self.record(collector, key)[INVALIDATIONS] += 1
+
+    def rows(self, sort: str = "self_time") -> list:
+        """
+        The metrics of every key recorded.
+
+        :param sort: the column to sort by, largest first, or "path" to sort by path
+        :return: a list of KeyMetrics
+        """
+        paths = find_paths(collector for collector, _ in self.records)
+        rows = [KeyMetrics(paths[id(collector)] + (key,), *counts) for (collector, key), counts in self.records.items()]
+        if sort == "path":
+            rows.sort(key=lambda row: [str(step) for step in row.path])
+        else:
+            rows.sort(key=lambda row: getattr(row, sort), reverse=True)
+        return rows
+
+    def table(self, sort: str = "self_time", limit: int | None = None) -> str:
+        """
+        Format the metrics of the keys recorded as a text table, times in milliseconds.
+
+        :param sort: as for rows()
+        :param limit: the most keys to show, None to show every key
+        """
+        rows = self.rows(sort)[:limit]
+        paths = [" / ".join(str(step) for step in row.path) for row in rows]
+        width = max([len("key"), *map(len, paths)])
+        lines = [f"{'key':<{width}}{'evals':>8}{'time ms':>12}{'self ms':>12}{'hits':>8}{'misses':>8}{'invalid':>8}"]
+        for path, row in zip(paths, rows, strict=True):
+            lines.append(
+                f"{path:<{width}}{row.evaluations:>8}{row.time * 1e3:>12.3f}{row.self_time * 1e3:>12.3f}{row.hits:>8}{row.misses:>8}{row.invalidations:>8}"
+            )
+        return "\n".join(lines)
+
+
+def find_paths(collectors) -> dict:
+    """
+    Find the path of each collector from its root collector, by searching the collectors nested in each root.
+
+    A collector whose root is not set, as for an aggregator in a flock, is found in whichever root it is nested in.
+    When the collectors have more than one root each path starts with the name of its root.
+
+    :return: a dict mapping the id() of each collector to its path, a tuple of keys, those that cannot be found given a
+        path naming the collector instead
+    """
+    collectors = list(collectors)
+    roots = {id(root): root for root in map(find_root, collectors)}
+    nested = {root: nested_paths(roots[root]) for root in roots}
+    tops = [root for root in roots if not any(root in found for other, found in nested.items() if other != root)]
+    paths: dict = {}
+    for root in tops:
+        prefix = () if len(tops) == 1 else (name(roots[root]),)
+        for collector, path in nested[root].items():
+            paths.setdefault(collector, prefix + path)
+    for collector in collectors:
+        paths.setdefault(id(collector), (name(collector),))
+    return paths
+
+
+def nested_paths(root) -> dict:
+    """Map the id() of root and of every collector nested in it to its path from root."""
+    return {id(collector): path for collector, path in nested_collectors(root)}
+
+
+def nested_collectors(root):
+    """
+    Find root and every collector nested in it, each only once.
+
+    :return: a generator of (collector, path) pairs, path being the tuple of keys leading to the collector from root
+    """
+    seen = set()
+    pending: list = [(root, ())]
+    while pending:
+        item, path = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        yield item, path
+        promises = getattr(item, "promises", None)
+        items = promises.items() if isinstance(promises, Mapping) else enumerate(promises or ())
+        pending.extend((promise, path + (key,)) for key, promise in items if isinstance(promise, DynamicClosureCollector))
+
+
+def find_root(collector):
+    """The outermost collector that collector is nested in, following root."""
+    seen = {id(collector)}
+    while getattr(collector, "root", None) is not None and id(collector.root) not in seen:
+        collector = collector.root
+        seen.add(id(collector))
+    return collector
+
+
+def name(collector) -> str:
+    """Name a collector by its type and id(), for paths."""
+    return f"<{type(collector).__name__} at {id(collector):#x}>"
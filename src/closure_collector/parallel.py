@@ -0,0 +1,181 @@
+"""
+Shearing independent parts of a model concurrently.
+
+The keys of a collector are split into groups that do not share any other collector, found from the structure of nested
+collectors, the collectors each promise holds in its closure and the reads recorded by earlier evaluations.  Keys whose
+promises hold the collector itself, or its root, may read anything in it, so they are left to be computed once the
+independent groups are done.
+
+With a thread pool the groups are computed in place, warming the caches, and the usual serial shear then assembles the
+result from the cache, so errors are raised or recorded exactly as they are serially.  Any other executor, such as a
+process pool, is given whole groups to shear and the result is assembled from what it returns.  The collector is sent
+as a snapshot, see closure_collector.snapshot, so rules may be lambdas and closures, but everything else in the tree
+must be picklable; if it is not, a warning is given and the collector is sheared serially instead.  The values computed
+by the executor are not cached in this process.
+
+Collectors reached only through something other than a closure, partial or bound method are not seen.  Should two
+groups turn out to share one, each key is still only computed once, as keys are computed under a lock while the
+groups run.
+"""
+
+import io
+import warnings
+from collections.abc import Mapping
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from types import MethodType
+
+from closure_collector.core import CCBase, DynamicClosureCollector
+from closure_collector.dependencies import single_flight
+from closure_collector.snapshot import restore, snapshot
+from closure_collector.util import Constant
+
+
+def promise_items(collector):
+    """The (key, promise) pairs of a collector whose promises are held in either a dict or a list."""
+    if isinstance(collector.promises, Mapping):
+        return collector.promises.items()
+    return enumerate(collector.promises)
+
+
+def references(promise) -> list:
+    """
+    Find the collectors a promise can reach without calling anything.
+
+    A promise that is itself a collector is followed into its promises, and so on for the collectors nested in it.
+    Functions are followed into their closures, partials into their arguments, constants into their value, bound
+    methods into their instance and aggregators into their sources, but collectors found that way are not followed any further.
+    """
+    found = []
+    pending = [(promise, True)]
+    seen = set()
+    while pending:
+        item, nested = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, CCBase):
+            found.append(item)
+            if nested and hasattr(item, "promises"):
+                pending.extend((value, True) for _, value in promise_items(item))
+            sources = getattr(item, "sources", None)
+            if isinstance(sources, Mapping):
+                pending.extend((source, False) for source in sources.values())
+            elif callable(sources):
+                pending.append((sources, False))
+            elif sources is not None:
+                pending.extend((source, False) for source in sources)
+        elif isinstance(item, partial):
+            pending.append((item.func, False))
+            pending.extend((arg, False) for arg in item.args)
+            pending.extend((arg, False) for arg in item.keywords.values())
+        elif isinstance(item, Constant):
+            pending.append((item.value, False))
+        elif isinstance(item, MethodType):
+            pending.append((item.__self__, False))
+        elif getattr(item, "__closure__", None):
+            pending.extend((cell.cell_contents, False) for cell in item.__closure__)
+    return found
+
+
+def plan(collector):
+    """
+    Split the keys of collector into groups that can be sheared independently of each other.
+
+    :return: a tuple of the list of groups, each a list of keys, and the list of keys that may read anything
+    """
+    enclosing = {id(collector), id(collector.root)}
+    parents = {}
+    owners = {}
+    links = []
+    shared = []
+    for key, promise in promise_items(collector):
+        reached = references(promise)
+        if any(id(item) in enclosing for item in reached):
+            shared.append(key)
+            continue
+        parents[key] = key
+        for item in reached:
+            links.append((key, owners.setdefault(id(item), key)))
+            if isinstance(item, DynamicClosureCollector):
+                for reader, reader_key in chain.from_iterable(item.dependents.values()):
+                    links.append((key, reader_key if reader is collector else owners.setdefault(id(reader), key)))
+    for key, readers in collector.dependents.items():
+        links.extend((key, reader_key) for reader, reader_key in readers if reader is collector)
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for key, other in links:
+        if key in parents and other in parents:
+            parents[find(key)] = find(other)
+
+    groups = {}
+    for key in parents:
+        groups.setdefault(find(key), []).append(key)
+    return list(groups.values()), shared
+
+
+def independent_groups(collector):
+    """
+    Plan collector, then break down any group that is a single nested collector into that collector's own groups.
+
+    A nested collector with keys that may read anything in it is kept whole instead.
+
+    :return: (collector, keys) pairs for every group found
+    """
+    groups, _ = plan(collector)
+    for keys in groups:
+        promise = collector.promises[keys[0]]
+        if len(keys) == 1 and isinstance(promise, DynamicClosureCollector) and hasattr(promise, "sheared_items"):
+            nested_groups, nested_shared = plan(promise)
+            if len(nested_groups) > 1 and not nested_shared:
+                yield from independent_groups(promise)
+                continue
+        yield collector, keys
+
+
+def warm(collector, keys):
+    """Compute and cache the values of keys in collector, leaving any errors to be met again when sheared."""
+    for _ in collector.sheared_items(keys, record_errors=True):
+        pass
+
+
+def shear_group(data: bytes, keys, record_errors):
+    """Shear some of the keys of the collector in a snapshot, as a picklable function for executors in other processes."""
+    return list(restore(io.BytesIO(data)).sheared_items(keys, record_errors=record_errors))
+
+
+def parallel_shear(collector, executor: Executor, record_errors=False):
+    """
+    Shear collector, computing independent groups of keys concurrently on executor.
+
+    :param collector: a collector providing sheared_items(), such as a FlockDict or FlockList
+    :param executor: a concurrent.futures Executor
+    :param record_errors: as for shear()
+    :return: the same value as collector.shear(record_errors)
+    """
+    if isinstance(executor, ThreadPoolExecutor):
+        with single_flight():
+            futures = [executor.submit(warm, group_collector, keys) for group_collector, keys in independent_groups(collector)]
+            for future in futures:
+                future.result()
+        return collector.shear(record_errors=record_errors)
+
+    groups, shared = plan(collector)
+    data = io.BytesIO()
+    try:
+        snapshot(collector, data)
+    except Exception as e:
+        warnings.warn(f"cannot send a {type(collector).__name__} to {type(executor).__name__}, shearing it serially instead: {e}", stacklevel=3)
+        return collector.shear(record_errors=record_errors)
+    futures = [executor.submit(shear_group, data.getvalue(), keys, record_errors) for keys in groups]
+    sheared = {}
+    for future in futures:
+        sheared.update(future.result())
+    sheared.update(collector.sheared_items(shared, record_errors=record_errors))
+    return collector.assemble(sheared)
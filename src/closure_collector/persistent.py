@@ -0,0 +1,290 @@
+"""
+A cache of computed values that outlives the process, kept in an SQLite database.
+
+Values computed by a collector whose CachePolicy has a PersistentCache are stored on disk along with a trace of what
+their promise read: the path of each (collector, key) read, from the root collector, and a hash of the value read.  When
+a later process computes the same key of a model built the same way, the stored trace is replayed: each input is read
+again, in the order the promise first read it, and the stored value is used without calling the promise if every input
+still has the same value::
+
+    policy = CachePolicy(persistent=PersistentCache("results.db", max_bytes=100_000_000))
+    character = FlockDict(data, cache_policy=policy)
+
+Promises are identified by their code, defaults, the values they close over and the values of the globals they read,
+functions among these being identified the same way in turn, so editing a rule or a helper it calls, capturing a
+different value or changing a global stores a new result rather than reusing the old one.  Collectors are identified by
+their path, and modules by their name alone, so values read as attributes of a module are not seen.  Only promises that
+are plain functions are stored, and only values, inputs and closures that can be pickled; anything else is simply
+computed as usual.  Stored values are unpickled, so a database must only be shared with trusted processes.  Promises must
+not depend on anything they do not read through a collector, such as the time or the random module, as the trace cannot
+see it.  Coroutine promises, and values such as sheared forms that are computed for a collector rather than by the
+promise of one of its keys, are never stored.
+
+Values are hashed by pickling them, so a value whose pickle differs from process to process, such as a set of strings,
+never matches and is computed every time.
+
+The database holds at most max_entries values and max_bytes bytes of pickled values, evicting the least recently used
+first, and is shared safely between the threads and processes using it.
+"""
+
+import hashlib
+import marshal
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections.abc import Mapping, Sequence
+from types import FunctionType, ModuleType
+
+from closure_collector.cache import NOTHING
+from closure_collector.core import DynamicClosureCollector
+from closure_collector.dependencies import KEYS, evaluate, last_write
+from closure_collector.metrics import find_root, nested_collectors
+from closure_collector.util import global_names, holds
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results (rule TEXT, node TEXT, inputs BLOB, value BLOB, size INTEGER, used REAL, PRIMARY KEY (rule, node))",
+    "CREATE INDEX IF NOT EXISTS results_used ON results (used)",
+)
+
+
+class PersistentCache:
+    """
+    A database of computed values, for the persistent argument of a CachePolicy.
+
+    :param path: the SQLite database file, created if it does not exist
+    :param max_entries: the most values to store, None for no limit
+    :param max_bytes: the most bytes of pickled values to store, None for no limit
+    :param min_cost: values computed in fewer seconds than this are not stored, as they are cheaper to compute than load
+    """
+
+    def __init__(self, path, max_entries: int | None = None, max_bytes: int | None = None, min_cost: float = 0.0):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("max_bytes cannot be negative")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_cost = min_cost
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.trees: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __reduce__(self):
+        return self.__class__, (self.path, self.max_entries, self.max_bytes, self.min_cost)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r}, max_entries={self.max_entries}, max_bytes={self.max_bytes}, min_cost={self.min_cost})"
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def evaluate(self, collector, key, promise):
+        """
+        Evaluate promise as the value of key in collector as dependencies.evaluate() does, using the stored value instead
+        if everything it read still has the same value, and storing the value computed otherwise.
+
+        Replaying the reads of a stored value records them just as calling the promise would, so the value is dropped
+        from memory as usual when any of them changes.
+
+        :return: a tuple of the value and the Evaluation that recorded its reads
+        """
+        if not holds(collector, key, promise):
+            return evaluate(collector, key, promise)
+        paths, collectors = self.tree(collector)
+        rule = rule_digest(promise, paths)
+        node = digest((paths[id(collector)], key))
+        if rule is None or node is None:
+            return evaluate(collector, key, promise)
+        with self.lock:
+            row = self.connection.execute("SELECT inputs, value FROM results WHERE rule = ? AND node = ?", (rule, node)).fetchone()
+        if row is not None:
+            value, evaluation = evaluate(collector, key, lambda: replay(row, paths, collectors))
+            if value is not NOTHING:
+                with self.lock:
+                    self.hits += 1
+                    self.connection.execute("UPDATE results SET used = ? WHERE rule = ? AND node = ?", (time.time(), rule, node))
+                return value, evaluation
+        value, evaluation = evaluate(collector, key, promise)
+        with self.lock:
+            self.misses += 1
+        if evaluation.elapsed() >= self.min_cost and not evaluation.volatile:
+            self.save(rule, node, value, evaluation, paths)
+        return value, evaluation
+
+    def save(self, rule: str, node: str, value, evaluation, paths: dict):
+        """Store value with the trace of the inputs evaluation read, unless the value or an input cannot be pickled."""
+        inputs = []
+        for input_collector, input_key in evaluation.inputs:
+            path = paths.get(id(input_collector))
+            input_digest = None if path is None else read_digest(input_collector, input_key, paths)
+            if input_digest is None:
+                return
+            inputs.append((path, input_key is KEYS, None if input_key is KEYS else input_key, input_digest))
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            trace = pickle.dumps(inputs, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        if self.max_bytes is not None and len(blob) > self.max_bytes:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (rule, node, inputs, value, size, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (rule, node, trace, blob, len(blob), time.time()),
+            )
+            self.stores += 1
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used values until the database is within its limits."""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            victims = []
+            for rowid, row_size in self.connection.execute("SELECT rowid, size FROM results ORDER BY used"):
+                if (self.max_entries is None or entries <= self.max_entries) and (self.max_bytes is None or size <= self.max_bytes):
+                    break
+                victims.append((rowid,))
+                entries -= 1
+                size -= row_size
+            self.connection.executemany("DELETE FROM results WHERE rowid = ?", victims)
+            self.evictions += len(victims)
+
+    def tree(self, collector) -> tuple:
+        """
+        Find the paths of the collectors in the tree collector belongs to, reusing those found while nothing was written.
+
+        :return: a tuple of a dict mapping the id() of each collector to its path and a dict mapping paths to collectors
+        """
+        root = find_root(collector)
+        found = self.trees.get(id(root))
+        if found is None or found[0]() is not root or found[1] != last_write() or id(collector) not in found[2]:
+            pairs = list(nested_collectors(root))
+            found = (weakref.ref(root), last_write(), {id(item): path for item, path in pairs}, {path: item for item, path in pairs})
+            self.trees = {key: tree for key, tree in self.trees.items() if tree[0]() is not None}
+            self.trees[id(root)] = found
+        return found[2], found[3]
+
+    def clear(self):
+        """Delete every stored value."""
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+
+    def close(self):
+        """Close the database, after which nothing more can be stored or loaded."""
+        with self.lock:
+            self.connection.close()
+
+    def stats(self) -> dict:
+        """
+        Report how well this cache is doing in this process.
+
+        :return: a dict of the hits, misses, stores and evictions so far and the number of entries and bytes stored
+        """
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions, "entries": entries, "bytes": size}
+
+
+def replay(row: tuple, paths: dict, collectors: dict):
+    """
+    Read the inputs of a stored value again, in the order they were first read.
+
+    :return: the stored value if every input has the same value as when it was stored, otherwise NOTHING
+    """
+    trace, blob = row
+    for path, is_keys, key, stored in pickle.loads(trace):
+        collector = collectors.get(path)
+        if collector is None or read_digest(collector, KEYS if is_keys else key, paths) != stored:
+            return NOTHING
+    return pickle.loads(blob)
+
+
+def read_digest(collector, key, paths: dict) -> str | None:
+    """
+    Read key from collector and hash its value, collectors being hashed by their path.
+
+    :return: the hash, or None if the value cannot be read or pickled
+    """
+    try:
+        value = read(collector, key)
+    except Exception:
+        return None
+    if isinstance(value, DynamicClosureCollector):
+        return digest((DynamicClosureCollector, paths.get(id(value))))
+    return digest(value)
+
+
+def read(collector, key):
+    """Read key from collector as a promise would, KEYS giving its keys, or the length of a sequence."""
+    if key is not KEYS:
+        return collector[key] if hasattr(collector, "__getitem__") else getattr(collector, key)
+    if isinstance(collector, Mapping):
+        return list(collector)
+    if isinstance(collector, Sequence):
+        return len(collector)
+    return sorted(dir(collector), key=lambda x: (str(x), repr(x)))
+
+
+def rule_digest(promise, paths: dict) -> str | None:
+    """
+    Identify a promise by its name, code, defaults, the values it closes over and the globals it reads, see
+    function_parts().
+
+    :return: the hash, or None if promise is not a function or reads or closes over something that cannot be pickled
+    """
+    if getattr(promise, "__code__", None) is None:
+        return None
+    return digest(function_parts(promise, paths, set()))
+
+
+def function_parts(function, paths: dict, seen: set) -> tuple:
+    """
+    Break function down into the parts rule_digest() hashes, identifying the values it closes over and the globals it
+    reads with identify().
+
+    :param seen: the id() of every function already broken down, which are identified by name when met again
+    """
+    if id(function) in seen:
+        return function.__module__, function.__qualname__
+    seen.add(id(function))
+    closure = []
+    for cell in function.__closure__ or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            contents = None
+        closure.append(identify(contents, paths, seen))
+    namespace = function.__globals__
+    names = [(name, identify(namespace[name], paths, seen)) for name in global_names(function.__code__) if name in namespace]
+    return function.__module__, function.__qualname__, marshal.dumps(function.__code__), function.__defaults__, function.__kwdefaults__, closure, names
+
+
+def identify(value, paths: dict, seen: set):
+    """Stand in for value in a digest: collectors by their path, functions by their parts and modules by their name."""
+    if isinstance(value, DynamicClosureCollector):
+        return DynamicClosureCollector, paths.get(id(value))
+    if isinstance(value, FunctionType):
+        return function_parts(value, paths, seen)
+    if isinstance(value, ModuleType):
+        return "module", value.__name__
+    return value
+
+
+def digest(value) -> str | None:
+    """Hash the pickle of value, or None if it cannot be pickled."""
+    try:
+        return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        return None
@@ -0,0 +1,122 @@
+"""
+Snapshots of whole collector trees, their rules and their cached values, restored ready to read without recomputing.
+
+Pickling a flock normally fails on its rules, so models are usually saved as their sheared data and rebuilt by running
+the code that adds their rules again, which leaves every value to be computed afresh.  A snapshot instead records the
+tree as it is::
+
+    with open("character.snapshot", "wb") as f:
+        snapshot(character, f)
+    with open("character.snapshot", "rb") as f:
+        character = restore(f)
+
+Data is stored as data, and every rule and other function is stored by reference to its qualified name where it can be
+imported by that name, or else, for lambdas and closures, by its qualified name and code along with the values it
+captured and its default arguments, captured collectors included.  Everything else a rule refers to is pickled, so the
+values held by the tree, cached values included, must be picklable.  The cached values are restored along with the
+record of what each was computed from, so the restored tree is warm and still drops values when their inputs change.
+
+Code is stored in the marshal format of the Python version taking the snapshot, so snapshots can only be restored by
+the same version of Python, and the modules rules were defined in must still be importable.  Snapshots are pickles,
+and must only be restored from trusted sources.
+"""
+
+import builtins
+import marshal
+import pickle
+import sys
+from importlib import import_module
+from types import CellType, CodeType, FunctionType, ModuleType
+
+from closure_collector.dependencies import advance_versions, new_version
+
+FORMAT = 1
+MAGIC = "closure_collector snapshot"
+
+
+class _Empty:
+    """Sentinel standing for a closure cell whose variable has not been assigned."""
+
+    def __repr__(self):
+        return "EMPTY"
+
+    def __reduce__(self):
+        return "EMPTY"
+
+
+EMPTY = _Empty()
+
+
+class SnapshotPickler(pickle.Pickler):
+    """A Pickler that stores functions that cannot be imported by name, such as lambdas, by their code and closure."""
+
+    def reducer_override(self, obj):
+        if type(obj) is FunctionType and not importable(obj):
+            contents = []
+            for cell in obj.__closure__ or ():
+                try:
+                    contents.append(cell.cell_contents)
+                except ValueError:
+                    contents.append(EMPTY)
+            state = (obj.__defaults__, obj.__kwdefaults__, obj.__dict__, contents)
+            return make_function, (obj.__code__, obj.__module__, obj.__name__, obj.__qualname__, len(contents)), state, None, None, fill_function
+        if type(obj) is CodeType:
+            return marshal.loads, (marshal.dumps(obj),)
+        if type(obj) is ModuleType:
+            return import_module, (obj.__name__,)
+        return NotImplemented
+
+
+def snapshot(collector, file):
+    """
+    Write collector, and everything nested in it or captured by its rules, to file, a binary file object.
+
+    :raises pickle.PicklingError: or another exception raised by pickle if something held by the tree cannot be pickled
+    """
+    pickle.dump((MAGIC, FORMAT, sys.version_info[:2], new_version()), file, protocol=pickle.HIGHEST_PROTOCOL)
+    SnapshotPickler(file, protocol=pickle.HIGHEST_PROTOCOL).dump(collector)
+
+
+def restore(file):
+    """
+    Read a collector written by snapshot() from file, a binary file object, with its cached values intact.
+
+    :raises ValueError: if file does not hold a snapshot, or it was taken by another version of Python
+    :return: the collector
+    """
+    header = pickle.load(file)
+    if not (isinstance(header, tuple) and len(header) == 4 and header[0] == MAGIC):
+        raise ValueError("not a closure_collector snapshot")
+    _, version, python, last_version = header
+    if version != FORMAT:
+        raise ValueError(f"snapshot format {version} is not supported, only format {FORMAT}")
+    if tuple(python) != sys.version_info[:2]:
+        raise ValueError(f"snapshot was taken by Python {'.'.join(map(str, python))}, its code cannot be loaded by this version")
+    collector = pickle.load(file)
+    advance_versions(last_version)
+    return collector
+
+
+def importable(func) -> bool:
+    """Check whether func can be found again by importing its module and following its qualified name."""
+    found = sys.modules.get(func.__module__)
+    for name in func.__qualname__.split("."):
+        found = getattr(found, name, None)
+    return found is func
+
+
+def make_function(code, module, name, qualname, cells):
+    """Create a function from its code, with the globals of its module and empty closure cells filled by fill_function()."""
+    namespace = vars(import_module(module)) if module is not None else {"__builtins__": builtins}
+    func = FunctionType(code, namespace, name, None, tuple(CellType() for _ in range(cells)) or None)
+    func.__qualname__ = qualname
+    return func
+
+
+def fill_function(func, state):
+    """Set the defaults, attributes and captured values of a function created by make_function()."""
+    func.__defaults__, func.__kwdefaults__, attributes, contents = state
+    func.__dict__.update(attributes)
+    for cell, value in zip(func.__closure__ or (), contents, strict=True):
+        if value is not EMPTY:
+            cell.cell_contents = value
@@ -0,0 +1,86 @@
+"""
+Tracing the evaluations made by closure collectors, for viewing as a flame chart.
+
+A Trace records a span for every evaluation of a promise while it is recording, along with the metrics a Metrics
+records, on every thread and, unless it is given a root as ``flock.trace()`` gives, for every collector, and writes
+them in the Chrome trace event format, which chrome://tracing, Perfetto and speedscope all open::
+
+    with flock.trace("shear.json"):
+        flock.shear()
+
+Each span is named by the path of its key, as in the metrics table, and runs from the start of the evaluation to its
+end, so the evaluations of what a promise reads are nested inside its own span.  Reads that find a cached value take no
+evaluation and so have no span.  Spans are recorded per thread; the spans of coroutine promises awaited concurrently on
+one thread overlap rather than nest.
+"""
+
+import json
+import os
+import threading
+from time import perf_counter
+
+from closure_collector.metrics import Metrics, find_paths
+
+
+class Trace(Metrics):
+    """
+    Records a span for every evaluation while recording, as a context manager or between start() and stop().
+
+    :param path: the file to write the trace to when used as a context manager exits, None to write it with write()
+    :param root: as for Metrics, the root collector whose evaluations, and those of the collectors nested in it, are the
+        only ones traced, or None to trace every collector in the process
+    """
+
+    def __init__(self, path=None, root=None):
+        super().__init__(root)
+        self.path = path
+        self.spans: list = []
+        self.threads: dict = {}
+        self.origin = perf_counter()
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        if self.path is not None:
+            self.write(self.path)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        super().reset()
+        self.spans.clear()
+        self.threads.clear()
+
+    def evaluated(self, evaluation):
+        """Record the span of a finished Evaluation, and count it as Metrics does."""
+        if not self.includes(evaluation.collector):
+            return
+        end = perf_counter()
+        thread = threading.get_ident()
+        if thread not in self.threads:
+            self.threads[thread] = threading.current_thread().name
+        self.spans.append((evaluation.collector, evaluation.key, evaluation.start_time, end, thread))
+        super().evaluated(evaluation)
+
+    def events(self) -> list:
+        """The spans recorded as Chrome trace events, in microseconds since the Trace was created, along with the names of their threads."""
+        pid = os.getpid()
+        paths = find_paths(collector for collector, *_ in self.spans)
+        events = [
+            {
+                "name": " / ".join(str(step) for step in paths[id(collector)] + (key,)),
+                "cat": type(collector).__name__,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": thread,
+            }
+            for collector, key, start, end, thread in self.spans
+        ]
+        events.sort(key=lambda event: (event["tid"], event["ts"], -event["dur"]))
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}} for thread, name in self.threads.items()]
+        return events
+
+    def write(self, path):
+        """Write the trace to path as Chrome trace event JSON."""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
@@ -1,11 +1,76 @@
+import inspect
+from functools import lru_cache, partial
+from inspect import CO_VARARGS, CO_VARKEYWORDS
 from numbers import Number
-from types import FunctionType
+from types import CellType, CodeType, FunctionType, MethodType
+
+# Values of these exact types are neither callable nor mappings, so they can be stored without any further checks
+CONSTANT_TYPES = frozenset({int, float, complex, bool, str, bytes, type(None)})
+
+# Stands in for the contents of a closure cell that has not been assigned yet
+EMPTY = object()
 
 
 class ClosureCollectorException(AttributeError):
     pass
 
 
+class Constant:
+    """
+    A promise for a value that is not a rule, such as a number or string loaded from data.
+
+    Collectors read constants straight from value, without calling them or caching a second reference to the value.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.value!r})"
+
+
+@lru_cache(maxsize=4096)
+def code_parameters(code) -> int:
+    """
+    Count the parameters a function with this code object takes, as inspect.signature() would.
+
+    Code objects are shared by every function made from the same source, so the counts of the most recently seen are
+    kept, without keeping every code object ever seen alive.
+    """
+    flags = code.co_flags
+    return code.co_argcount + code.co_kwonlyargcount + bool(flags & CO_VARARGS) + bool(flags & CO_VARKEYWORDS)
+
+
+def parameter_count(value) -> int:
+    """
+    Count the parameters of a callable, without inspect.signature() for plain functions, bound methods and partials.
+
+    Functions with attributes, e.g. __wrapped__ or __signature__ set by decorators, and anything else fall back to
+    inspect.signature(), raising the same errors it does.
+    """
+    if type(value) is FunctionType and not value.__dict__:
+        return code_parameters(value.__code__)
+    if type(value) is MethodType and type(value.__func__) is FunctionType and not value.__func__.__dict__:
+        count = code_parameters(value.__func__.__code__)
+        if count and value.__func__.__code__.co_argcount:
+            return count - 1
+    if type(value) is partial and not value.keywords and type(value.func) is FunctionType and not value.func.__dict__:
+        code = value.func.__code__
+        if not code.co_flags & CO_VARARGS and len(value.args) <= code.co_argcount:
+            return code_parameters(code) - len(value.args)
+    return len(inspect.signature(value).parameters)
+
+
+def takes_no_arguments(value) -> bool:
+    """Check whether value is a callable taking no parameters at all, i.e. a promise that can be stored as is."""
+    return callable(value) and parameter_count(value) == 0
+
+
 def rebind(callable, from_obj, to_obj):
     if getattr(callable, "__closure__", False):
         for cell in callable.__closure__:
@@ -13,10 +78,81 @@ def rebind(callable, from_obj, to_obj):
                 cell.cell_contents = to_obj
 
 
+def rebound(item, substitutes: dict, memo: dict | None = None):
+    """
+    Copy item with the objects it refers to replaced, unlike rebind() leaving item itself unchanged.
+
+    Functions are followed into their closures, and the globals their own code reads are replaced too, in a copy of
+    their globals, but not those read by the functions they call.  Partials are followed into their function and
+    arguments, anything else is left as it is.
+
+    :param substitutes: dict mapping the id() of each object to be replaced to its replacement
+    :raises TypeError: if item is a method of an object to be replaced, as its instance cannot be replaced in a copy
+    :return: the copy, or item itself if it refers to nothing to be replaced
+    """
+    if id(item) in substitutes:
+        return substitutes[id(item)]
+    if memo is None:
+        memo = {}
+    if id(item) in memo:
+        return memo[id(item)]
+    memo[id(item)] = item
+    if isinstance(item, FunctionType):
+        cells = [cell_contents(cell) for cell in item.__closure__ or ()]
+        contents = [content if content is EMPTY else rebound(content, substitutes, memo) for content in cells]
+        namespace = item.__globals__
+        names = {name: substitutes[id(namespace[name])] for name in global_names(item.__code__) if name in namespace and id(namespace[name]) in substitutes}
+        if names or any(new is not old for new, old in zip(contents, cells, strict=True)):
+            closure = tuple(CellType() if content is EMPTY else CellType(content) for content in contents) if item.__closure__ else None
+            function = FunctionType(item.__code__, {**namespace, **names} if names else namespace, item.__name__, item.__defaults__, closure)
+            function.__kwdefaults__ = item.__kwdefaults__
+            memo[id(item)] = function
+    elif isinstance(item, partial):
+        func = rebound(item.func, substitutes, memo)
+        args = [rebound(arg, substitutes, memo) for arg in item.args]
+        keywords = {name: rebound(arg, substitutes, memo) for name, arg in item.keywords.items()}
+        changed = [func is not item.func]
+        changed += [new is not old for new, old in zip(args, item.args, strict=True)]
+        changed += [keywords[name] is not arg for name, arg in item.keywords.items()]
+        if any(changed):
+            memo[id(item)] = partial(func, *args, **keywords)
+    elif isinstance(item, MethodType) and id(item.__self__) in substitutes:
+        raise TypeError(f"{item!r} is a method of an object being replaced, it cannot be rebound")
+    return memo[id(item)]
+
+
+def global_names(code: CodeType) -> list:
+    """The names code and the code nested in it, such as that of comprehensions and lambdas, may read as globals, sorted."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names.update(global_names(const))
+    return sorted(names)
+
+
+def holds(collector, key, promise) -> bool:
+    """Check that promise is the promise of key in collector, rather than computing a sheared form or the like."""
+    try:
+        return collector.promises[key] is promise
+    except (AttributeError, LookupError, TypeError):
+        return False
+
+
+def cell_contents(cell):
+    """The contents of a closure cell, or EMPTY if nothing has been assigned to it yet."""
+    try:
+        return cell.cell_contents
+    except ValueError:
+        return EMPTY
+
+
 def is_rule(func):
     if not callable(func):
         return False
 
+    if type(func) is Constant:  # judged as the lambda: value it replaces would be
+        return not isinstance(func.value, str | Number | bytes | tuple | frozenset)
+
     if getattr(func, "__closure__", False):  ## TODO replace with inspect_getclosurevars, probably inspect only nonlocals
         for cell in func.__closure__:
             if not isinstance(cell.cell_contents, str | Number | bytes | tuple | frozenset):
@@ -0,0 +1,119 @@
+"""
+Reducing the values of many keys across many sources in single NumPy calls.
+
+An aggregator over thousands of sources normally builds a list of values for each key and hands it to a Python function.
+When the values are plain numbers, the values of every key found in the same number of sources can instead be packed
+into the rows of one 2-D array and reduced along its rows with a NumPy reduction, giving the results for all of those
+keys at once.  Values that are not numbers, such as dicts or Counters, are left to the Python function.
+
+NumPy is an optional dependency, only needed when vectorized aggregation is asked for.
+"""
+
+import statistics
+from numbers import Real
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None  # type: ignore[assignment]
+
+NUMERIC_TYPES = (int, float, bool)
+ARRAY_KINDS = "biuf"
+
+
+def require_numpy():
+    """
+    Check that NumPy can be imported.
+
+    :raises ImportError: if it cannot
+    """
+    if np is None:
+        raise ImportError("vectorized aggregation requires numpy, install closure_collector[numpy]")
+
+
+def numpy_equivalents() -> dict:
+    """Map the builtin and statistics reductions to the NumPy reductions giving the same results."""
+    return {sum: np.sum, min: np.min, max: np.max, statistics.mean: np.mean, statistics.fmean: np.mean, statistics.median: np.median}
+
+
+def reducer(fn, vectorized=True):
+    """
+    Find the NumPy reduction to use in place of fn.
+
+    :param fn: the function an aggregator applies to the list of values of each key
+    :param vectorized: True to use the NumPy equivalent of fn, or a function to use instead, to be called with a 2-D
+        array and axis=1 and returning the reduction of each row
+    :raises ImportError: if NumPy is not installed
+    :raises ValueError: if vectorized is True and fn has no known NumPy equivalent
+    :return: a function taking a 2-D array and axis=1
+    """
+    require_numpy()
+    if callable(vectorized):
+        return vectorized
+    if isinstance(fn, np.ufunc):
+        return fn.reduce
+    try:
+        equivalent = numpy_equivalents().get(fn)
+    except TypeError:  # unhashable callables have no equivalent
+        equivalent = None
+    if equivalent is not None:
+        return equivalent
+    if getattr(fn, "__module__", None) == "numpy":
+        return fn
+    raise ValueError(f"No NumPy equivalent is known for {fn!r}, pass the reduction to use as vectorized")
+
+
+def is_numeric(values) -> bool:
+    """Check whether every value is a plain number that NumPy can pack into an array without boxing it."""
+    return all(type(value) in NUMERIC_TYPES or (isinstance(value, Real) and isinstance(value, np.generic)) for value in values)
+
+
+def has_floats(values) -> bool:
+    """Check whether any of the numeric values is a float, which would make an array of them all floats."""
+    return any(isinstance(value, float | np.floating) for value in values)
+
+
+def reduce_rows(reduce, rows: dict) -> dict:
+    """
+    Reduce the values of several keys at once.
+
+    :param reduce: a function taking a 2-D array and axis=1, as given by reducer()
+    :param rows: a dict mapping each key to the list of its values, every list being the same length
+    :return: a dict mapping each key to its result as a Python number, missing any keys whose values could not be
+        packed into a numeric array, such as integers too large for 64 bits, or whose result might not fit in 64 bits,
+        see exact_rows()
+    """
+    if not rows:
+        return {}
+    try:
+        array = np.array(list(rows.values()))
+    except OverflowError:
+        return {}
+    if array.dtype.kind not in ARRAY_KINDS:
+        return {}
+    keys = list(rows)
+    if array.dtype.kind in "biu":
+        exact = exact_rows(reduce, array)
+        if not all(exact):
+            keys = [key for key, fits in zip(keys, exact, strict=True) if fits]
+            array = array[exact]
+            if not keys:
+                return {}
+    return dict(zip(keys, np.asarray(reduce(array, axis=1)).tolist(), strict=True))
+
+
+def exact_rows(reduce, array) -> list:
+    """
+    Check which rows of an array of integers reduce without wrapping around, as 64 bit integers do silently.
+
+    A row is exact if its largest magnitude times its length is below 2**63, as then its sum and every partial sum are,
+    or for a product if its largest magnitude to the power of its length certainly is.  Reductions other than sums and
+    products, such as min, max or a reduction given as vectorized, are assumed to grow no faster than sums.
+
+    :return: a list of bools, one per row
+    """
+    width = array.shape[1]
+    magnitudes = [max(abs(high), abs(low)) for high, low in zip(array.max(axis=1).tolist(), array.min(axis=1).tolist(), strict=True)]
+    if reduce in (np.prod, np.nanprod, np.multiply.reduce):
+        return [magnitude <= 1 or magnitude.bit_length() * width <= 63 for magnitude in magnitudes]
+    return [magnitude * width < 2**63 for magnitude in magnitudes]
@@ -3,4 +3,5 @@ __author__ = "Andy Fundinger"
 from .core import Aggregator as Aggregator
 from .core import FlockDict as FlockDict
 from .core import MetaAggregator as MetaAggregator
+from .frame import FlockFrame as FlockFrame
 from .util import FlockException as FlockException
@@ -0,0 +1,434 @@
+"""
+The standard benchmark suite, run with the ``flock-bench`` console script.
+
+Each benchmark builds what it needs, untimed, then times a single run of the operation it measures, repeating both
+several times.  The sizes of the models built are multiplied by ``--scale``.  Results are printed as a table and can be
+written as JSON with ``--output``, including the Python version and git commit they were taken at, so that runs on
+different commits can be compared with ``--compare``::
+
+    flock-bench --output before.json
+    git switch my-branch
+    flock-bench --compare before.json --threshold 1.2
+
+Construction should scale linearly, which can be checked by running the construction benchmarks at several scales, e.g.
+``flock-bench construction list_append --scale 10``, and comparing the time per element.
+
+The mythica benchmarks need the examples directory of a source checkout, found next to ``src`` or given with
+``--examples``, and are skipped without it.  mythica_reload and mythica_restore compare loading saved characters by
+rebuilding them from their pickled data, as the example's load_character() does, with restoring them from a snapshot.
+mythica_fork asks what if a character were another level by forking it, for comparison with building it at that level
+as mythica does.
+"""
+
+import argparse
+import gc
+import json
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+from collections.abc import Callable
+from contextlib import contextmanager
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+
+from closure_collector.snapshot import restore, snapshot
+from closure_collector.util import takes_no_arguments
+from flock.core import FlockAggregator, FlockDict, FlockList, SourceList
+
+__author__ = "Andy Fundinger"
+
+EXAMPLES = Path(__file__).resolve().parents[2] / "examples"
+
+
+class Skipped(Exception):
+    """Raised by a benchmark that cannot run here, such as one needing the examples directory."""
+
+
+def scaled(size: int, scale: float) -> int:
+    """A benchmark's size multiplied by the scale, at least 1."""
+    return max(1, int(size * scale))
+
+
+@contextmanager
+def recursion_limit(depth: int):
+    """Raise the recursion limit, if need be, for reading a chain of depth rules each read from inside the next."""
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 10 * depth + 1000))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def rules(size: int) -> FlockDict:
+    """A flock of size data keys, each with a rule doubling it, the most common shape of a model."""
+    flock = FlockDict({f"data_{x}": x for x in range(size)})
+    for x in range(size):
+        flock[f"rule_{x}"] = (lambda key: lambda: flock[key] * 2)(f"data_{x}")
+    return flock
+
+
+def warmed(flock: FlockDict) -> FlockDict:
+    """Shear flock once, so that every value is cached."""
+    flock.shear()
+    return flock
+
+
+def construction(size: int) -> Callable:
+    """Build a FlockDict from a mapping of data and nested mappings."""
+    data = {f"key_{x}": {"value": x} if x % 2 else x for x in range(size)}
+    return lambda: FlockDict(data)
+
+
+def construction_by_key(size: int) -> Callable:
+    """Build a FlockDict key by key through __setitem__, as code filling in a model one key at a time does."""
+    data = {f"key_{x}": x for x in range(size)}
+
+    def run():
+        flock = FlockDict()
+        for key, value in data.items():
+            flock[key] = value
+
+    return run
+
+
+def list_construction(size: int) -> Callable:
+    """Build a FlockList from a list of data."""
+    data = list(range(size))
+    return lambda: FlockList(data)
+
+
+def list_append(size: int) -> Callable:
+    """Build a FlockList through append()."""
+    data = list(range(size))
+
+    def run():
+        flock = FlockList()
+        for value in data:
+            flock.append(value)
+
+    return run
+
+
+def double(value, factor):
+    """A rule function to be bound into partials."""
+    return value * factor
+
+
+def model_values(size: int) -> dict:
+    """A mix of rules and data like that loaded from a YAML model: a third each lambdas, partials and constants."""
+    flock = FlockDict()
+    values: dict = {}
+    for x in range(size):
+        if x % 3 == 0:
+            values[f"key_{x}"] = (lambda key: lambda: flock[key])(f"key_{x - 1}")
+        elif x % 3 == 1:
+            values[f"key_{x}"] = partial(double, x, 2)
+        else:
+            values[f"key_{x}"] = x
+    return values
+
+
+def classify_values(size: int) -> Callable:
+    """Classify values as rules or data as every assignment does: lambdas, partials, bound methods and constants."""
+    values = [*model_values(size).values(), *(FlockDict().clear_cache for _ in range(size // 10))]
+    return lambda: [takes_no_arguments(value) for value in values]
+
+
+def rule_construction(size: int) -> Callable:
+    """Build a FlockDict that is two thirds rules, see model_values()."""
+    values = model_values(size)
+    return lambda: FlockDict(values)
+
+
+def point_reads(size: int) -> Callable:
+    """Read every rule of a warm flock, one key at a time."""
+    flock = warmed(rules(size))
+    keys = [f"rule_{x}" for x in range(size)]
+    return lambda: [flock[key] for key in keys]
+
+
+def cold_shear(size: int) -> Callable:
+    """Shear a flock that has computed nothing yet."""
+    return rules(size).shear
+
+
+def warm_shear(size: int) -> Callable:
+    """Shear a flock again without any changes."""
+    return warmed(rules(size)).shear
+
+
+def invalidation(size: int) -> Callable:
+    """Write each data key of a warm flock in turn, reading back the one rule that depends on it."""
+    flock = warmed(rules(size))
+
+    def run():
+        for x in range(size):
+            flock[f"data_{x}"] = x + 1
+            flock[f"rule_{x}"]
+
+    return run
+
+
+def aggregator_fan_in(size: int) -> Callable:
+    """Shear a FlockAggregator summing each key across size sources of ten keys each."""
+    sources = [FlockDict({f"key_{x}": x * source for x in range(10)}) for source in range(size)]
+    return FlockAggregator(SourceList(sources), sum).shear
+
+
+def deep_chain(size: int) -> Callable:
+    """Write the head of a warm chain of size rules, each reading the one before, then read its tail."""
+    flock = FlockDict({"link_0": 0})
+    for x in range(1, size):
+        flock[f"link_{x}"] = (lambda key: lambda: flock[key] + 1)(f"link_{x - 1}")
+    tail = f"link_{size - 1}"
+    with recursion_limit(size):
+        flock[tail]
+
+    def run():
+        with recursion_limit(size):
+            flock["link_0"] += 1
+            flock[tail]
+
+    return run
+
+
+def wide_fanout(size: int) -> Callable:
+    """Write the one data key that size rules all read, then shear them."""
+    flock = FlockDict({"root": 0})
+    for x in range(size):
+        flock[f"leaf_{x}"] = (lambda x: lambda: flock["root"] + x)(x)
+    warmed(flock)
+
+    def run():
+        flock["root"] += 1
+        flock.shear()
+
+    return run
+
+
+def import_mythica(examples: Path):
+    """Import the model of the mythica example from the examples directory, raising Skipped if it is not there."""
+    if not (examples / "mythica" / "model.py").exists():
+        raise Skipped(f"the mythica example was not found in {examples}")
+    limit = sys.getrecursionlimit()
+    sys.path.insert(0, str(examples))
+    try:
+        import mythica.model as model  # type: ignore[import-not-found]
+    finally:
+        sys.path.remove(str(examples))
+        sys.setrecursionlimit(limit)  # lowered by the model
+    return model
+
+
+def mythica_character(model) -> FlockDict:
+    """A character sheet like that of the mythica example's main(), with a few skills of each kind."""
+    return FlockDict(
+        {
+            "base_stats": {
+                "Combat Skill": 13,
+                "Dexterity": 16,
+                "Health": 11,
+                "Intelligence": 18,
+                "Magic": 17,
+                "Perception": 20,
+                "Presence": 11,
+                "Speed": 13,
+                "Spirit": 10,
+                "Strength": 10,
+                "Luck": 10,
+            },
+            "practice_sessions": {"Combat Skill": 9, "Dexterity": 2},
+            "skills": [
+                model.Skill("Appraisal", model.MENTAL),
+                model.Skill("Tumbling", model.PHYSICAL, 2),
+                model.Skill("Stiletto", model.WEAPON, 2),
+                model.Skill("Dust Bolt", model.SPELL, xp=1),
+                model.HeroicSkill("Nimble", model.HEROIC, 2, bonuses={"Dodge": 1, "Parry": 1}),
+                model.Conduit(cost=5),
+            ],
+            "Race": "Human",
+            "level": 8,
+        }
+    )
+
+
+def mythica(size: int, examples: Path = EXAMPLES) -> Callable:
+    """Build the characters of the mythica example, apply its rules to them and shear them, size characters a run."""
+    model = import_mythica(examples)
+    return lambda: [model.apply_rules(mythica_character(model)).shear() for _ in range(size)]
+
+
+def mythica_reload(size: int, examples: Path = EXAMPLES) -> Callable:
+    """Load size mythica characters as load_character() does, unpickling their sheared data and applying the rules again."""
+    model = import_mythica(examples)
+    saved = pickle.dumps(model.apply_rules(mythica_character(model)).shear())
+    return lambda: [model.apply_rules(FlockDict(pickle.loads(saved))).shear() for _ in range(size)]
+
+
+def mythica_restore(size: int, examples: Path = EXAMPLES) -> Callable:
+    """Restore size sheared mythica characters from a snapshot, for comparison with mythica_reload."""
+    model = import_mythica(examples)
+    character = model.apply_rules(mythica_character(model))
+    character.shear()
+    saved = BytesIO()
+    snapshot(character, saved)
+    return lambda: [restore(BytesIO(saved.getvalue())).shear() for _ in range(size)]
+
+
+def mythica_fork(size: int, examples: Path = EXAMPLES) -> Callable:
+    """Fork a sheared mythica character size times, changing the level of each fork and shearing its points."""
+    model = import_mythica(examples)
+    character = model.apply_rules(mythica_character(model))
+    character.shear()
+
+    def run():
+        for level in range(size):
+            scenario = character.fork()
+            scenario["level"] = level
+            scenario["points"].shear()
+
+    return run
+
+
+# Each benchmark, with its size at a scale of 1
+BENCHMARKS: dict = {
+    "construction": (construction, 10_000),
+    "construction_by_key": (construction_by_key, 10_000),
+    "list_construction": (list_construction, 10_000),
+    "list_append": (list_append, 10_000),
+    "classify_values": (classify_values, 10_000),
+    "rule_construction": (rule_construction, 10_000),
+    "point_reads": (point_reads, 10_000),
+    "cold_shear": (cold_shear, 2_000),
+    "warm_shear": (warm_shear, 2_000),
+    "invalidation": (invalidation, 2_000),
+    "aggregator_fan_in": (aggregator_fan_in, 200),
+    "deep_chain": (deep_chain, 100),
+    "wide_fanout": (wide_fanout, 2_000),
+    "mythica": (mythica, 5),
+    "mythica_reload": (mythica_reload, 5),
+    "mythica_restore": (mythica_restore, 5),
+    "mythica_fork": (mythica_fork, 5),
+}
+
+# The benchmarks needing the examples directory
+EXAMPLE_BENCHMARKS = (mythica, mythica_reload, mythica_restore, mythica_fork)
+
+
+def measure(setup: Callable, size: int, repeat: int) -> list:
+    """Time repeat runs of a benchmark, building each afresh with garbage collection off while it runs."""
+    times = []
+    for _ in range(repeat):
+        run = setup(size)
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter()
+            run()
+            times.append(perf_counter() - start)
+        finally:
+            gc.enable()
+    return times
+
+
+def commit() -> str | None:
+    """The git commit of the source checkout being benchmarked, if there is one."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(names: list, scale: float = 1, repeat: int = 5, examples: Path = EXAMPLES) -> dict:
+    """
+    Run benchmarks, giving results as written by --output.
+
+    :param names: the names of the benchmarks to run, from BENCHMARKS
+    :return: a dict of details of the run, with the timings of each benchmark in seconds under "benchmarks"
+    """
+    results: dict = {}
+    for name in names:
+        setup, size = BENCHMARKS[name]
+        size = scaled(size, scale)
+        if setup in EXAMPLE_BENCHMARKS:
+            setup = partial(setup, examples=examples)
+        try:
+            times = measure(setup, size, repeat)
+        except Skipped as e:
+            results[name] = {"size": size, "skipped": str(e)}
+            continue
+        results[name] = {"size": size, "times": times, "min": min(times), "median": statistics.median(times), "mean": statistics.mean(times)}
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "repeat": repeat,
+        "benchmarks": results,
+    }
+
+
+def report(results: dict, baseline: dict | None = None) -> list:
+    """
+    Format results as table rows, comparing the best time of each benchmark with that in baseline.
+
+    :return: the rows, as strings
+    """
+    rows = [f"{'benchmark':<20}{'size':>8}{'min (ms)':>12}{'median (ms)':>14}" + (f"{'baseline':>12}{'ratio':>8}" if baseline else "")]
+    for name, result in results["benchmarks"].items():
+        if "skipped" in result:
+            rows.append(f"{name:<20}{result['size']:>8}  skipped: {result['skipped']}")
+            continue
+        row = f"{name:<20}{result['size']:>8}{result['min'] * 1e3:>12.3f}{result['median'] * 1e3:>14.3f}"
+        before = (baseline or {}).get("benchmarks", {}).get(name, {})
+        if "min" in before:
+            row += f"{before['min'] * 1e3:>12.3f}{result['min'] / before['min']:>7.2f}x"
+        rows.append(row)
+    return rows
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """The names of the benchmarks whose best time is more than threshold times their best time in baseline."""
+    return [
+        name
+        for name, result in results["benchmarks"].items()
+        if "min" in result and "min" in baseline["benchmarks"].get(name, {}) and result["min"] > threshold * baseline["benchmarks"][name]["min"]
+    ]
+
+
+def main(argv: list | None = None) -> int:
+    """Run the benchmark suite from the command line, returning 1 if any benchmark regressed past --threshold."""
+    parser = argparse.ArgumentParser(prog="flock-bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, all by default, from: {', '.join(BENCHMARKS)}", metavar="name")
+    parser.add_argument("--scale", type=float, default=1, help="multiply the size of every benchmark by this")
+    parser.add_argument("--repeat", type=int, default=5, help="times to run each benchmark")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, help="with --compare, fail if a benchmark takes more than this times as long")
+    parser.add_argument("--examples", type=Path, default=EXAMPLES, help="the examples directory, for the mythica benchmark")
+    args = parser.parse_intermixed_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = run_suite(args.names or list(BENCHMARKS), args.scale, args.repeat, args.examples)
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print("\n".join(report(results, baseline)))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if baseline and args.threshold:
+        slower = regressions(results, baseline, args.threshold)
+        if slower:
+            print(f"Slower than {args.threshold}x the baseline: {', '.join(slower)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
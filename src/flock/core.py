@@ -1,4 +1,3 @@
-import inspect
 import warnings
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict, defaultdict
@@ -9,10 +8,22 @@ from collections.abc import (
     MutableSequence,
     Sequence,
 )
+from concurrent.futures import Executor
 from copy import copy
-
-from closure_collector.core import CCBase, DynamicClosureCollector
-from closure_collector.util import is_rule
+from functools import wraps
+from itertools import chain
+
+from closure_collector import aio
+from closure_collector.cache import CachePolicy
+from closure_collector.compiler import CompiledRules
+from closure_collector.core import CCBase, DynamicClosureCollector, ShearedBase
+from closure_collector.dependencies import KEYS, evaluate, record_read, record_volatile
+from closure_collector.fork import Fork
+from closure_collector.metrics import Metrics, find_root
+from closure_collector.parallel import parallel_shear
+from closure_collector.tracing import Trace
+from closure_collector.util import CONSTANT_TYPES, Constant, is_rule, takes_no_arguments
+from closure_collector.vectorized import has_floats, is_numeric, reduce_rows, reducer
 from flock.util import FlockException
 
 __author__ = "Andy Fundinger"
@@ -28,6 +39,50 @@ __author__ = "Andy Fundinger"
 """
 
 
+class _Sheared:
+    """Sentinel cache key for the sheared form of a flock, paired with the record_errors flag it was built with."""
+
+    def __repr__(self):
+        return "SHEARED"
+
+    def __reduce__(self):
+        return "SHEARED"
+
+
+SHEARED = _Sheared()
+
+
+class _Reduced:
+    """Sentinel cache key for the results of a vectorized aggregator, reduced for every numeric key at once."""
+
+    def __repr__(self):
+        return "REDUCED"
+
+    def __reduce__(self):
+        return "REDUCED"
+
+
+REDUCED = _Reduced()
+
+
+def copy_sheared(sheared):
+    """
+    Copy the dicts, lists and ShearedBase objects making up a sheared form, leaving the values in them shared.
+
+    Sheared forms are cached and shared by later shears, so shear() returns a copy that its caller is free to change.
+    """
+    kind = type(sheared)
+    if kind is list:
+        return [copy_sheared(value) for value in sheared]
+    if kind is dict or kind is OrderedDict:
+        return kind((key, copy_sheared(value)) for key, value in sheared.items())
+    if kind is ShearedBase:
+        copied = ShearedBase()
+        copied.__dict__.update((name, copy_sheared(value)) for name, value in sheared.__dict__.items())
+        return copied
+    return sheared
+
+
 class FlockBase(CCBase, Mapping, metaclass=ABCMeta):
     @abstractmethod
     def check(self, path: list[str] | None = None) -> dict:
@@ -71,9 +126,9 @@ class FlockBase(CCBase, Mapping, metaclass=ABCMeta):
 class MutableFlock(FlockBase, DynamicClosureCollector):
     """The abstract base class for flocks with items that can be set"""
 
-    def __init__(self, root=None):
+    def __init__(self, root=None, lazy=False, cache_policy=None):
         """Initialize the object."""
-        super().__init__()
+        super().__init__(lazy=lazy, cache_policy=cache_policy)
 
     @abstractmethod
     def __setitem__(self, key, val):
@@ -98,26 +153,28 @@ class MutableFlock(FlockBase, DynamicClosureCollector):
         "Reminder to implement Mapping"
 
     def make_callable(self, value):
-        if callable(value) and len(inspect.signature(value).parameters) == 0:
+        if type(value) in CONSTANT_TYPES:
+            return Constant(value)
+        if takes_no_arguments(value):
             ret = value
             # if it's a closure and there is something in there
-            if hasattr(value, "__closure__") and value.__closure__:
+            if getattr(value, "__closure__", None):
                 for closure in value.__closure__:
                     if isinstance(closure.cell_contents, DynamicClosureCollector):
                         closure.cell_contents.peers.add(self)
         elif isinstance(value, Mapping):
-            ret = FlockDict(value, root=self.root if self.root is not None else self)
+            ret = FlockDict(value, root=self.root if self.root is not None else self, lazy=self.lazy, cache_policy=self.cache_policy)
         else:
-            ret = lambda: value
+            ret = Constant(value)
         return ret
 
 
 class PromiseFlock(MutableFlock):
     """A convenience class for default implementations of methods from MutableFlock"""
 
-    def __init__(self, root=None):
+    def __init__(self, root=None, lazy=False, cache_policy=None):
         """Initialize the object."""
-        super().__init__(root=root)
+        super().__init__(root=root, lazy=lazy, cache_policy=cache_policy)
         self.promises = {}
 
     def __setitem__(self, key, val):
@@ -130,8 +187,12 @@ class PromiseFlock(MutableFlock):
         Mappings are converted into MutableFlocks, any other handling should be dealt with via direct access to the promises dict.
         """
         value = self.make_callable(val)
+        is_new = key not in self.promises
         self.promises[key] = value
-        self.clear_cache()
+        if is_new:
+            self.invalidate(key, KEYS)
+        else:
+            self.invalidate(key)
 
     def __getitem__(self, key):
         """
@@ -140,25 +201,158 @@ class PromiseFlock(MutableFlock):
         :type key: any hashable type
         :return: the value of the lamba when executed
         """
-        if key in self.cache:
+        record_read(self, key)
+        if self.is_cached(key):
             return self.cache[key]
         else:
             promise = self.promises[key]
+            if type(promise) is Constant:
+                return promise.value
             try:
-                ret = promise()
+                return self.compute(key, promise)
             except Exception as e:
                 raise FlockException(f"Error calculating key:{key}") from e
-            self.cache[key] = ret
-            return ret
+
+    async def aget(self, key):
+        """
+        Access values by key, awaiting the value if its promise is a coroutine function.
+
+        The value is cached just as __getitem__() caches it, after which it can also be read synchronously.
+
+        :return: the value of the promise
+        """
+        record_read(self, key)
+        if self.is_cached(key):
+            return self.cache[key]
+        promise = self.promises[key]
+        if type(promise) is Constant:
+            return promise.value
+        try:
+            return await self.acompute(key, promise)
+        except Exception as e:
+            raise FlockException(f"Error calculating key:{key}") from e
+
+    async def ashear(self, record_errors: bool = False):
+        """
+        Shear this flock, awaiting every coroutine promise in it and in the flocks nested in it concurrently.
+
+        Args:
+            record_errors (bool): as for shear()
+
+        Returns:
+            the same value shear() gives, see closure_collector.aio
+        """
+        return await aio.ashear(self, record_errors=record_errors)
+
+    def fork(self):
+        """
+        Fork this flock, with the tree it belongs to, to try out changes without copying it, see closure_collector.fork.
+
+        The fork shares the rules and cached values of this flock until keys are overridden in it, after which only the
+        values computed from those keys are computed again, in the fork.  This flock is left untouched.
+
+        Returns:
+            the view of this flock in a new fork, a flock of the same type
+        """
+        return Fork(self).view(self)
+
+    def metrics(self) -> Metrics:
+        """
+        Record the metrics of the keys read while the Metrics returned is in use as a context manager, see
+        closure_collector.metrics.
+
+        Only the keys of the tree this flock belongs to are recorded, from its root down, on every thread.
+
+        Returns:
+            a Metrics, whose table() and rows() give what was recorded
+        """
+        return Metrics(root=find_root(self))
+
+    def trace(self, path=None) -> Trace:
+        """
+        Trace the evaluations made while the Trace returned is in use as a context manager, see closure_collector.tracing.
+
+        Only the evaluations of the tree this flock belongs to are traced, from its root down, on every thread.
+
+        Args:
+            path: the file to write the trace to, as Chrome trace event JSON, when the block exits
+
+        Returns:
+            a Trace, whose spans can also be written with write()
+        """
+        return Trace(path, root=find_root(self))
+
+    @abstractmethod
+    def build_shear(self, record_errors: bool = False):
+        """Build the sheared form of this flock from scratch, reusing only the sheared forms of nested flocks."""
+
+    @abstractmethod
+    def shear_keys(self) -> Iterable:
+        """The keys of this flock in the order shear() visits them."""
+
+    @abstractmethod
+    def sheared_items(self, keys: Iterable, record_errors: bool = False):
+        """Shear the items with the given keys, yielding (key, sheared value) pairs in the order of keys."""
+
+    def cached_shear(self, record_errors: bool = False):
+        """
+        Get the sheared form of this flock, reusing the last one built while nothing it read has changed.
+
+        Building is tracked like any other evaluation, so a write only drops the sheared forms of the flocks on its path
+        to the root, and rebuilding them reuses the sheared forms of every nested flock that did not change.  Sheared
+        forms that read anything whose changes are not tracked, such as an aggregator over plain lists, are built afresh
+        every time.  The value returned is shared with later calls and must not be modified, shear() returns a copy.
+
+        Args:
+            record_errors (bool): as for shear()
+
+        Returns:
+            the sheared form of this flock, as built by build_shear()
+        """
+        key = (SHEARED, record_errors)
+        record_read(self, key)
+        if self.is_cached(key):
+            return self.cache[key]
+        return self.compute(key, lambda: self.build_shear(record_errors))
+
+    def iter_shear(self, record_errors: bool = False, path: tuple = ()):
+        """
+        Walk this flock in the order of shear(), yielding each leaf of its sheared form as it is read.
+
+        Nothing is assembled, so a large flock can be exported with memory bounded by its depth rather than its size.
+        Nested flocks, aggregators and collectors are walked in turn, anything else is a leaf sheared as shear() would.
+        A flock with no keys, at any depth, is a leaf holding an empty dict or list so that the tree can be rebuilt.
+
+        Args:
+            record_errors (bool): as for shear()
+            path (tuple): the keys leading to this flock, prepended to every path yielded
+
+        Yields:
+            tuple: (path, value) pairs, path being a tuple of the keys leading to the value
+        """
+        keys = self.shear_keys()
+        if not keys:
+            yield path, [] if isinstance(self, Sequence) else {}
+            return
+        for key in keys:
+            promise = self.promises[key]
+            if hasattr(promise, "iter_shear"):
+                yield from promise.iter_shear(record_errors, path + (key,))
+            else:
+                for _, value in self.sheared_items([key], record_errors=record_errors):
+                    yield path + (key,), value
 
     def __contains__(self, key):
+        record_read(self, key)
         return key in self.promises
 
     def __delitem__(self, key):
         del self.promises[key]
-        self.clear_cache()
+        self.invalidate(key, KEYS)
+        self.prune_versions(self.promises)
 
     def __len__(self):
+        record_read(self, KEYS)
         return len(self.promises)
 
     def clear_cache(self):
@@ -175,32 +369,70 @@ class PromiseFlock(MutableFlock):
                 to_collect.update(curr.get_relatives())
 
         for peer in to_clear:
-            peer.cache = {}
+            if isinstance(peer, DynamicClosureCollector):
+                peer.invalidate_all()
+            else:
+                peer.cache = {}
 
 
 class FlockList(PromiseFlock, MutableSequence):
-    def __init__(self, inlist: Sequence | None = None, root: FlockBase | None = None):
+    def __init__(self, inlist: Sequence | None = None, root: FlockBase | None = None, lazy: bool = False, cache_policy: CachePolicy | None = None):
         if inlist is None:
             inlist = ()
         """
         A mutable mapping that contains lambdas which will be evaluated when indexed
 
         :type inlist: List to be used to create the new FlockList
+        :type lazy: if True validate cached values when they are read rather than invalidating them on write
+        :type cache_policy: a CachePolicy limiting the values cached, None to cache everything
 
-        Values from indict are assigned to self one at a time.
+        Values from inlist are added in a single pass, see extend().
 
         """
-        super().__init__()
+        super().__init__(lazy=lazy, cache_policy=cache_policy)
         self.promises = []
-        self.cache = {}
         self.root = root
         self.peers = set()
-        for key in inlist:
-            self.append(key)
+        self.extend(inlist)
+
+    @classmethod
+    def from_iterable(cls, values: Iterable, root: FlockBase | None = None, lazy: bool = False, cache_policy: CachePolicy | None = None):
+        """
+        Build a FlockList from any iterable in a single pass.
+
+        :param values: the values to add, converted as by append()
+        :return: a new FlockList
+        """
+        ret = cls(root=root, lazy=lazy, cache_policy=cache_policy)
+        ret.extend(values)
+        return ret
 
     def __iter__(self):
         return (self[x] for x in range(len(self)))
 
+    def normalize_index(self, index):
+        """Map negative indexes onto their positive equivalent so that each position is cached and tracked once."""
+        if isinstance(index, int) and index < 0:
+            record_read(self, KEYS)  # what a negative index refers to depends on the length
+            return index + len(self.promises)
+        return index
+
+    def __getitem__(self, index):
+        return super().__getitem__(self.normalize_index(index))
+
+    async def aget(self, index):
+        return await super().aget(self.normalize_index(index))
+
+    def __setitem__(self, index, val):
+        index = self.normalize_index(index)
+        self.promises[index] = self.make_callable(val)
+        self.invalidate(index)
+
+    def __delitem__(self, index):
+        del self.promises[index]
+        self.invalidate_all()
+        self.prune_versions(range(len(self.promises)))
+
     def insert(self, index, value):
         """
         Add value to FlockList
@@ -210,7 +442,23 @@ class FlockList(PromiseFlock, MutableSequence):
         """
         value = self.make_callable(value)
         self.promises.insert(index, value)
-        self.clear_cache()
+        self.invalidate_all()
+
+    def append(self, value):
+        """Add value to the end of the FlockList, only values that read the length are invalidated."""
+        self.extend((value,))
+
+    def extend(self, values: Iterable):
+        """
+        Add values to the end of the FlockList in a single pass, with one round of invalidation.
+
+        As nothing already in the list moves only values that read the length, or the new positions, are invalidated.
+        """
+        if values is self:
+            values = list(values)
+        start = len(self.promises)
+        self.promises.extend(self.make_callable(value) for value in values)
+        self.invalidate(KEYS, *range(start, len(self.promises)))
 
     def get_relatives(self):
         rels = {promise for promise in self.promises if hasattr(promise, "clear_cache")}
@@ -240,7 +488,7 @@ class FlockList(PromiseFlock, MutableSequence):
             assert callable(value)  # noqa: S101
         return ret
 
-    def shear(self, record_errors: bool = False):
+    def shear(self, record_errors: bool = False, executor: Executor | None = None):
         """
         Recursively convert this FlockList into a normal python dict.
 
@@ -250,29 +498,56 @@ class FlockList(PromiseFlock, MutableSequence):
         Args:
             record_errors (bool): if True any exception raised will be stored in place of the result that caused it rather
                 than continuing up the call stack
+            executor (Executor): if given, independent parts of the list are computed concurrently on this
+                concurrent.futures executor, see closure_collector.parallel
 
         Returns:
             list: a list representation of the FlockList
         """
-        ret = []
-        for key, promise in enumerate(self.promises):
-            if hasattr(promise, "shear"):
-                ret.append(promise.shear(record_errors=record_errors))
-            elif key in self.cache:
-                ret.append(self.cache[key])
+        if executor is not None:
+            return parallel_shear(self, executor, record_errors=record_errors)
+        return copy_sheared(self.cached_shear(record_errors))
+
+    def build_shear(self, record_errors: bool = False) -> list:
+        """Build the sheared form of this FlockList from scratch, reusing only the sheared forms of nested flocks."""
+        return self.assemble(self.sheared_items(self.shear_keys(), record_errors=record_errors))
+
+    def shear_keys(self) -> Iterable:
+        """The indexes of this FlockList in the order shear() visits them."""
+        record_read(self, KEYS)
+        return range(len(self.promises))
+
+    def sheared_items(self, keys: Iterable, record_errors: bool = False):
+        """
+        Shear the items at the given indexes.
+
+        Yields:
+            tuple: (index, sheared value) pairs in the order of keys
+        """
+        for key in keys:
+            promise = self.promises[key]
+            if isinstance(promise, PromiseFlock):
+                yield key, promise.cached_shear(record_errors)
+            elif hasattr(promise, "shear"):
+                if not isinstance(promise, DynamicClosureCollector):  # changes to it are not tracked
+                    record_volatile()
+                yield key, promise.shear(record_errors=record_errors)
             elif callable(promise):
                 try:
-                    ret.append(promise())
+                    yield key, self[key]
                 except Exception as e:
                     if record_errors:
-                        ret.append(e)
+                        yield key, e
                     else:
                         raise
             else:
                 warnings.warn(DeprecationWarning("Non callable in promises"))
-                ret.append(copy(promise))
-            self.cache[key] = ret[key]
-        return ret
+                yield key, copy(promise)
+
+    def assemble(self, sheared):
+        """Build the sheared form of this FlockList from (index, sheared value) pairs."""
+        sheared = dict(sheared)
+        return [sheared[key] for key in self.shear_keys()]
 
 
 class FlockDict(PromiseFlock, MutableMapping):
@@ -282,26 +557,59 @@ class FlockDict(PromiseFlock, MutableMapping):
     The actual lambdas must take 0 params and are accessible in the .promises attribute
     """
 
-    def __init__(self, indict: list[tuple] | Mapping | None = None, root=None):
+    def __init__(self, indict: list[tuple] | Mapping | None = None, root=None, lazy=False, cache_policy: CachePolicy | None = None):
         """
         A mutable mapping that contains lambdas which will be evaluated when indexed
 
         :type indict: Mapping to be used to create the new FlockDict
+        :type lazy: if True validate cached values when they are read rather than invalidating them on write, nested
+            mappings inherit this setting
+        :type cache_policy: a CachePolicy limiting the values cached, None to cache everything, nested mappings are given
+            caches following the same policy
 
-        Values from indict are assigned to self one at a time.
+        Values from indict are added in a single pass, see update().
 
         """
         if indict is None:
             indict = {}
-        super().__init__()
+        super().__init__(lazy=lazy, cache_policy=cache_policy)
         self.promises = {}
-        self.cache = {}
         self.root = root
         self.peers = set()
-        if not hasattr(indict, "items"):
-            indict = dict(indict)
-        for key, value in indict.items():  # type: ignore
-            self[key] = value
+        self.update(indict)
+
+    @classmethod
+    def from_mapping(cls, mapping: list[tuple] | Mapping, root=None, lazy=False, cache_policy: CachePolicy | None = None):
+        """
+        Build a FlockDict from a mapping, or an iterable of key, value pairs, in a single pass.
+
+        :param mapping: the items to add, converted as by __setitem__()
+        :return: a new FlockDict
+        """
+        ret = cls(root=root, lazy=lazy, cache_policy=cache_policy)
+        ret.update(mapping)
+        return ret
+
+    def update(self, other=(), /, **kwargs):
+        """
+        Set many items at once with a single round of invalidation, accepting the same arguments as dict.update().
+
+        Values are converted exactly as by __setitem__(), all of them before any is set, so that if converting any of
+        them raises nothing is changed.
+        """
+        items = other.items() if hasattr(other, "items") else other
+        converted = [(key, self.make_callable(value)) for key, value in chain(items, kwargs.items())]
+        promises = self.promises
+        changed = []
+        new_keys = False
+        for key, promise in converted:
+            new_keys = new_keys or key not in promises
+            promises[key] = promise
+            changed.append(key)
+        if new_keys:
+            changed.append(KEYS)
+        if changed:
+            self.invalidate(*changed)
 
     def get_relatives(self):
         rels = {promise for promise in self.promises.values() if hasattr(promise, "clear_cache")}
@@ -309,11 +617,9 @@ class FlockDict(PromiseFlock, MutableMapping):
         return rels
 
     def __iter__(self):
+        record_read(self, KEYS)
         return iter(self.promises)
 
-    def __len__(self):
-        return len(self.promises)
-
     def __repr__(self):
         return f"{self.__class__.__name__}({self.shear()},{self.root})"
 
@@ -340,7 +646,7 @@ class FlockDict(PromiseFlock, MutableMapping):
             assert callable(value)  # noqa: S101
         return ret
 
-    def shear(self, record_errors: bool = False):
+    def shear(self, record_errors: bool = False, executor: Executor | None = None):
         """
         Recursively convert this FlockDict into a normal python dict.
 
@@ -350,28 +656,62 @@ class FlockDict(PromiseFlock, MutableMapping):
         Args:
             record_errors (bool): if True any exception raised will be stored in place of the result that caused it rather
                 than continuing up the call stack
+            executor (Executor): if given, independent parts of the flock are computed concurrently on this
+                concurrent.futures executor, see closure_collector.parallel
 
         Returns:
             dict: a dictionary representation of the FlockDict
         """
-        ret = OrderedDict()
-        for key in sorted(self.promises, key=lambda x: (str(x), repr(x))):
+        if executor is not None:
+            return parallel_shear(self, executor, record_errors=record_errors)
+        return copy_sheared(self.cached_shear(record_errors))
+
+    def build_shear(self, record_errors: bool = False) -> OrderedDict:
+        """Build the sheared form of this FlockDict from scratch, reusing only the sheared forms of nested flocks."""
+        return OrderedDict(self.sheared_items(self.shear_keys(), record_errors=record_errors))
+
+    def shear_keys(self) -> Iterable:
+        """The keys of this FlockDict in the order shear() visits them, sorted by their str() and then repr()."""
+        record_read(self, KEYS)
+        return sorted(self.promises, key=lambda x: (str(x), repr(x)))
+
+    def sheared_items(self, keys: Iterable, record_errors: bool = False):
+        """
+        Shear the items with the given keys.
+
+        Yields:
+            tuple: (key, sheared value) pairs in the order of keys
+        """
+        for key in keys:
             promise = self.promises[key]
-            if hasattr(promise, "shear"):
-                ret[key] = promise.shear(record_errors=record_errors)
-            elif key in self.cache:
-                ret[key] = self.cache[key]
+            if isinstance(promise, PromiseFlock):
+                yield key, promise.cached_shear(record_errors)
+            elif hasattr(promise, "shear"):
+                if not isinstance(promise, DynamicClosureCollector):  # changes to it are not tracked
+                    record_volatile()
+                yield key, promise.shear(record_errors=record_errors)
             else:
                 try:
-                    ret[key] = self[key]
+                    yield key, self[key]
                 except FlockException as e:
                     if record_errors:
-                        ret[key] = e
+                        yield key, e
                     else:
                         raise
-            if not isinstance(ret, MutableMapping):
-                self.cache[key] = ret[key]
-        return ret
+
+    def assemble(self, sheared):
+        """Build the sheared form of this FlockDict from (key, sheared value) pairs, in the same order as shear()."""
+        sheared = dict(sheared)
+        return OrderedDict((key, sheared[key]) for key in self.shear_keys())
+
+    def compile(self, keys: Iterable) -> CompiledRules:
+        """
+        Compile the rules behind keys into a single generated function, for keys computed often.
+
+        :param keys: the keys to compute, each a key of this flock or a tuple of keys leading into nested FlockDicts
+        :return: a CompiledRules, call it for a dict of the current value of each key
+        """
+        return CompiledRules(self, keys)
 
     def dataset(self):
         return {k: v() for k, v in self.promises.items() if not is_rule(v)}
@@ -518,22 +858,93 @@ class MetaAggregator:
         return ret
 
 
-class FlockAggregator(FlockBase, Mapping):
-    def __init__(self, sources, fn, keys=None):
+def _changes(method):
+    """Wrap the list method method so that it calls changed() after changing the list."""
+
+    @wraps(method)
+    def changing(self, *args, **kwargs):
+        ret = method(self, *args, **kwargs)
+        self.changed()
+        return ret
+
+    return changing
+
+
+class SourceList(list):
+    """
+    The list of sources of a FlockAggregator, dropping the aggregator's cached results whenever it is changed.
+
+    A FlockAggregator given a SourceList with no owner becomes its owner.  Changes to a plain list of sources cannot be
+    seen, so results aggregated across one are never cached.
+    """
+
+    __slots__ = ("owner",)
+
+    def __init__(self, sources=(), owner=None):
+        super().__init__(sources)
+        self.owner = owner
+
+    def __reduce__(self):
+        return self.__class__, (list(self),), (None, {"owner": self.owner})
+
+    def changed(self):
+        """Drop the cached results of the aggregator this list belongs to."""
+        if self.owner is not None:
+            self.owner.invalidate_all()
+
+    append = _changes(list.append)
+    extend = _changes(list.extend)
+    insert = _changes(list.insert)
+    remove = _changes(list.remove)
+    pop = _changes(list.pop)
+    clear = _changes(list.clear)
+    sort = _changes(list.sort)
+    reverse = _changes(list.reverse)
+    __setitem__ = _changes(list.__setitem__)
+    __delitem__ = _changes(list.__delitem__)
+    __iadd__ = _changes(list.__iadd__)
+    __imul__ = _changes(list.__imul__)
+
+
+class FlockAggregator(FlockBase, DynamicClosureCollector):
+    def __init__(self, sources, fn, keys=None, lazy=False, vectorized=False):
         """
         Aggregate across parallel maps.
 
+        Results are cached per key, and dropped when anything they read in the sources changes.  This relies on every
+        source being a flock or other DynamicClosureCollector, held in a SourceList, a tuple or a flock, see
+        is_tracked(); results read from other sources are not cached.  A plain list is used as given, so changes to it
+        are always seen, but its results are never cached; give a SourceList instead to cache them and drop them
+        whenever the list is changed.
+
+        A vectorized aggregator reduces every key whose values are all plain numbers with NumPy, in one call for all the
+        keys found in the same number of sources, and applies fn as usual to any other key.  The results are computed
+        together, so a change to any numeric value recomputes all of them.  They are given as Python numbers, but may
+        differ from fn's: means are always floats and floats are summed pairwise.  Integers are only reduced with NumPy
+        when their results certainly fit in 64 bits, and otherwise with fn.
+        Results are only computed together while the aggregator is tracked, see is_tracked().
+
         Args:
             sources (list | Mapping | callable): one of:
                 - list of sources to aggregate across, each source should be a map,
                   generally a dict, or FlockDict, not all keys need to be present in all sources.
+                  A SourceList or tuple is needed for results to be cached.
                 - Mapping the values in sources are used as the list above, keys are ignored
                 - a callable that returns the list of sources
                 Precedence is Mapping, callable, then list
             fn (callable): function must take a generator, there is no constraint on the return value
             keys (set | None): optional set of keys to aggregate across
+            lazy (bool): if True validate cached results when they are read, as a lazy flock does, for use with lazy
+                sources
+            vectorized (bool | callable): True to reduce numeric values with the NumPy equivalent of fn, which may be
+                sum, min, max, statistics.mean, fmean or median, a NumPy ufunc such as numpy.add, or a NumPy reduction
+                such as numpy.prod, or else the reduction to use, called with a 2-D array and axis=1.  Requires NumPy.
         """
+        super().__init__(lazy=lazy)
+        self.reduce = reducer(fn, vectorized) if vectorized else None
         ##TODO:  Allow lists as arguments
+        if isinstance(sources, SourceList) and sources.owner is None:
+            sources.owner = self
         self.sources = sources
         self.function = fn
         if keys is not None and not callable(keys):
@@ -542,7 +953,7 @@ class FlockAggregator(FlockBase, Mapping):
 
     def __getitem__(self, key: str):
         """
-        Perform the aggregation for the given key across all the sources.
+        Perform the aggregation for the given key across all the sources, or reuse the cached result.
 
         Args:
             key (str): key to aggregate
@@ -550,8 +961,67 @@ class FlockAggregator(FlockBase, Mapping):
         Returns:
             Any: value as returned by the function for that key.
         """
+        record_read(self, key)
+        if self.is_cached(key):
+            return self.cache[key]
+        if not self.is_tracked():  # whatever reads this key must see what it reads in turn
+            self.read_untracked()
+            return self.aggregate(key, [source for source in self.get_sources() if key in source])
+        return self.compute(key, lambda: self.compute_key(key))
+
+    def fork_view(self, fork):
+        """Make the view of this Aggregator in fork, aggregating across the views of its sources with its function rebound."""
+        view = super().fork_view(fork)
+        view.function = fork.rebound(self.function)
+        if callable(self.source_keys):
+            view.source_keys = fork.rebound(self.source_keys)
+        if isinstance(self.sources, SourceList):
+            view.sources = SourceList(map(fork.rebound, self.sources), owner=view)
+        elif isinstance(self.sources, list | tuple):
+            view.sources = type(self.sources)(map(fork.rebound, self.sources))
+        else:
+            view.sources = fork.rebound(self.sources)
+        return view
+
+    def compute_key(self, key):
+        """Aggregate key, taking its result from the vectorized results when it has one."""
+        if self.reduce is not None:
+            reduced = self.reduced()
+            if key in reduced:
+                return reduced[key]
+        return self.aggregate(key, self.sources_for(key))
+
+    def reduced(self) -> dict:
+        """The results of every key whose values are all numeric, cached under REDUCED."""
+        record_read(self, REDUCED)
+        if self.is_cached(REDUCED):
+            return self.cache[REDUCED]
+        return self.store(REDUCED, *evaluate(self, REDUCED, self.reduce_all))
+
+    def reduce_all(self) -> dict:
+        """
+        Reduce every key whose values are all numeric with NumPy, grouping the keys by the number of sources they are in
+        and whether any of their values are floats, so that integers are not reduced as floats.
+
+        Keys whose values cannot be read are left out, to raise their errors when aggregated on their own.
+        """
+        groups: dict = {}
+        for key in self:
+            try:
+                values = [source[key] for source in self.sources_for(key)]
+            except Exception:
+                continue
+            if values and is_numeric(values):
+                groups.setdefault((len(values), has_floats(values)), {})[key] = values
+        results: dict = {}
+        for rows in groups.values():
+            results.update(reduce_rows(self.reduce, rows))
+        return results
+
+    def aggregate(self, key, sources):
+        """Apply the function to the values of key in sources, the sources that have it."""
         try:
-            cross_items = [source[key] for source in self.get_sources() if key in source]
+            cross_items = [source[key] for source in sources]
             if not cross_items:
                 raise KeyError(f"Key {key} not found")
             return self.function(cross_items)
@@ -562,8 +1032,112 @@ class FlockAggregator(FlockBase, Mapping):
                 f"Error Calculating {key}:  " + str(e) + "\n" + ",".join(f"{source}:{source[key]}" for source in self.get_sources() if key in source)
             ) from e
 
+    def is_tracked(self) -> bool:
+        """
+        Check whether every change to what this aggregator reads is tracked, so that its results can be cached.
+
+        That is, whether its sources are held in a SourceList it owns, a tuple or a flock, or given by a function
+        returning a SourceList or a flock, and are all flocks or other DynamicClosureCollectors, any aggregators among
+        them being tracked themselves.  A plain list, or a function returning any other collection, may have changed
+        since without this aggregator being told, so its results are never cached.  Lazy sources do not push their changes, so they are only tracked
+        if this aggregator is lazy and checks them itself.
+        """
+        found = self.observed()
+        return found is not None and all(self.is_tracked_source(source) for source in found)
+
+    def observed(self) -> list | None:
+        """
+        The collectors this aggregator reads, if the collection of its sources is tracked, otherwise None.
+
+        That is, if its sources are held in a SourceList it owns, a tuple or a flock, or given by a function returning a
+        SourceList or a flock, in which case that flock is included.
+        """
+        if isinstance(self.sources, SourceList) and self.sources.owner is not self:
+            return None
+        if isinstance(self.sources, SourceList | tuple | DynamicClosureCollector):
+            return list(self.get_sources())
+        if callable(self.sources):
+            sources = self.get_sources()
+            if isinstance(sources, SourceList) and sources.owner is not None:
+                return list(sources)
+            if isinstance(sources, Mapping | Sequence) and isinstance(sources, DynamicClosureCollector):
+                return [sources, *(sources.values() if isinstance(sources, Mapping) else sources)]
+        return None
+
+    def read_untracked(self):
+        """
+        Note that this aggregator was read while untracked.
+
+        Whatever reads it records the reads of its sources in turn, and so can be cached as long as the sources are all
+        DynamicClosureCollectors in a tracked collection, otherwise it is volatile, see dependencies.record_volatile().
+        """
+        found = self.observed()
+        if found is None or not all(isinstance(source, DynamicClosureCollector) for source in found):
+            record_volatile()
+
+    def is_tracked_source(self, source) -> bool:
+        """Check whether every change to source is pushed to, or for a lazy aggregator checked by, this aggregator."""
+        return (
+            isinstance(source, DynamicClosureCollector) and (self.lazy or not source.lazy) and (not isinstance(source, FlockAggregator) or source.is_tracked())
+        )
+
+    def index(self) -> dict:
+        """
+        Map every key in any source to the list of sources that have it, in the order of the sources.
+
+        The index is cached under KEYS while the aggregator is tracked, and rebuilt only once a source gains or loses
+        keys or the sources themselves change.  Results computed through the index are dropped along with it.
+        """
+        index = self.tracked_index()
+        return self.build_index() if index is None else index
+
+    def tracked_index(self) -> dict | None:
+        """
+        The index, see index(), if it can be cached, otherwise None.
+
+        An untracked aggregator cannot tell when its index would go stale, so rather than building an index to use it
+        once, lookups scan the sources for just what they need.
+        """
+        record_read(self, KEYS)
+        if self.is_cached(KEYS):
+            return self.cache[KEYS]
+        if not self.is_tracked():
+            self.read_untracked()
+            return None
+        return self.store(KEYS, *evaluate(self, KEYS, self.build_index))
+
+    def build_index(self) -> dict:
+        """Build the index of keys to sources by scanning every source."""
+        index: dict = {}
+        for source in self.get_sources():
+            for key in source.keys():
+                index.setdefault(key, []).append(source)
+        return index
+
+    def source_keys_found(self) -> dict:
+        """Every key in any source, as the keys of a dict in the order of the sources, found by scanning them."""
+        return dict.fromkeys(key for source in self.get_sources() for key in source.keys())
+
+    def sources_for(self, key) -> list:
+        """The sources that have key, without checking each source while the index is cached."""
+        index = self.tracked_index()
+        if index is None:
+            return [source for source in self.get_sources() if key in source]
+        return index.get(key, [])
+
+    def __contains__(self, key):
+        if self.source_keys is not None:
+            return super().__contains__(key)
+        index = self.tracked_index()
+        if index is None:
+            return any(key in source for source in self.get_sources())
+        return key in index
+
     def __len__(self):
-        return sum(1 for x in self.__iter__())
+        if self.source_keys is not None:
+            return sum(1 for x in self.__iter__())
+        index = self.tracked_index()
+        return len(self.source_keys_found() if index is None else index)
 
     def __iter__(self):
         if self.source_keys is not None:
@@ -571,13 +1145,17 @@ class FlockAggregator(FlockBase, Mapping):
                 return iter(set(self.source_keys()))
             else:
                 return iter(self.source_keys)
-        return iter(set().union(*(source.keys() for source in self.get_sources())))
+        index = self.tracked_index()
+        return iter(self.source_keys_found() if index is None else index)
 
     def get_sources(self):
         if isinstance(self.sources, Mapping):
             return self.sources.values()
         elif callable(self.sources):
-            return self.sources()
+            sources = self.sources()
+            if isinstance(sources, SourceList) and sources.owner is not None:
+                record_read(sources.owner, KEYS)  # changes to the list drop the KEYS of the aggregator it belongs to
+            return sources
         else:
             return self.sources
 
@@ -631,5 +1209,29 @@ class FlockAggregator(FlockBase, Mapping):
                     raise
         return ret
 
+    def iter_shear(self, record_errors: bool = False, path: tuple = ()):
+        """
+        Yield each item of shear() as it is read, see PromiseFlock.iter_shear()
+
+        Args:
+            record_errors (bool): as for shear()
+            path (tuple): the keys leading to this Aggregator, prepended to every path yielded
+
+        Yields:
+            tuple: (path, value) pairs, an Aggregator with no keys yielding (path, {})
+        """
+        keys = list(self.__iter__())
+        if not keys:
+            yield path, {}
+            return
+        for key in keys:
+            try:
+                value = self[key]
+            except Exception as e:
+                if not record_errors:
+                    raise
+                value = e
+            yield path + (key,), value
+
     def __repr__(self):
         return f"flock.core.FlockAggregator({str(self.shear())})"
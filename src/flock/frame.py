@@ -0,0 +1,385 @@
+"""
+Evaluating one ruleset over many datasets at once.
+
+A FlockDict evaluates its rules for one dataset, so running a model over thousands of datasets means building thousands
+of flocks, each with its own closures.  A FlockFrame instead holds the datasets as columns, one list of values per key,
+and evaluates each rule of a ruleset once for every row.
+
+The rules are those of an origin flock, as given by ``FlockDict.ruleset()``, and read the origin through their closures
+and partial arguments.  Each rule is first rebound to read whole columns, as NumPy arrays, and called once; when that
+gives a 1-D numeric array with a value for every row, those are the rule's values.  Rules that read columns that are
+not numeric, or cannot work on arrays, such as those testing a value with ``if``, are rebound to read a single row
+instead and called once per row.  Only the errors such rules raise over columns, NotVectorizable, TypeError, ValueError
+and ArithmeticError, fall back to rows, and each fallback is logged at debug level; any other error is raised.  Rules
+that neither read the origin nor any global are called once and their value shared by every row.
+
+Columns of floats are given to rules as float arrays, and any other numeric columns as arrays of the Python numbers
+themselves, so that integer arithmetic over columns is exact, as Python's is, rather than wrapping at 64 bits.  Rules
+must be pure functions of what they read, as they may be called once over the columns before being called for each
+row.  A rule reading the origin as a global is rebound like any other, but a function it calls that does so is not.
+
+Nested FlockDicts in the ruleset are supported, along with the rules and data in them, other nested flocks such as
+FlockLists and FlockAggregators are not.  A row may give a value for any top level key, replacing whatever the ruleset
+has for that key, just as updating a flock with the row would.  NumPy is optional, without it every rule that reads
+the origin is called once per row.
+"""
+
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from functools import partial
+from types import FunctionType
+
+from closure_collector.core import CCBase
+from closure_collector.util import EMPTY, Constant, cell_contents, global_names, rebound
+from closure_collector.vectorized import ARRAY_KINDS, NUMERIC_TYPES, is_numeric, np
+from flock.core import FlockDict
+from flock.util import FlockException
+
+log = logging.getLogger(__name__)
+
+__author__ = "Andy Fundinger"
+
+
+class _Missing:
+    """Sentinel for a key that a row does not give a value for."""
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class Failed:
+    """The error raised computing the value of a key for one row, raised again whenever that value is read."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.error!r})"
+
+
+class NotVectorizable(Exception):
+    """Raised reading a column that cannot be given to a rule as a numeric array."""
+
+
+class Cursor:
+    """The row that the row views bound into a rule currently read."""
+
+    __slots__ = ("row",)
+
+    def __init__(self):
+        self.row = 0
+
+
+class RowView(Mapping):
+    """A single row of a frame, or of a flock nested in it, read by rules in place of the flock they were written for."""
+
+    def __init__(self, frame: "FlockFrame", path: tuple, cursor: Cursor):
+        self.frame = frame
+        self.path = path
+        self.cursor = cursor
+
+    def __getitem__(self, key):
+        return self.frame.read(self.path + (key,), self.cursor)
+
+    def __iter__(self):
+        return iter(self.frame.keys_at(self.path, self.cursor.row))
+
+    def __len__(self):
+        return len(self.frame.keys_at(self.path, self.cursor.row))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r}, row={self.cursor.row})"
+
+
+class ColumnView:
+    """Every row of a frame, or of a flock nested in it, at once, read by rules evaluated over whole columns."""
+
+    def __init__(self, frame: "FlockFrame", path: tuple):
+        self.frame = frame
+        self.path = path
+
+    def __getitem__(self, key):
+        return self.frame.array(self.path + (key,))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path!r})"
+
+
+class FlockFrame(Sequence):
+    """
+    A table of datasets evaluated with one ruleset, behaving as the list of the sheared rows.
+
+    Shearing a row gives the same dict as shearing the origin flock with the row's data in place of its own.
+
+    :param ruleset: the rules to evaluate, as given by ruleset() of the origin flock
+    :param rows: the datasets, either a sequence of mappings, one per row, or a mapping of keys to sequences of values,
+        one per row.  Rows need not all have the same keys.
+    :param origin: the flock the rules were written for, whose reads are to be redirected to the frame
+    :raises TypeError: if the ruleset holds a nested flock other than a FlockDict
+    :raises ValueError: if the columns given are not all the same length
+    """
+
+    def __init__(self, ruleset: Mapping, rows, origin: FlockDict | None = None):
+        self.ruleset = ruleset
+        self.origin = origin
+        self.rules: dict = {}
+        self.nested: dict = {}
+        self.paths: dict = {}
+        if origin is not None:
+            self.paths[id(origin)] = ()
+        self.add_rules(ruleset, ())
+        if isinstance(rows, Mapping):
+            self.data = {key: list(values) for key, values in rows.items()}
+            lengths = {len(values) for values in self.data.values()}
+            if len(lengths) > 1:
+                raise ValueError(f"Columns must all be the same length, not {sorted(lengths)}")
+            self.size = lengths.pop() if lengths else 0
+        else:
+            rows = list(rows)
+            keys = dict.fromkeys(key for row in rows for key in row)
+            self.data = {key: [row.get(key, MISSING) for row in rows] for key in keys}
+            self.size = len(rows)
+        self.overridden = {key for key, values in self.data.items() if any(value is not MISSING for value in values)}
+        self.columns: dict = {}
+        self.arrays: dict = {}
+
+    @classmethod
+    def from_flock(cls, flock: FlockDict, rows) -> "FlockFrame":
+        """Create a frame evaluating the rules of flock over rows."""
+        return cls(flock.ruleset(), rows, origin=flock)
+
+    def add_rules(self, promises: Mapping, path: tuple):
+        """Record the rules in promises, under path, along with those of any FlockDicts nested in them."""
+        self.nested[path] = list(promises)
+        for key, promise in promises.items():
+            if isinstance(promise, FlockDict):
+                self.paths[id(promise)] = path + (key,)
+                self.add_rules(promise.promises, path + (key,))
+            elif isinstance(promise, CCBase):
+                raise TypeError(f"{path + (key,)} holds a {type(promise).__name__}, only rules, data and nested FlockDicts can be evaluated in a frame")
+            else:
+                self.rules[path + (key,)] = promise
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        rows = range(self.size)[index]
+        if isinstance(rows, range):
+            return [self.shear_row(row) for row in rows]
+        return self.shear_row(rows)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.rules)} rules, {self.size} rows)"
+
+    def row(self, row: int) -> RowView:
+        """A read only mapping of the values of a row, computed as they are read."""
+        cursor = Cursor()
+        cursor.row = range(self.size)[row]
+        return RowView(self, (), cursor)
+
+    def column(self, *path, record_errors: bool = False) -> list:
+        """
+        The values of a key in every row.
+
+        :param path: the key, preceded by the keys of any flocks it is nested in
+        :param record_errors: if True errors are given in place of the values that raised them
+        """
+        return [self.shear_at(path, row, record_errors) if self.is_nested(path, row) else self.value(path, row, record_errors) for row in range(self.size)]
+
+    def shear(self, record_errors: bool = False) -> list:
+        """Shear every row, giving a list of OrderedDicts."""
+        return [self.shear_row(row, record_errors) for row in range(self.size)]
+
+    def shear_row(self, row: int, record_errors: bool = False) -> OrderedDict:
+        """
+        Shear a single row.
+
+        :param record_errors: if True errors are given in place of the values that raised them, as for FlockDict.shear()
+        :return: the same dict as shearing the origin flock with the row's data
+        """
+        return self.shear_at((), row, record_errors)
+
+    def shear_at(self, path: tuple, row: int, record_errors: bool) -> OrderedDict:
+        """Shear the flock at path in a row, into an OrderedDict in the same order as FlockDict.shear()."""
+        return OrderedDict(
+            (key, self.shear_at(path + (key,), row, record_errors) if self.is_nested(path + (key,), row) else self.value(path + (key,), row, record_errors))
+            for key in sorted(self.keys_at(path, row), key=lambda x: (str(x), repr(x)))
+        )
+
+    def value(self, path: tuple, row: int, record_errors: bool):
+        """The value at path in a row, raising or giving any error computing it."""
+        value = self.values(path)[row]
+        if type(value) is Failed:
+            if not record_errors:
+                raise value.error
+            return value.error
+        return sheared(value)
+
+    def keys_at(self, path: tuple, row: int) -> list:
+        """The keys of the flock at path in a row, those of the ruleset followed by any others the row gives."""
+        if path:
+            return self.nested[path]
+        keys = self.nested[()]
+        return keys + [key for key, values in self.data.items() if values[row] is not MISSING and key not in self.ruleset]
+
+    def is_nested(self, path: tuple, row: int) -> bool:
+        """Check whether path is a flock nested in the ruleset, rather than a value, in a row."""
+        return path in self.nested and bool(path) and (path[0] not in self.data or self.data[path[0]][row] is MISSING)
+
+    def read(self, path: tuple, cursor: Cursor):
+        """Read path in the row of cursor, as a rule bound to a RowView does."""
+        if self.is_nested(path, cursor.row):
+            return RowView(self, path, cursor)
+        value = self.values(path)[cursor.row]
+        if type(value) is Failed:
+            raise value.error
+        return value
+
+    def array(self, path: tuple):
+        """
+        Read path in every row at once, as a rule bound to a ColumnView does.
+
+        :raises NotVectorizable: if the values are not all numeric, or any of them failed
+        :return: a read only NumPy array of the values, of floats if they are all floats and of the values themselves
+            otherwise, or a ColumnView of a nested flock
+        """
+        if path in self.nested and path[0] not in self.overridden:
+            return ColumnView(self, path)
+        if path not in self.arrays:
+            values = self.values(path)
+            array = None
+            if is_numeric(values):
+                array = np.array(values, dtype=float if all(isinstance(value, float | np.floating) for value in values) else object)
+                array.flags.writeable = False
+            self.arrays[path] = array
+        if self.arrays[path] is None:
+            raise NotVectorizable(path)
+        return self.arrays[path]
+
+    def values(self, path: tuple) -> list:
+        """
+        The value at path in every row, each a Failed if computing it raised.
+
+        Rows that give a value for the top level key of path take it from there, the others from the ruleset.
+        """
+        if path not in self.columns:
+            data = self.data.get(path[0])
+            evaluated = None
+            values = []
+            for row in range(self.size):
+                if data is not None and data[row] is not MISSING:
+                    values.append(dig(data[row], path[1:]))
+                else:
+                    if evaluated is None:
+                        evaluated = self.evaluate(path)
+                    values.append(evaluated[row])
+            self.columns[path] = values
+        return self.columns[path]
+
+    def evaluate(self, path: tuple) -> list:
+        """Compute the rule at path for every row, over whole columns if possible and row by row if not."""
+        key = path[-1]
+        if path not in self.rules:
+            return [Failed(KeyError(key))] * self.size
+        promise = self.rules[path]
+        if type(promise) is Constant:
+            return [promise.value] * self.size
+        columns = self.bind(promise, lambda path: ColumnView(self, path))
+        if columns is promise and not reads_globals(promise):  # reads nothing in the frame, so the same for every row
+            return [call(promise, key)] * self.size
+        if np is not None:
+            vectorized = self.vectorize(columns)
+            if vectorized is not None:
+                return vectorized
+        cursor = Cursor()
+        rule = self.bind(promise, lambda path: RowView(self, path, cursor))
+        values = []
+        for row in range(self.size):
+            cursor.row = row
+            values.append(call(rule, key))
+        return values
+
+    def vectorize(self, rule) -> list | None:
+        """
+        Call a rule bound to ColumnViews, giving its value for every row, or None if it cannot work over columns.
+
+        :raises Exception: any error raised by the rule other than those showing it cannot work over columns
+        """
+        try:
+            with np.errstate(all="raise"):
+                result = rule()
+        except (NotVectorizable, TypeError, ValueError, ArithmeticError) as e:
+            log.debug("Evaluating %r row by row, over columns it raised %r", rule, e)
+            return None
+        if not isinstance(result, np.ndarray) or result.shape != (self.size,):
+            return None
+        values = result.tolist()
+        if result.dtype.kind not in ARRAY_KINDS and not all(type(value) in NUMERIC_TYPES for value in values):
+            return None
+        return values
+
+    def bind(self, promise, view_for):
+        """
+        Copy a rule with every flock of the ruleset that it refers to replaced by a view of the frame.
+
+        :param view_for: function giving the view to use for the flock at a path
+        :raises TypeError: if promise is a method of a flock in the ruleset, which cannot be redirected
+        :return: the copy, or promise itself if it refers to no flock of the ruleset
+        """
+        return rebound(promise, {flock_id: view_for(path) for flock_id, path in self.paths.items()})
+
+
+def reads_globals(promise, seen: set | None = None) -> bool:
+    """
+    Check whether promise reads any globals, or any function it closes over or is a partial of does, so that it may find
+    the origin, or anything else that differs from row to row, without referring to it.
+
+    Callables other than functions and partials may read anything, so are assumed to.
+    """
+    if seen is None:
+        seen = set()
+    if id(promise) in seen:
+        return False
+    seen.add(id(promise))
+    if isinstance(promise, partial):
+        return any(reads_globals(item, seen) for item in (promise.func, *promise.args, *promise.keywords.values()) if isinstance(item, FunctionType | partial))
+    if not isinstance(promise, FunctionType):
+        return True
+    if any(name in promise.__globals__ for name in global_names(promise.__code__)):
+        return True
+    contents = (cell_contents(cell) for cell in promise.__closure__ or ())
+    return any(reads_globals(content, seen) for content in contents if content is not EMPTY and isinstance(content, FunctionType | partial))
+
+
+def call(rule, key):
+    """Call a rule, giving a Failed holding the same FlockException as reading key from a flock would raise."""
+    try:
+        return rule()
+    except Exception as e:
+        error = FlockException(f"Error calculating key:{key}")
+        error.__cause__ = e
+        return Failed(error)
+
+
+def sheared(value):
+    """A value as a flock holding it would shear it, with any mappings in it, which it would nest as flocks, as OrderedDicts."""
+    if isinstance(value, Mapping):
+        return OrderedDict((key, sheared(item)) for key, item in value.items())
+    return value
+
+
+def dig(value, keys: tuple):
+    """Look keys up in turn in a value given by a row, giving a Failed if any is missing."""
+    for key in keys:
+        try:
+            value = value[key]
+        except Exception as e:
+            return Failed(e)
+    return value
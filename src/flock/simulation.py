@@ -0,0 +1,184 @@
+"""
+Running a seeded model for many seeds, collecting statistics of its outputs.
+
+A model is a function building a flock whose random choices all follow from one data key, its seed, such as
+``random.Random(char["seed"])``.  simulate() builds the model once per chunk of seeds, then for each seed writes it to
+the seed key and reads the keys asked for, compiled with ``FlockDict.compile()`` where possible.  The global random
+module is seeded with each seed too, and its state restored afterwards, so rules using it are also repeatable, except
+when run on a thread pool, whose threads share that module.
+
+Values are added to running statistics as they are read, so memory does not grow with the number of seeds, only with
+the number of bins in the histograms asked for.  An error raised reading a key for a seed is counted, rather than
+raised, so one bad seed does not lose the statistics of the rest.  Chunks may be run on an executor, such as a process pool,
+and their statistics are merged in the order of the seeds, so the same seeds and chunk size always give the same
+statistics, whichever executor is used.  For a process pool the model function must be picklable, as a function defined
+at the top level of a module is.
+"""
+
+import math
+import os
+import random
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import Executor
+from itertools import islice
+from numbers import Real
+
+from flock.core import FlockDict
+
+__author__ = "Andy Fundinger"
+
+
+class Statistics:
+    """
+    The count, mean, variance, minimum and maximum of a stream of numbers, kept as they are added, with a histogram.
+
+    :param width: the width of the histogram's bins, each counted under its lower edge, or None to keep no histogram;
+        1 counts each integer separately
+    """
+
+    def __init__(self, width: float | None = None):
+        self.width = width
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Real | None = None
+        self.max: Real | None = None
+        self.errors = 0
+        self.histogram: Counter = Counter()
+
+    def __repr__(self):
+        summary = f"count={self.count}, mean={self.mean!r}, stdev={self.stdev!r}, min={self.min!r}, max={self.max!r}, errors={self.errors}"
+        return f"{self.__class__.__name__}({summary})"
+
+    def add(self, value):
+        """
+        Add a value, updating the mean and variance with Welford's algorithm.
+
+        :raises TypeError: if value is not a real number
+        """
+        if not isinstance(value, Real):
+            raise TypeError(f"Only real numbers can be simulated, not {type(value).__name__}: {value!r}")
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        if self.width is not None:
+            self.histogram[self.bin(value)] += 1
+
+    def merge(self, other: "Statistics"):
+        """Add the values of other, as if each had been added here, using Chan's method to combine the variances."""
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+            self.min = other.min if self.min is None or other.min < self.min else self.min  # type: ignore[operator]
+            self.max = other.max if self.max is None or other.max > self.max else self.max  # type: ignore[operator]
+            self.histogram.update(other.histogram)
+        self.errors += other.errors
+
+    def bin(self, value):
+        """The histogram bin of value."""
+        return math.floor(value / self.width) * self.width
+
+    @property
+    def variance(self) -> float:
+        """The sample variance, or nan with fewer than two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def stdev(self) -> float:
+        """The sample standard deviation, or nan with fewer than two values."""
+        return math.sqrt(self.variance)
+
+
+def simulate(
+    model: Callable[[], FlockDict],
+    seeds: Iterable,
+    keys: Iterable,
+    executor: Executor | None = None,
+    seed_key="seed",
+    bin_widths: Mapping | None = None,
+    chunk_size: int = 1000,
+) -> dict:
+    """
+    Run a model once for each seed, collecting statistics of the values of some of its keys.
+
+    :param model: function building the flock to run
+    :param seeds: the seeds to run, each written to seed_key in turn
+    :param keys: the keys whose values to collect, each a key of the flock or a tuple of keys leading into flocks nested
+        in it, and each giving a real number
+    :param executor: a concurrent.futures Executor to run chunks of seeds on, or None to run them here
+    :param seed_key: the key of the flock holding its seed
+    :param bin_widths: histogram bin widths by key, keys not given keeping no histogram
+    :param chunk_size: the number of seeds run together, each chunk building the model once
+    :raises TypeError: if a key gives a value that is not a real number
+    :return: a dict mapping each key to its Statistics, any errors raised reading it counted under errors
+    """
+    keys = list(keys)
+    bin_widths = dict(bin_widths or {})
+    results = {key: Statistics(bin_widths.get(key)) for key in keys}
+    seeds = iter(seeds)
+    chunks = iter(lambda: list(islice(seeds, chunk_size)), [])
+    if executor is None:
+        for chunk in chunks:
+            merge(results, run_seeds(model, keys, chunk, seed_key, bin_widths))
+        return results
+    pending: deque = deque()
+    window = 2 * (os.cpu_count() or 1)
+    for chunk in chunks:
+        pending.append(executor.submit(run_seeds, model, keys, chunk, seed_key, bin_widths))
+        if len(pending) >= window:
+            merge(results, pending.popleft().result())
+    while pending:
+        merge(results, pending.popleft().result())
+    return results
+
+
+def run_seeds(model, keys: list, seeds: list, seed_key, bin_widths: dict) -> dict:
+    """Build the model, then run it for each of seeds, as a picklable function for executors in other processes."""
+    results = {key: Statistics(bin_widths.get(key)) for key in keys}
+    state = random.getstate()
+    try:
+        flock = model()
+        try:
+            compiled = flock.compile(keys)
+        except Exception:
+            compiled = None  # the model's own seed fails, or a key is not a rule of a FlockDict, so read the flock instead
+        for seed in seeds:
+            random.seed(seed)
+            flock[seed_key] = seed
+            try:
+                values = compiled() if compiled is not None else {key: read(flock, key) for key in keys}
+            except Exception:
+                for key in keys:
+                    try:
+                        value = read(flock, key)
+                    except Exception:
+                        results[key].errors += 1
+                    else:
+                        results[key].add(value)
+                continue
+            for key in keys:
+                results[key].add(values[key])
+    finally:
+        random.setstate(state)
+    return results
+
+
+def read(flock: FlockDict, key):
+    """Read a key, or a tuple of keys leading into nested flocks, from flock."""
+    value = flock
+    for step in key if type(key) is tuple else (key,):
+        value = value[step]
+    return value
+
+
+def merge(results: dict, chunk: dict):
+    """Merge the statistics of a chunk of seeds into results."""
+    for key, statistics in chunk.items():
+        results[key].merge(statistics)
@@ -0,0 +1,23 @@
+"""
+Helpers shared by the tests of caching, snapshots and forks, counting how often each rule is called.
+
+Rules call them through this module, as helpers.called(), so that a persistent cache, which identifies a module by its
+name alone, does not see the counts change.
+"""
+
+from collections import Counter
+
+__author__ = "Andy Fundinger"
+
+CALLS: Counter = Counter()
+
+
+def called(name, value):
+    """Count a call of the rule name, returning value"""
+    CALLS[name] += 1
+    return value
+
+
+def scaled(flock, key, factor):
+    """A rule body found by name, closing over its flock through a partial"""
+    return called("scaled", flock[key] * factor)
@@ -0,0 +1,62 @@
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from pytest import raises
+
+from flock.benchmark import BENCHMARKS, main, regressions, run_suite
+
+__author__ = "Andy Fundinger"
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """
+    Tests of the benchmark suite, run at a tiny scale
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = Path(self.directory.name) / "results.json"
+
+    def run_main(self, *argv) -> tuple:
+        out = StringIO()
+        with redirect_stdout(out):
+            code = main(["--scale", "0.01", "--repeat", "2", *argv])
+        return code, out.getvalue()
+
+    def test_suite(self):
+        code, out = self.run_main("--output", str(self.output))
+        assert code == 0
+        results = json.loads(self.output.read_text())
+        assert list(results["benchmarks"]) == list(BENCHMARKS)
+        assert {"commit", "python", "platform", "scale", "repeat"} <= set(results)
+        for name, result in results["benchmarks"].items():
+            assert len(result["times"]) == 2 and result["min"] <= result["median"], name
+            assert name in out
+
+    def test_compare(self):
+        self.run_main("--output", str(self.output), "deep_chain", "wide_fanout")
+        code, out = self.run_main("--compare", str(self.output), "--threshold", "1000", "deep_chain", "construction")
+        assert code == 0 and "ratio" in out
+        code, out = self.run_main("--compare", str(self.output), "--threshold", "0.000001", "deep_chain")
+        assert code == 1 and "deep_chain" in out.splitlines()[-1]
+
+    def test_regressions(self):
+        baseline = {"benchmarks": {"a": {"min": 1.0}, "b": {"min": 1.0}, "c": {"skipped": "reason"}}}
+        results = {"benchmarks": {"a": {"min": 1.5}, "b": {"min": 1.1}, "c": {"min": 9.0}, "d": {"min": 9.0}}}
+        assert regressions(results, baseline, 1.2) == ["a"]
+
+    def test_skipped(self):
+        results = run_suite(["mythica"], scale=1, repeat=1, examples=Path(self.directory.name))
+        assert "skipped" in results["benchmarks"]["mythica"]
+        with redirect_stdout(StringIO()), raises(SystemExit):
+            main(["no_such_benchmark"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+import sys
+import time
+import unittest
+
+from pytest import raises
+
+from closure_collector.cache import CACHE, PIN, SKIP, BoundedCache, CachePolicy
+from closure_collector.core import ClosureCollector
+from flock.core import FlockDict, FlockList
+
+__author__ = "Andy Fundinger"
+
+
+class BoundedCacheTestCase(unittest.TestCase):
+    """
+    Tests of the eviction and counters of a bounded cache on its own
+    """
+
+    def test_lru(self):
+        cache = CachePolicy(max_entries=2).new_cache()
+        cache["a"] = 1
+        cache["b"] = 2
+        assert cache["a"] == 1
+        cache["c"] = 3
+        assert list(cache) == ["a", "c"]
+        assert cache.stats() == {"hits": 1, "misses": 3, "evictions": 1, "entries": 2, "bytes": sys.getsizeof(1) + sys.getsizeof(3)}
+
+    def test_lfu(self):
+        cache = CachePolicy(max_entries=2, eviction="lfu").new_cache()
+        cache["a"] = 1
+        cache["b"] = 2
+        for _ in range(3):
+            assert cache["a"] == 1
+        assert cache["b"] == 2
+        cache["c"] = 3
+        assert sorted(cache) == ["a", "c"]
+        cache["d"] = 4
+        assert sorted(cache) == ["a", "d"]
+
+    def test_lfu_buckets(self):
+        cache = CachePolicy(max_entries=100, eviction="lfu", pin_cost=1).new_cache()
+        for key in range(100):
+            cache[key] = key
+            for _ in range(key % 5):
+                assert cache[key] == key
+        cache.put("pinned", 0, 5)
+        for key in range(100, 120):
+            cache[key] = key
+        assert [key for key in range(101) if key not in cache] == list(range(0, 101, 5))
+        assert "pinned" in cache and 119 in cache and set(cache.buckets) == {1, 2, 3, 4, 5} and len(cache.counts) <= 2 * len(cache.buckets) + 8
+        for key in list(cache):
+            del cache[key]
+        assert not cache.buckets
+
+    def test_max_bytes(self):
+        cache = CachePolicy(max_bytes=10, sizeof=len).new_cache()
+        cache["a"] = "x" * 4
+        cache["b"] = "x" * 4
+        cache["c"] = "x" * 4
+        assert list(cache) == ["b", "c"]
+        cache["big"] = "x" * 11
+        assert "big" not in cache
+        assert cache.stats()["bytes"] == 8
+        assert cache.evictions == 2
+
+    def test_pop_and_contains_are_not_hits(self):
+        cache = BoundedCache(CachePolicy())
+        cache["a"] = 1
+        assert "a" in cache
+        assert cache.pop("a") == 1
+        assert cache.pop("a", None) is None
+        with raises(KeyError):
+            del cache["a"]
+        assert cache.stats() == {"hits": 0, "misses": 1, "evictions": 0, "entries": 0, "bytes": 0}
+
+    def test_bad_policy(self):
+        with raises(ValueError):
+            CachePolicy(eviction="fifo")
+        with raises(ValueError):
+            CachePolicy(max_entries=0)
+        with raises(ValueError):
+            CachePolicy(min_cost=2, pin_cost=1)
+
+    def test_strategy(self):
+        policy = CachePolicy(min_cost=0.1, pin_cost=1)
+        assert [policy.strategy(cost) for cost in (0.01, 0.1, 0.5, 1, 10)] == [SKIP, CACHE, CACHE, PIN, PIN]
+        assert CachePolicy().strategy(0) == CACHE
+
+    def test_pinned_values_are_kept(self):
+        cache = CachePolicy(max_entries=1, min_cost=0.1, pin_cost=1).new_cache()
+        cache.put("slow", 1, 5)
+        cache.put("quick", 2, 0.01)
+        cache.put("medium", 3, 0.5)
+        assert list(cache) == ["slow", "medium"]
+        assert cache.decisions == {"slow": (PIN, 5), "quick": (SKIP, 0.01), "medium": (CACHE, 0.5)}
+        cache.put("other", 4, 0.5)
+        assert list(cache) == ["slow", "other"]
+        cache.put("slow", 1, 0.5)
+        assert list(cache) == ["slow"]
+        assert cache.stats()["misses"] == 5
+
+
+class BoundedFlockTestCase(unittest.TestCase):
+    """
+    Tests of flocks caching their values in bounded caches
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.flock = FlockDict(cache_policy=CachePolicy(max_entries=2))
+        for key in "abc":
+            self.flock[key] = self.counted(key, lambda key=key: key * 2)
+
+    def counted(self, name, func):
+        def promise():
+            self.calls.append(name)
+            return func()
+
+        return promise
+
+    def test_evicted_keys_recompute(self):
+        assert [self.flock[key] for key in "abc"] == ["aa", "bb", "cc"]
+        assert len(self.flock.cache) == 2
+        assert self.flock["a"] == "aa"
+        assert self.calls == ["a", "b", "c", "a"]
+        assert self.flock.cache.stats()["evictions"] == 2
+        assert self.flock.shear() == {"a": "aa", "b": "bb", "c": "cc"}
+
+    def test_invalidation_after_eviction(self):
+        flock = self.flock
+        flock["d"] = lambda: flock["a"] + "!"
+        assert flock["d"] == "aa!"
+        for key in "bc":
+            flock[key]
+        assert "a" not in flock.cache and "d" not in flock.cache
+        assert flock["d"] == "aa!"
+        flock["a"] = "z"
+        assert flock["d"] == "z!"
+
+    def test_nested_flocks_get_own_cache(self):
+        self.flock["nested"] = {"x": lambda: 1, "y": lambda: 2, "z": lambda: 3}
+        self.flock["list"] = FlockList([lambda: 1, lambda: 2, lambda: 3], cache_policy=self.flock.cache_policy)
+        nested = self.flock["nested"]
+        assert nested.cache_policy is self.flock.cache_policy
+        assert nested.cache is not self.flock.cache
+        assert self.flock.shear()["nested"] == {"x": 1, "y": 2, "z": 3}
+        assert len(nested.cache) == 2
+        assert list(self.flock["list"]) == [1, 2, 3]
+        assert len(self.flock["list"].cache) == 2
+
+    def test_lazy(self):
+        flock = FlockDict({"a": 1, "b": 2}, lazy=True, cache_policy=CachePolicy(max_entries=1))
+        flock["c"] = lambda: flock["a"] + flock["b"]
+        assert flock["c"] == 3
+        flock["b"] = 5
+        assert flock["c"] == 6
+
+    def test_lazy_eviction(self):
+        flock = FlockDict({"a": 1}, lazy=True, cache_policy=CachePolicy(max_entries=1))
+        flock["b"] = lambda: flock["a"] * 2
+        flock["c"] = lambda: flock["b"] + 1
+        assert flock["c"] == 3
+        assert "b" not in flock.cache
+        flock["a"] = 5
+        assert flock["c"] == 11
+
+    def test_closure_collector(self):
+        collector = ClosureCollector(a=1, b=2, cache_policy=CachePolicy(max_entries=1))
+        collector.c = lambda: collector.a + collector.b
+        assert collector.c == 3
+        assert list(collector.cache) == ["c"]
+        collector.a = 2
+        assert collector.c == 4
+
+
+class CostAdaptiveTestCase(unittest.TestCase):
+    """
+    Tests of flocks deciding what to cache from how long values take to compute
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.flock = FlockDict({"a": 1, "b": 2}, cache_policy=CachePolicy(max_entries=2, min_cost=0.002, pin_cost=0.02))
+        flock = self.flock
+        flock["slow"] = self.counted("slow", lambda: time.sleep(0.03) or flock["a"] + flock["b"])
+        flock["medium"] = self.counted("medium", lambda: time.sleep(0.005) or flock["a"] * 10)
+        flock["other"] = self.counted("other", lambda: time.sleep(0.005) or flock["b"] * 10)
+
+    def counted(self, name, func):
+        def promise():
+            self.calls.append(name)
+            return func()
+
+        return promise
+
+    def test_cheap_values_are_not_cached(self):
+        self.flock["c"] = lambda: self.flock["a"]
+        assert self.flock["c"] == 1
+        assert "c" not in self.flock.cache
+        assert self.flock.cache.decisions == {"c": (SKIP, self.flock.cache.decisions["c"][1])}
+        self.flock["a"] = 2
+        assert not self.flock.cache.decisions
+
+    def test_expensive_values_are_pinned(self):
+        flock = self.flock
+        assert (flock["slow"], flock["medium"], flock["other"]) == (3, 10, 20)
+        assert flock.cache.decisions["slow"][0] == PIN
+        assert flock.cache.decisions["medium"][0] == CACHE
+        assert sorted(flock.cache) == ["other", "slow"]
+        assert flock["slow"] == 3
+        assert self.calls == ["slow", "medium", "other"]
+
+    def test_cost_excludes_values_read(self):
+        flock = self.flock
+        flock["cheap"] = lambda: flock["slow"] + 1
+        assert flock["cheap"] == 4
+        assert flock.cache.decisions["slow"][0] == PIN
+        assert flock.cache.decisions["cheap"][0] == SKIP and flock.cache.decisions["cheap"][1] < 0.002
+
+    def test_writes_reach_through_uncached_values(self):
+        flock = self.flock
+        flock["total"] = lambda: time.sleep(0.005) or flock["slow"] * 2
+        assert flock["total"] == 6
+        flock["a"] = 5
+        assert flock["total"] == 14
+        assert self.calls == ["slow", "slow"]
+
+
+if __name__ == "__main__":
+    unittest.main()
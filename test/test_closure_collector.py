@@ -253,5 +253,46 @@ class ShearTestCase(unittest.TestCase):
         assert "D" in getattr(self.closure_collector, "d")
 
 
+class DependencyInvalidationTestCase(unittest.TestCase):
+    """
+    Tests that writes only drop the cached attributes computed from the written attribute
+    """
+
+    def test_unrelated_write_keeps_cache(self):
+        calls = []
+        cc = ClosureCollector(a=1, b=2)
+        cc.c = lambda: calls.append("c") or cc.a + 1
+        cc.d = lambda: calls.append("d") or cc.b + 1
+        cc.listing = lambda: calls.append("listing") or sorted(dir(cc))
+        assert (cc.c, cc.d) == (2, 3)
+        assert "e" not in cc.listing
+        cc.b = 5
+        assert (cc.c, cc.d) == (2, 6)
+        cc.e = 0
+        assert "e" in cc.listing
+        assert calls == ["c", "d", "listing", "d", "listing"]
+
+    def test_lazy(self):
+        cc = ClosureCollector(lazy=True, a=1)
+        cc.b = lambda: cc.a + 1
+        cc.c = lambda: cc.b * 2
+        assert cc.c == 4
+        cc.a = 2
+        assert "c" in cc.cache
+        assert not cc.dependents
+        assert cc.c == 6
+
+    def test_batch(self):
+        cc = ClosureCollector(a=1, b=2)
+        cc.c = lambda: cc.a + cc.b
+        assert cc.c == 3
+        with cc.batch() as batch:
+            cc.a = 2
+            cc.b = 3
+            assert len(batch.pending) == 2
+            assert "c" in cc.cache
+        assert cc.c == 5
+
+
 if __name__ == "__main__":
     unittest.main()
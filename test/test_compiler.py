@@ -0,0 +1,157 @@
+import unittest
+
+from pytest import raises
+
+from closure_collector.closures import index_reference
+from closure_collector.compiler import REFERENCE, STALE, CompiledRules, generate
+from flock.core import FlockAggregator, FlockDict, FlockList, SourceList
+from flock.util import FlockException
+
+__author__ = "Andy Fundinger"
+
+
+def build(data, calls):
+    """A small model in the style of the mythica example, counting the calls of each rule in calls."""
+
+    def counted(name, rule):
+        def promise():
+            calls.append(name)
+            return rule()
+
+        return promise
+
+    character = FlockDict(data)
+    character["double"] = counted("double", lambda: character["level"] * 2)
+    character["bonuses"] = FlockAggregator(SourceList([character["stats"]]), sum)
+    character["strength"] = index_reference(character, "stats", "str")
+    character["points"] = {"base": 10, "total": {}, "available": {}}
+    total = character["points"]["total"]
+    total["mental"] = counted("mental", lambda: character["level"] * character["bonuses"]["str"])
+    total["physical"] = counted("physical", lambda: character["double"] + character["points"]["base"])
+    available = character["points"]["available"]
+    available["mental"] = lambda: character["points"]["total"]["mental"] - 1
+    available["physical"] = lambda: character["points"]["total"]["physical"] - 2
+    available["all"] = lambda: sum(character["points"]["total"].values())
+    return character
+
+
+class CompiledRulesTestCase(unittest.TestCase):
+    """
+    Tests of compiling the rules behind keys into one function
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.flock = build({"level": 3, "stats": {"str": 2}}, self.calls)
+        self.compiled = self.flock.compile(keys=[("points", "available"), "strength", "double"])
+
+    def expected(self):
+        return {("points", "available"): self.flock["points"]["available"].shear(), "strength": self.flock["strength"], "double": self.flock["double"]}
+
+    def test_values(self):
+        assert self.compiled() == self.expected()
+        self.flock["level"] = 5
+        self.flock["stats"]["str"] = 4
+        assert self.compiled() == self.expected()
+        assert list(self.compiled()[("points", "available")]) == ["all", "mental", "physical"]
+
+    def test_rules_are_called_directly(self):
+        self.flock.clear_cache()
+        self.calls.clear()
+        self.compiled()
+        self.compiled()
+        assert sorted(self.calls) == ["double", "double", "mental", "mental", "physical", "physical"]
+        assert self.compiled.function(*self.compiled.arguments) is not STALE
+
+    def test_cached_values(self):
+        self.calls.clear()
+        assert self.compiled() == self.expected() and self.calls == []
+        self.flock["stats"]["str"] = 5
+        self.compiled()
+        assert self.calls == ["mental"]
+        lazy = build({"level": 3, "stats": {"str": 2}}, self.calls)
+        lazy.lazy = True
+        compiled = lazy.compile(["double"])
+        lazy["level"] = 4
+        assert compiled() == {"double": 8} and compiled() == {"double": 8}
+
+    def test_index_reference(self):
+        reference = self.flock.compile(["strength"])
+        _, kind, _ = reference.layouts[0]
+        assert kind == REFERENCE
+        self.flock["stats"]["str"] = 9
+        assert reference() == {"strength": 9}
+
+    def test_shared_by_ruleset(self):
+        other = build({"level": 1, "stats": {"str": 7}}, [])
+        compiled = other.compile(keys=[("points", "available"), "strength", "double"])
+        assert compiled.function is self.compiled.function
+        assert compiled()["strength"] == 7
+
+    def test_changed_rules(self):
+        self.flock["points"]["total"]["physical"] = lambda: 100
+        assert self.compiled()[("points", "available")]["physical"] == 98
+        self.flock["points"]["total"]["spell"] = 5
+        assert self.compiled()[("points", "available")]["all"] == 111
+        self.flock["points"]["available"] = {"none": 0}
+        assert self.compiled()[("points", "available")] == {"none": 0}
+
+    def test_untraced_reads(self):
+        flock = FlockDict({"flag": True, "a": 1, "b": 2})
+        flock["choice"] = lambda: flock["a"] if flock["flag"] else flock["b"]
+        flock["present"] = lambda: "c" in flock
+        compiled = flock.compile(["choice", "present"])
+        flock["flag"] = False
+        assert compiled() == {"choice": 2, "present": False}
+        flock["c"] = 3
+        assert compiled() == {"choice": 2, "present": True}
+        flock = FlockDict({"flag": True, "a": 1, "b": 2})
+        flock["pick"] = lambda: flock["a"] if flock["flag"] else flock["b"]
+        flock["n"] = lambda: len(flock)
+        compiled = flock.compile(["pick", "n"])
+        flock["flag"] = False
+        assert compiled() == {"pick": 2, "n": 5}
+
+    def test_branch_not_traced(self):
+        flock = FlockDict({"flag": True, "a": 1, "base": 10})
+        flock["x"] = lambda: flock["a"] if flock["flag"] else flock["b"]
+        flock["b"] = lambda: flock["base"] * 2
+        compiled = flock.compile(["x", "b"])
+        assert compiled() == {"x": 1, "b": 20}
+        flock["flag"] = False
+        flock["base"] = 5
+        assert compiled() == {"x": 10, "b": 10} == compiled.read()
+
+    def test_functions_are_bounded(self):
+        assert generate.cache_info().maxsize is not None
+
+    def test_reading_own_keys(self):
+        available = self.flock["points"]["available"]
+        available["others"] = lambda: [key for key in available if key != "others"]
+        compiled = self.flock.compile([("points", "available", "others")])
+        assert compiled.function(*compiled.arguments) is not STALE
+        assert compiled() == compiled.read() == {("points", "available", "others"): ["mental", "physical", "all"]}
+
+    def test_errors(self):
+        self.flock["stats"]["str"] = "x"
+        with raises(FlockException):
+            self.compiled()
+        with raises(FlockException):
+            self.flock.compile(["double", ("points", "total")])
+        with raises(TypeError):
+            FlockDict({"list": FlockList([1])}).compile([("list", 0)])
+
+    def test_tracked_inside_rules(self):
+        self.flock["summary"] = lambda: self.compiled()["double"] + 1
+        assert self.flock["summary"] == 7
+        self.flock["level"] = 10
+        assert self.flock["summary"] == 21
+
+    def test_repr(self):
+        assert repr(self.compiled) == "CompiledRules([('points', 'available'), 'strength', 'double'])"
+        assert isinstance(self.compiled, CompiledRules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import unittest
+from io import StringIO
+
+import yaml
+from pytest import raises
+
+from closure_collector.core import ClosureCollector
+from closure_collector.export import write_json, write_jsonl, write_yaml
+from flock.core import FlockAggregator, FlockDict, FlockException, FlockList
+
+__author__ = "Andy Fundinger"
+
+
+def plain(sheared):
+    """A sheared form with plain dicts in place of OrderedDicts, as the writers write every flock"""
+    if isinstance(sheared, dict):
+        return {key: plain(value) for key, value in sheared.items()}
+    if isinstance(sheared, list):
+        return [plain(value) for value in sheared]
+    return sheared
+
+
+class ExportTestCase(unittest.TestCase):
+    """
+    Tests of writing sheared flocks as they are evaluated
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"level": 2, "stats": {"str": 3, "dex": 4}, "empty": {}, 3: "three", "gear": FlockList(["sword", FlockList()])})
+        self.flock["double"] = lambda: self.flock["level"] * 2
+        self.flock["table"] = lambda: {"a": [1, 2.5, {"b": None}], "c": "multi\nline"}
+        self.flock["sums"] = FlockAggregator([self.flock["stats"], {"str": 1}], sum)
+
+    def write(self, writer, collector, **kwargs) -> str:
+        stream = StringIO()
+        writer(collector, stream, **kwargs)
+        return stream.getvalue()
+
+    def test_json(self):
+        for indent in (None, 2, "\t"):
+            assert self.write(write_json, self.flock, indent=indent) == json.dumps(self.flock.shear(), indent=indent)
+        assert self.write(write_json, self.flock["gear"]) == '["sword", []]'
+        assert self.write(write_json, FlockDict()) == "{}"
+        with raises(TypeError):
+            self.write(write_json, FlockDict({(1, 2): 3}))
+
+    def test_jsonl(self):
+        lines = [json.loads(line) for line in self.write(write_jsonl, self.flock).splitlines()]
+        assert lines[:3] == [{"path": [3], "value": "three"}, {"path": ["double"], "value": 4}, {"path": ["empty"], "value": {}}]
+        assert {"path": ["gear", 1], "value": []} in lines and {"path": ["sums", "str"], "value": 4} in lines
+        assert len(lines) == 11
+
+    def test_yaml(self):
+        for dumper in {yaml.Dumper, getattr(yaml, "CDumper", yaml.Dumper)}:
+            written = self.write(write_yaml, self.flock, Dumper=dumper)
+            assert written == yaml.dump(plain(self.flock.shear()), Dumper=dumper, sort_keys=False)
+        shared = [1, 2]
+        self.flock["shared"] = lambda: {"x": shared, "y": shared}
+        written = self.write(write_yaml, self.flock, explicit_start=True, default_flow_style=None)
+        assert written.startswith("---\n") and "&id001" in written
+        assert yaml.safe_load(written) == self.flock.shear()
+
+    def test_record_errors(self):
+        self.flock["stats"]["bad"] = lambda: 1 / 0
+        with raises(FlockException):
+            self.write(write_json, self.flock)
+        assert "Error calculating key:bad" in json.loads(self.write(write_json, self.flock, record_errors=True, default=str))["stats"]["bad"]
+        assert "Error calculating key:bad" in self.write(write_jsonl, self.flock, record_errors=True, default=str)
+        assert "!!python/object" in self.write(write_yaml, self.flock, record_errors=True)
+
+    def test_closure_collector(self):
+        collector = ClosureCollector(level=2, nested=FlockDict({"a": 1}), none=ClosureCollector())
+        collector.double = lambda: collector.level * 2
+        assert json.loads(self.write(write_json, collector)) == {"double": 4, "level": 2, "nested": {"a": 1}, "none": {}}
+        assert yaml.safe_load(self.write(write_yaml, collector)) == {"double": 4, "level": 2, "nested": {"a": 1}, "none": {}}
+
+
+if __name__ == "__main__":
+    unittest.main()
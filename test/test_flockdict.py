@@ -1,9 +1,17 @@
-from types import FunctionType
+import asyncio
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from types import FunctionType, SimpleNamespace
 
-from pytest import raises
+from pytest import raises, warns
 
 from closure_collector.closures import index_reference, toggle
-from flock.core import Aggregator, FlockAggregator, FlockDict, FlockList, MetaAggregator
+from closure_collector.dependencies import KEYS
+from closure_collector.parallel import plan
+from closure_collector.util import Constant
+from flock.core import Aggregator, FlockAggregator, FlockDict, FlockList, MetaAggregator, SourceList
 from flock.util import FlockException
 
 __author__ = "Andy Fundinger"
@@ -131,6 +139,38 @@ class BasicFlockTestCase(unittest.TestCase):
         assert all(isinstance(x, FunctionType) for x in self.flock.ruleset().values())
 
 
+class ConstantStorageTestCase(unittest.TestCase):
+    """
+    Tests that data values are stored as constants rather than rules
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"a": 1, "b": "text", "items": [1, 2]})
+        self.flock["double"] = lambda: self.flock["a"] * 2
+
+    def test_constants_are_not_cached(self):
+        assert self.flock.promises["a"].value == 1
+        assert (self.flock["a"], self.flock["b"], self.flock["double"]) == (1, "text", 2)
+        assert list(self.flock.cache) == ["double"]
+
+    def test_writes_reach_readers(self):
+        assert self.flock["double"] == 2
+        self.flock["a"] = 5
+        assert self.flock["double"] == 10
+
+    def test_dataset_and_ruleset(self):
+        assert self.flock.dataset() == {"a": 1, "b": "text"}
+        assert sorted(self.flock.ruleset()) == ["double", "items"]
+        assert isinstance(self.flock.ruleset()["items"], Constant)
+
+    def test_flock_list(self):
+        flock_list = FlockList([1, lambda: 2])
+        assert isinstance(flock_list.promises[0], Constant)
+        assert list(flock_list) == [1, 2]
+        assert list(flock_list.cache) == [1]
+
+
 class FlockListTestCase(unittest.TestCase):
     """
     Tests of the basic operations of a flock
@@ -343,6 +383,190 @@ class FlockAggregatorTestCase(unittest.TestCase):
         return self.assertSetEqual(set(param), set(param1), *args, **kwargs)
 
 
+class CachedAggregatorTestCase(unittest.TestCase):
+    """
+    Tests that FlockAggregator caches its results until its sources change
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.flock = FlockDict({"x": {1: 1, 2: 2}, "y": {1: 10, 2: 20}})
+        self.aggregator = FlockAggregator(SourceList([self.flock["x"], self.flock["y"]]), self.total)
+        self.flock["sum"] = self.aggregator
+
+    def total(self, values):
+        self.calls.append(values)
+        return sum(values)
+
+    def test_results_are_cached(self):
+        assert (self.aggregator[1], self.aggregator[2], self.aggregator[1]) == (11, 22, 11)
+        assert self.calls == [[1, 10], [2, 20]]
+
+    def test_source_writes(self):
+        assert (self.aggregator[1], self.aggregator[2]) == (11, 22)
+        self.flock["y"][2] = 30
+        assert (self.aggregator[1], self.aggregator[2]) == (11, 32)
+        assert self.calls == [[1, 10], [2, 20], [2, 30]]
+        self.flock["y"][3] = 3
+        assert self.aggregator.shear() == {1: 11, 2: 32, 3: 3}
+
+    def test_changing_sources(self):
+        assert self.aggregator[1] == 11
+        self.aggregator.sources.append(FlockDict({1: 100}))
+        assert self.aggregator[1] == 111
+        self.aggregator.sources[0] = FlockDict({1: 0})
+        assert self.aggregator[1] == 110
+        del self.aggregator.sources[0]
+        assert self.aggregator[1] == 110
+        self.aggregator.sources += [FlockDict({1: 5})]
+        assert self.aggregator[1] == 115
+        self.aggregator.sources.sort(key=lambda source: source[1], reverse=True)
+        assert self.aggregator[1] == 115 and self.calls[-1] == [100, 10, 5]
+        assert self.aggregator.sources.append.__name__ == "append"
+
+    def test_plain_list(self):
+        given = [self.flock["x"]]
+        aggregator = FlockAggregator(given, self.total)
+        assert aggregator.sources is given and not aggregator.is_tracked()
+        assert (aggregator[1], aggregator[1]) == (1, 1) and len(self.calls) == 2
+        given.append(self.flock["y"])
+        assert aggregator[1] == 11
+        given[0] = FlockDict({1: 5})
+        assert aggregator[1] == 15
+        self.flock["double"] = lambda: aggregator[1] * 2
+        assert self.flock["double"] == 30
+        given.pop()
+        assert self.flock["double"] == 10
+
+    def test_source_list_owner(self):
+        sources = SourceList([self.flock["x"]])
+        aggregator = FlockAggregator(sources, sum)
+        assert sources.owner is aggregator and aggregator.is_tracked()
+        other = FlockAggregator(sources, sum)
+        assert sources.owner is aggregator and not other.is_tracked()
+        assert (aggregator[1], other[1]) == (1, 1)
+        sources.append(self.flock["y"])
+        assert (aggregator[1], other[1]) == (11, 11)
+
+    def test_readers(self):
+        self.flock["double"] = lambda: self.flock["sum"][1] * 2
+        assert self.flock["double"] == 22
+        self.flock["x"][1] = 2
+        assert self.flock["double"] == 24
+
+    def test_untracked_sources_are_not_cached(self):
+        plain = {1: 1}
+        aggregator = FlockAggregator([plain, self.flock["y"]], self.total)
+        assert aggregator[1] == 11
+        plain[1] = 5
+        assert aggregator[1] == 15
+        outer = FlockAggregator([aggregator, self.flock["x"]], sum)
+        assert outer[1] == 16
+        plain[1] = 0
+        assert outer[1] == 11
+
+    def test_callable_sources(self):
+        party = [FlockDict({"x": 1})]
+        aggregator = FlockAggregator(lambda: party, sum)
+        assert not aggregator.is_tracked()
+        assert (aggregator["x"], len(aggregator), aggregator.shear()) == (1, 1, {"x": 1})
+        party.append(FlockDict({"x": 5, "y": 2}))
+        assert (aggregator["x"], len(aggregator), aggregator.shear()) == (6, 2, {"x": 6, "y": 2})
+        shared = FlockAggregator(lambda: self.aggregator.sources, self.total)
+        assert shared.is_tracked() and shared[1] == 11
+        self.aggregator.sources.append(FlockDict({1: 100}))
+        assert shared[1] == 111
+
+    def test_lazy(self):
+        flock = FlockDict({"x": {1: 1}, "y": {1: 10}}, lazy=True)
+        eager = FlockAggregator(SourceList([flock["x"], flock["y"]]), self.total)
+        lazy = FlockAggregator(SourceList([flock["x"], flock["y"]]), self.total, lazy=True)
+        assert (eager[1], eager[1], lazy[1], lazy[1]) == (11, 11, 11, 11)
+        assert len(self.calls) == 3
+        flock["y"][1] = 20
+        assert (eager[1], lazy[1]) == (21, 21)
+
+    def test_pickle(self):
+        assert self.aggregator[1] == 11
+        flock = pickle.loads(pickle.dumps(FlockDict({"x": {1: 1}, "y": {1: 10}, "sum": FlockAggregator(SourceList(), sum)})))
+        aggregator = flock.promises["sum"]
+        aggregator.sources.extend([flock["x"], flock["y"]])
+        assert flock["sum"][1] == 11
+        flock["y"][1] = 20
+        assert flock["sum"][1] == 21
+
+
+class AggregatorIndexTestCase(unittest.TestCase):
+    """
+    Tests of the index of keys to sources kept by FlockAggregator
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.x = FlockDict({1: 1, 2: 2})
+        self.y = FlockDict({2: 20, 3: 30})
+        self.aggregator = FlockAggregator(SourceList([self.x, self.y]), sum)
+        self.builds = 0
+        build_index = self.aggregator.build_index
+
+        def counted():
+            self.builds += 1
+            return build_index()
+
+        self.aggregator.build_index = counted
+
+    def test_index(self):
+        assert self.aggregator.index() == {1: [self.x], 2: [self.x, self.y], 3: [self.y]}
+        assert self.aggregator.sources_for(2) == [self.x, self.y]
+        assert self.aggregator.sources_for(4) == []
+        assert (len(self.aggregator), 3 in self.aggregator, 4 in self.aggregator) == (3, True, False)
+        assert sorted(self.aggregator) == [1, 2, 3]
+        assert self.aggregator.shear() == {1: 1, 2: 22, 3: 30}
+        assert self.builds == 1
+
+    def test_value_writes_keep_index(self):
+        assert self.aggregator[2] == 22
+        self.y[2] = 40
+        assert (self.aggregator[2], len(self.aggregator)) == (42, 3)
+        assert self.builds == 1
+
+    def test_key_changes(self):
+        assert len(self.aggregator) == 3
+        self.y[4] = 4
+        assert (len(self.aggregator), self.aggregator[4]) == (4, 4)
+        del self.x[2]
+        assert (self.aggregator.sources_for(2), self.aggregator[2]) == ([self.y], 20)
+        self.aggregator.sources.append(FlockDict({5: 5}))
+        assert sorted(self.aggregator) == [1, 2, 3, 4, 5]
+        assert self.builds == 4
+
+    def test_readers_of_keys(self):
+        flock = FlockDict({"count": lambda: len(self.aggregator)})
+        assert flock["count"] == 3
+        self.x[9] = 9
+        assert flock["count"] == 4
+
+    def test_untracked(self):
+        plain = {7: 7}
+        aggregator = FlockAggregator([plain, self.x], sum)
+        assert sorted(aggregator) == [1, 2, 7]
+        plain[8] = 8
+        assert (len(aggregator), 8 in aggregator, aggregator[8]) == (4, True, 8)
+        assert aggregator.sources_for(2) == [self.x] and list(aggregator) == [7, 8, 1, 2]
+
+    def test_untracked_lookups(self):
+        aggregator = FlockAggregator([{7: 7}, self.x], sum)
+        builds = []
+        aggregator.build_index = lambda: builds.append(1)
+        assert (len(aggregator), 1 in aggregator, 4 in aggregator, aggregator.sources_for(7)) == (3, True, False, [{7: 7}])
+        assert aggregator.shear() == {7: 7, 1: 1, 2: 2} and not builds
+
+    def test_explicit_keys(self):
+        aggregator = FlockAggregator([self.x, self.y], sum, keys=[2])
+        assert (list(aggregator), len(aggregator), 2 in aggregator, 1 in aggregator) == ([2], 1, True, True)
+
+
 class ShearTestCase(unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -373,5 +597,597 @@ class ShearTestCase(unittest.TestCase):
         assert "D" in self.flock["d"]
 
 
+class DependencyInvalidationTestCase(unittest.TestCase):
+    """
+    Tests that writes only drop the cached values computed from the written key
+    """
+
+    lazy = False
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.flock = FlockDict(lazy=self.lazy)
+        self.flock["level"] = 3
+        self.flock["strength"] = 10
+        self.flock["stats"] = {"mental": 2, "physical": 5}
+        self.flock["points"] = self.counted("points", lambda: self.flock["level"] * self.flock["stats"]["mental"])
+        self.flock["carry"] = self.counted("carry", lambda: self.flock["strength"] * 10)
+
+    def counted(self, name, func):
+        def promise():
+            self.calls.append(name)
+            return func()
+
+        return promise
+
+    def test_unrelated_write_keeps_cache(self):
+        assert self.flock["points"] == 6
+        assert self.flock["carry"] == 100
+        self.flock["strength"] = 12
+        assert self.flock["points"] == 6
+        assert self.flock["carry"] == 120
+        assert self.calls == ["points", "carry", "carry"]
+
+    def test_nested_write(self):
+        assert self.flock["points"] == 6
+        assert self.flock["carry"] == 100
+        self.flock["stats"]["mental"] = 4
+        assert self.flock["points"] == 12
+        assert self.flock["carry"] == 100
+        assert self.calls == ["points", "carry", "points"]
+
+    def test_transitive_write(self):
+        self.flock["double"] = self.counted("double", lambda: self.flock["points"] * 2)
+        assert self.flock["double"] == 12
+        self.flock["level"] = 4
+        assert self.flock["double"] == 16
+        assert self.calls == ["double", "points", "double", "points"]
+
+    def test_new_and_deleted_keys(self):
+        self.flock["total"] = self.counted("total", lambda: sum(self.flock["stats"].values()))
+        self.flock["maybe"] = self.counted("maybe", lambda: self.flock["extra"] if "extra" in self.flock else 0)
+        assert self.flock["total"] == 7
+        assert self.flock["maybe"] == 0
+        self.flock["stats"]["heroic"] = 1
+        self.flock["extra"] = 5
+        assert self.flock["total"] == 8
+        assert self.flock["maybe"] == 5
+        del self.flock["stats"]["heroic"]
+        assert self.flock["total"] == 7
+
+    def test_deleted_key_versions(self):
+        self.flock["maybe"] = self.counted("maybe", lambda: self.flock.get("temp", 0))
+        self.flock["temp"] = 1
+        assert (self.flock["maybe"], self.flock["points"]) == (1, 6)
+        for key in range(30):
+            self.flock[key] = key
+        for key in range(30):
+            del self.flock[key]
+        del self.flock["temp"]
+        assert len(self.flock.versions) < 30
+        assert self.flock.versions.get(0) == self.flock.versions.floor > 0 and self.flock.versions.get(0, -1) == -1
+        assert (self.flock["maybe"], self.flock["points"]) == (0, 6)
+        self.flock["temp"] = 2
+        assert self.flock["maybe"] == 2
+        assert self.calls.count("maybe") == 3
+
+    def test_flock_list(self):
+        self.flock["skills"] = FlockList([1, 2, 3], lazy=self.lazy)
+        self.flock["last"] = self.counted("last", lambda: self.flock["skills"][-1])
+        self.flock["count"] = self.counted("count", lambda: len(self.flock["skills"]))
+        assert self.flock["last"] == 3
+        assert self.flock["count"] == 3
+        self.flock["skills"][2] = 4
+        assert self.flock["last"] == 4
+        assert self.flock["count"] == 3
+        self.flock["skills"].append(5)
+        assert self.flock["last"] == 5
+        assert self.flock["count"] == 4
+        assert self.calls == ["last", "count", "last", "last", "count"]
+
+    def test_aggregator(self):
+        self.flock["x"] = {1: 1, 2: 2}
+        self.flock["y"] = {1: 10, 2: 20}
+        self.flock["sum"] = FlockAggregator(SourceList([self.flock["x"], self.flock["y"]]), sum)
+        self.flock["one"] = self.counted("one", lambda: self.flock["sum"][1])
+        self.flock["two"] = self.counted("two", lambda: self.flock["sum"][2])
+        assert self.flock["one"] == 11
+        assert self.flock["two"] == 22
+        self.flock["y"][2] = 30
+        assert self.flock["one"] == 11
+        assert self.flock["two"] == 32
+        assert self.calls == ["one", "two", "two"]
+
+    def test_other_flock(self):
+        other = FlockDict({"source": 1, "derived": self.counted("derived", lambda: self.flock["level"] + 1)}, lazy=self.lazy)
+        assert other["derived"] == 4
+        self.flock["level"] = 5
+        assert other["derived"] == 6
+        other["source"] = 2
+        assert other["derived"] == 6
+        assert self.calls == ["derived", "derived"]
+
+    def test_clear_cache(self):
+        assert self.flock["carry"] == 100
+        self.flock.clear_cache()
+        assert not self.flock.cache
+        assert self.flock["carry"] == 100
+        assert self.calls == ["carry", "carry"]
+
+    def test_eager_write(self):
+        assert self.flock["points"] == 6
+        self.flock["level"] = 4
+        assert "points" not in self.flock.cache
+        assert "level" not in self.flock.dependents
+
+
+class LazyValidationTestCase(DependencyInvalidationTestCase):
+    """
+    Tests that lazy flocks only change versions on write and check them when cached values are read
+    """
+
+    lazy = True
+
+    def test_nested_flocks_inherit(self):
+        assert self.flock["stats"].lazy
+        self.flock["more"] = {"deeper": {"x": 1}}
+        assert self.flock["more"]["deeper"].lazy
+
+    def test_eager_write(self):
+        assert self.flock["points"] == 6
+        before = self.flock.versions["level"]
+        self.flock["level"] = 4
+        assert self.flock.versions["level"] != before
+        assert "points" in self.flock.cache
+        assert not self.flock.dependents
+        assert self.flock["points"] == 8
+
+    def test_error_after_write(self):
+        self.flock["ratio"] = self.counted("ratio", lambda: 12 // self.flock["points"])
+        self.flock["wrapped"] = self.counted("wrapped", lambda: self.flock["ratio"] + 1)
+        assert self.flock["wrapped"] == 3
+        self.flock["level"] = 0
+        with raises(FlockException):
+            assert self.flock["wrapped"] != 3
+        assert isinstance(self.flock.shear(record_errors=True)["wrapped"].__cause__.__cause__, ZeroDivisionError)
+        self.flock["level"] = 1
+        assert self.flock["wrapped"] == 7
+
+    def test_repeat_reads_skip_checks(self):
+        assert self.flock["points"] == 6
+        stamp = self.flock.stamps["points"]
+        self.flock["strength"] = 11
+        assert self.flock["points"] == 6
+        assert self.flock.stamps["points"] is stamp
+        assert self.calls == ["points"]
+
+
+class BatchTestCase(unittest.TestCase):
+    """
+    Tests of deferring invalidation to the end of a batch of writes
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"a": 1, "b": 2, "nested": {"c": 3}, "items": [1, 2]})
+        self.flock["total"] = lambda: self.flock["a"] + self.flock["b"] + self.flock["nested"]["c"]
+        assert self.flock["total"] == 6
+
+    def test_writes_are_queued(self):
+        nested = self.flock["nested"]
+        with self.flock.batch() as batch:
+            self.flock["a"] = 10
+            nested["c"] = 30
+            assert len(batch.pending) == 2
+            assert "total" in self.flock.cache
+        assert not batch.pending
+        assert "total" not in self.flock.cache
+        assert self.flock["total"] == 42
+
+    def test_read_flushes(self):
+        with self.flock.batch() as batch:
+            self.flock["a"] = 10
+            assert self.flock["total"] == 15
+            assert not batch.pending
+            self.flock["b"] = 20
+        assert self.flock["total"] == 33
+
+    def test_nested_batches(self):
+        with self.flock.batch() as outer:
+            with self.flock["nested"].batch() as inner:
+                self.flock["nested"]["c"] = 0
+            assert inner is outer
+            assert outer.pending
+        assert self.flock["total"] == 3
+
+    def test_flock_list(self):
+        flock_list = FlockList([1, 2])
+        self.flock["first"] = lambda: flock_list[0]
+        assert self.flock["first"] == 1
+        with flock_list.batch():
+            flock_list.insert(0, 0)
+            assert "first" in self.flock.cache
+        assert self.flock["first"] == 0
+
+    def test_error_in_batch(self):
+        with raises(ZeroDivisionError):
+            with self.flock.batch():
+                self.flock["a"] = 5
+                assert 1 / 0
+        assert self.flock["total"] == 10
+
+
+class BulkConstructionTestCase(unittest.TestCase):
+    """
+    Tests of building and extending flocks many values at a time
+    """
+
+    def test_from_mapping(self):
+        flock = FlockDict.from_mapping({"a": 1, "b": {"c": 2}, "d": lambda: 4})
+        assert flock.shear() == {"a": 1, "b": {"c": 2}, "d": 4}
+        assert isinstance(flock["b"], FlockDict)
+        assert flock["b"].root is flock
+        assert FlockDict.from_mapping([("a", 1), ("b", 2)]) == {"a": 1, "b": 2}
+
+    def test_update(self):
+        flock = FlockDict({"a": 1, "b": 2})
+        flock["total"] = lambda: sum(flock[key] for key in flock if key != "total")
+        assert flock["total"] == 3
+        flock.update({"a": 10}, c=5)
+        assert flock["total"] == 17
+        flock.update([("b", 0)])
+        assert flock["total"] == 15
+
+    def test_update_failing_partway(self):
+        class Broken(dict):
+            def items(self):
+                raise ValueError("broken")
+
+        flock = FlockDict({"a": 1, "b": 2})
+        flock["total"] = lambda: flock["a"] + flock["b"]
+        assert flock["total"] == 3
+        with raises(ValueError):
+            flock.update({"a": 10, "b": Broken()})
+        assert (flock["a"], flock["b"], flock["total"]) == (1, 2, 3)
+
+        def items():
+            yield "a", 10
+            raise ValueError("broken")
+
+        with raises(ValueError):
+            flock.update(items())
+        assert (flock["a"], flock["total"]) == (1, 3)
+
+    def test_update_invalidates_once(self):
+        flock = FlockDict()
+        invalidated = []
+        flock.invalidate = lambda *keys: invalidated.append(keys)
+        flock.update({"a": 1, "b": 2})
+        assert invalidated == [("a", "b", KEYS)]
+
+    def test_from_iterable(self):
+        flock_list = FlockList.from_iterable(x * 2 for x in range(3))
+        assert flock_list.shear() == [0, 2, 4]
+        assert FlockList([{"a": 1}])[0]["a"] == 1
+
+    def test_extend(self):
+        flock_list = FlockList([1, 2])
+        flock = FlockDict({"first": lambda: flock_list[0], "last": lambda: flock_list[-1], "size": lambda: len(flock_list)})
+        assert (flock["first"], flock["last"], flock["size"]) == (1, 2, 2)
+        flock_list.extend([3, 4])
+        assert "first" in flock.cache
+        assert (flock["first"], flock["last"], flock["size"]) == (1, 4, 4)
+        flock_list.extend(flock_list)
+        assert flock_list.shear() == [1, 2, 3, 4, 1, 2, 3, 4]
+
+
+class IncrementalShearTestCase(unittest.TestCase):
+    """
+    Tests that shearing again only rebuilds the parts of a flock that changed
+    """
+
+    lazy = False
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"name": "ann", "stats": {"str": 3, "dex": 4}, "skills": {"run": 1}}, lazy=self.lazy)
+        stats = self.flock["stats"]
+        self.flock["total"] = lambda: stats["str"] + stats["dex"]
+        self.flock["levels"] = FlockList([1, 2], lazy=self.lazy)
+
+    def test_unchanged_subtrees_are_reused(self):
+        first = self.flock.cached_shear()
+        second = self.flock.cached_shear()
+        assert first is second
+        assert self.flock.shear() == first and self.flock.shear() is not first
+
+    def test_only_dirty_paths_are_rebuilt(self):
+        first = self.flock.cached_shear()
+        self.flock["stats"]["dex"] = 10
+        second = self.flock.cached_shear()
+        assert second["stats"] == {"dex": 10, "str": 3}
+        assert second["total"] == 13
+        assert first["stats"] == {"dex": 4, "str": 3}
+        assert first["skills"] is second["skills"]
+        assert first["levels"] is second["levels"]
+
+    def test_keys_added_and_removed(self):
+        self.flock.shear()
+        self.flock["skills"]["jump"] = 2
+        self.flock["levels"].append(3)
+        sheared = self.flock.shear()
+        assert sheared["skills"] == {"jump": 2, "run": 1}
+        assert sheared["levels"] == [1, 2, 3]
+        del self.flock["name"]
+        assert "name" not in self.flock.shear()
+
+    def test_result_can_be_modified(self):
+        sheared = self.flock.shear()
+        sheared.pop("name")
+        assert self.flock.shear()["name"] == "ann"
+        sheared = self.flock["levels"].shear()
+        sheared.append(5)
+        assert self.flock["levels"].shear() == [1, 2]
+
+    def test_nested_result_can_be_modified(self):
+        self.flock["party"] = FlockAggregator(SourceList([self.flock["stats"]]), sum)
+        self.flock["levels"].append({"deep": [1]})
+        sheared = self.flock.shear()
+        sheared["stats"]["str"] = 99
+        sheared["skills"].clear()
+        sheared["levels"][2]["deep"].append(2)
+        sheared["party"]["dex"] = 0
+        assert self.flock.shear() == {
+            "levels": [1, 2, {"deep": [1]}],
+            "name": "ann",
+            "party": {"str": 3, "dex": 4},
+            "skills": {"run": 1},
+            "stats": {"dex": 4, "str": 3},
+            "total": 7,
+        }
+
+    def test_record_errors(self):
+        self.flock["stats"]["bad"] = lambda: 1 / 0
+        assert isinstance(self.flock.shear(record_errors=True)["stats"]["bad"], FlockException)
+        with raises(FlockException):
+            self.flock.shear()
+        self.flock["stats"]["bad"] = 0
+        assert self.flock.shear()["stats"]["bad"] == 0
+        assert self.flock.shear(record_errors=True)["stats"]["bad"] == 0
+
+    def test_aggregator(self):
+        self.flock["party"] = FlockDict({"a": {"x": 1}, "b": {"x": 2}}, lazy=self.lazy)
+        party = self.flock["party"]
+        self.flock["sum"] = FlockAggregator([party["a"], party["b"]], sum)
+        assert self.flock.shear()["sum"] == {"x": 3}
+        party["b"]["x"] = 5
+        assert self.flock.shear()["sum"] == {"x": 6}
+
+    def test_untracked_sources(self):
+        totals = [{"x": 1}]
+        plain = {"x": 2}
+        self.flock["sum"] = FlockAggregator(lambda: totals, sum)
+        self.flock["other"] = FlockAggregator([plain], sum)
+        self.flock["nested"] = {"total": lambda: self.flock["sum"]["x"]}
+        assert self.flock.shear()["sum"] == {"x": 1}
+        totals.append({"x": 5})
+        plain["x"] = 3
+        sheared = self.flock.shear()
+        assert (sheared["sum"], sheared["other"], sheared["nested"]["total"]) == ({"x": 6}, {"x": 3}, 6)
+        assert self.flock["sum"]["x"] == 6
+
+    def test_clear_cache(self):
+        data = {"value": 1}
+        self.flock["external"] = lambda: data["value"]
+        assert self.flock.shear()["external"] == 1
+        data["value"] = 2
+        self.flock.clear_cache()
+        assert self.flock.shear()["external"] == 2
+
+
+class LazyIncrementalShearTestCase(IncrementalShearTestCase):
+    """
+    Tests of shearing lazy flocks again
+    """
+
+    lazy = True
+
+
+class ParallelShearTestCase(unittest.TestCase):
+    """
+    Tests of shearing independent parts of a flock concurrently
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.lock = Lock()
+        self.party = FlockDict()
+        for name in ("ann", "bob", "cat"):
+            character = FlockDict({"strength": len(name), "level": 2})
+            character["attack"] = self.counted(name, lambda character=character: character["strength"] * character["level"])
+            self.party[name] = character
+
+    def counted(self, name, func):
+        def promise():
+            with self.lock:
+                self.calls.append(name)
+            return func()
+
+        return promise
+
+    def test_plan(self):
+        party = self.party
+        party["best"] = lambda: max(party[name]["attack"] for name in ("ann", "bob", "cat"))
+        ann, bob = party["ann"], party["bob"]
+        party["pair"] = FlockDict({"total": lambda: ann["level"] + bob["level"]})
+        groups, shared = plan(party)
+        assert shared == ["best"]
+        assert sorted(sorted(group) for group in groups) == [["ann", "bob", "pair"], ["cat"]]
+
+    def test_plan_uses_recorded_reads(self):
+        flock = FlockDict({"a": 1, "b": 2})
+        holder = SimpleNamespace(flock=flock)
+        flock["c"] = lambda: holder.flock["a"]
+        assert sorted(sorted(group) for group in plan(flock)[0]) == [["a"], ["b"], ["c"]]
+        assert flock["c"] == 1
+        assert sorted(sorted(group) for group in plan(flock)[0]) == [["a", "c"], ["b"]]
+
+    def test_thread_pool(self):
+        party = self.party
+        party["best"] = lambda: max(party[name]["attack"] for name in ("ann", "bob", "cat"))
+        expected = party.shear()
+        party.clear_cache()
+        self.calls.clear()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            assert party.shear(executor=executor) == expected
+        assert sorted(self.calls) == ["ann", "bob", "cat"]
+        assert list(party.shear(executor=ThreadPoolExecutor(1))) == list(expected)
+
+    def test_flock_list(self):
+        flock_list = FlockList([{"a": 1, "b": lambda: 2}, lambda: 3, {"c": lambda: 5}])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert flock_list.shear(executor=executor) == [{"a": 1, "b": 2}, 3, {"c": 5}]
+
+    def test_record_errors(self):
+        self.party["bob"]["level"] = lambda: 1 / 0
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            with raises(FlockException):
+                self.party.shear(executor=executor)
+            sheared = self.party.shear(record_errors=True, executor=executor)
+        assert isinstance(sheared["bob"]["attack"], FlockException)
+        assert sheared["ann"]["attack"] == 6
+
+    def test_toggle(self):
+        flock = FlockDict({"x": toggle()})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert flock.shear(executor=executor) == {"x": True}
+
+    def test_process_pool(self):
+        flock = FlockDict({"a": partial(abs, -8), "b": {"c": partial(abs, -4), "e": 5}, "d": partial(divmod, 1, 0)})
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            with raises(FlockException):
+                flock.shear(executor=executor)
+            sheared = flock.shear(record_errors=True, executor=executor)
+        assert list(sheared) == ["a", "b", "d"]
+        assert sheared["a"] == 8
+        assert sheared["b"] == {"c": 4, "e": 5}
+        assert isinstance(sheared["d"], FlockException)
+
+    def test_process_pool_lambdas(self):
+        party = FlockDict()
+        for name in ("ann", "bob", "cat"):
+            character = FlockDict({"strength": len(name), "level": 2})
+            character["attack"] = partial(lambda character: character["strength"] * character["level"], character)
+            party[name] = character
+        party["best"] = lambda: max(party[name]["attack"] for name in ("ann", "bob", "cat"))
+        expected = party.shear()
+        party.clear_cache()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            assert party.shear(executor=executor) == expected
+            party["lock"] = Lock()
+            with warns(UserWarning, match="shearing it serially"):
+                assert party.shear(executor=executor) == {**expected, "lock": party["lock"]}
+
+
+class AsyncFlockTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests of coroutine functions as promises
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.running = 0
+        self.overlapped = False
+
+    def loader(self, name, value, delay=0.01):
+        async def load():
+            self.calls.append(name)
+            self.running += 1
+            self.overlapped = self.overlapped or self.running > 1
+            await asyncio.sleep(delay)
+            self.running -= 1
+            return value
+
+        return load
+
+    async def test_aget(self):
+        flock = FlockDict({"table": self.loader("table", [1, 2, 3]), "size": 2})
+        assert await flock.aget("table") == [1, 2, 3]
+        assert await flock.aget("size") == 2
+        assert flock["table"] == [1, 2, 3]
+        assert self.calls == ["table"]
+
+    async def test_sync_read_of_coroutine(self):
+        flock = FlockDict({"table": self.loader("table", [1, 2, 3])})
+        with raises(FlockException) as exc_info:
+            flock["table"]
+        assert isinstance(exc_info.value.__cause__, TypeError)
+        assert "aget" in str(exc_info.value.__cause__)
+
+    async def test_ashear(self):
+        flock = FlockDict({"a": self.loader("a", 1), "b": self.loader("b", 2), "nested": {"c": self.loader("c", 3)}})
+        flock["total"] = lambda: flock["a"] + flock["b"] + flock["nested"]["c"]
+        flock["list"] = FlockList([self.loader("d", 4), lambda: flock["total"] * 2])
+        assert await flock.ashear() == {"a": 1, "b": 2, "list": [4, 12], "nested": {"c": 3}, "total": 6}
+        assert self.overlapped
+        assert sorted(self.calls) == ["a", "b", "c", "d"]
+        assert flock.shear() == await flock.ashear()
+        assert sorted(self.calls) == ["a", "b", "c", "d"]
+
+    async def test_dependencies(self):
+        flock = FlockDict({"rate": 2})
+
+        async def scaled():
+            self.calls.append("scaled")
+            return await flock.aget("rate") * 10
+
+        flock["scaled"] = scaled
+        flock["other"] = self.loader("other", 0)
+        assert await flock.aget("scaled") == 20
+        flock["other"] = 1
+        assert await flock.aget("scaled") == 20
+        flock["rate"] = 3
+        assert await flock.aget("scaled") == 30
+        assert self.calls == ["scaled", "scaled"]
+
+    async def test_shared_await(self):
+        flock = FlockDict({"table": self.loader("table", [1, 2, 3])})
+        assert await asyncio.gather(flock.aget("table"), flock.aget("table")) == [[1, 2, 3], [1, 2, 3]]
+        assert self.calls == ["table"]
+
+    async def test_loops(self):
+        flock = FlockDict({"table": self.loader("table", [1, 2, 3])})
+        assert await asyncio.gather(flock.aget("table"), asyncio.to_thread(asyncio.run, flock.aget("table"))) == [[1, 2, 3], [1, 2, 3]]
+
+    async def test_sync_promise_returning_coroutine(self):
+        flock = FlockDict({"table": lambda: self.loader("table", [1, 2, 3])()})
+        with raises(FlockException) as exc_info:
+            flock["table"]
+        assert "async def" in str(exc_info.value.__cause__)
+        with raises(FlockException) as exc_info:
+            await flock.aget("table")
+        assert "async def" in str(exc_info.value.__cause__)
+        assert self.calls == []
+
+    async def test_record_errors(self):
+        async def broken():
+            self.calls.append("broken")
+            return 1 / 0
+
+        flock = FlockDict({"a": self.loader("a", 1), "b": broken})
+        flock["c"] = lambda: flock["b"]
+        with raises(FlockException):
+            await flock.ashear()
+        sheared = await flock.ashear(record_errors=True)
+        assert sheared["a"] == 1
+        assert isinstance(sheared["b"], FlockException)
+        assert isinstance(sheared["b"].__cause__, ZeroDivisionError)
+        assert isinstance(sheared["c"], FlockException)
+        assert self.calls == ["a", "broken", "broken"]
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from functools import partial
+from pathlib import Path
+
+from pytest import raises
+
+from closure_collector.closures import index_reference
+from closure_collector.core import ClosureCollector
+from flock.benchmark import import_mythica, mythica_character
+from flock.core import FlockAggregator, FlockDict, FlockList
+from test.helpers import CALLS, called, scaled
+
+__author__ = "Andy Fundinger"
+
+
+def build() -> FlockDict:
+    """Build a small model whose rules close over it, as rules added by a function do"""
+    flock = FlockDict({"level": 2, "name": "Gorm", "stats": {"str": 3, "dex": 4}, "gear": FlockList(["sword"])})
+    flock["double"] = lambda: called("double", flock["level"] * 2)
+    flock["total"] = lambda: called("total", flock["double"] + sum(flock["stats"].values()))
+    flock["title"] = lambda: called("title", f"{flock['name']} the {len(flock['stats'])}")
+    flock["strength"] = index_reference(flock, "stats", "str")
+    flock["tripled"] = partial(scaled, flock, "level", 3)
+    flock["sums"] = FlockAggregator([flock["stats"], FlockDict({"str": 1})], sum)
+    flock["gear"].append(lambda: called("gear", flock["gear"][0].upper()))
+    return flock
+
+
+class ForkTestCase(unittest.TestCase):
+    """
+    Tests of copy-on-write forks of flocks
+    """
+
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+        self.flock = build()
+        self.sheared = self.flock.shear()
+
+    def test_shared(self):
+        scenario = self.flock.fork()
+        assert scenario is not self.flock and type(scenario) is FlockDict
+        assert scenario.shear() == self.sheared and scenario["stats"]["str"] == 3
+        assert CALLS == {"double": 1, "total": 1, "title": 1, "scaled": 1, "gear": 1}
+        assert not {"double", "total", "title"} & set(scenario.cache)
+
+    def test_override(self):
+        scenario = self.flock.fork()
+        scenario["level"] = 5
+        assert scenario["total"] == 17 and scenario["tripled"] == 15 and scenario["title"] == "Gorm the 2"
+        assert self.flock["total"] == 11 and self.flock["level"] == 2
+        assert CALLS == {"double": 2, "total": 2, "title": 1, "scaled": 2, "gear": 1}
+        assert set(scenario.cache) == {"double", "total", "tripled"}
+        scenario["level"] = 6
+        assert scenario["total"] == 19 and CALLS["total"] == 3
+        assert self.flock.shear() == self.sheared
+
+    def test_nested_override(self):
+        scenario = self.flock.fork()
+        scenario["stats"]["str"] = 10
+        assert scenario["total"] == 18 and scenario["strength"] == 10 and scenario["sums"]["str"] == 11
+        assert scenario["double"] == 4 and CALLS["double"] == 1
+        assert scenario.shear()["stats"] == {"dex": 4, "str": 10}
+        assert self.flock.shear() == self.sheared
+
+    def test_rule_override(self):
+        scenario = self.flock.fork()
+        scenario["double"] = lambda: scenario["level"] * 3
+        scenario["gear"][0] = "axe"
+        assert scenario["total"] == 13 and scenario["gear"][1] == "AXE"
+        assert self.flock["total"] == 11 and self.flock["gear"][1] == "SWORD"
+
+    def test_new_keys(self):
+        scenario = self.flock.fork()
+        scenario["stats"]["con"] = 5
+        assert scenario["total"] == 16 and scenario["title"] == "Gorm the 3" and len(scenario["stats"]) == 3
+        assert list(scenario["stats"]) == ["str", "dex", "con"] and "con" not in self.flock["stats"]
+        assert CALLS["title"] == 2
+
+    def test_original_changes(self):
+        scenario = self.flock.fork()
+        scenario["level"] = 5
+        assert scenario["total"] == 17
+        self.flock["stats"]["dex"] = 5
+        self.flock["name"] = "Bob"
+        self.flock["level"] = 3
+        assert scenario["total"] == 18 and scenario["title"] == "Bob the 2" and scenario["level"] == 5
+        assert self.flock["total"] == 14
+        flock = self.flock
+        flock["double"] = lambda: flock["level"] * 10
+        assert scenario["double"] == 50 and flock["double"] == 30
+
+    def test_many(self):
+        scenarios = [self.flock.fork() for _ in range(1000)]
+        for level, scenario in enumerate(scenarios):
+            scenario["level"] = level
+        assert [scenario["total"] for scenario in scenarios] == [2 * level + 7 for level in range(1000)]
+        assert scenarios[3]["title"] == "Gorm the 2" and CALLS["title"] == 1
+        views = scenarios[3].in_fork.views.values()
+        assert sum(len(view.cache) for view in views) == 2
+
+    def test_lazy(self):
+        flock = FlockDict({"level": 2, "stats": {"str": 3}}, lazy=True)
+        flock["total"] = lambda: flock["level"] + flock["stats"]["str"]
+        flock["name"] = lambda: called("name", "Gorm")
+        flock.shear()
+        scenario = flock.fork()
+        scenario["stats"]["str"] = 5
+        assert scenario["total"] == 7 and scenario["name"] == "Gorm" and flock["total"] == 5
+        assert CALLS["name"] == 1
+
+    def test_closure_collector(self):
+        flock = FlockDict({"level": 2})
+        flock["nested"] = ClosureCollector(bonus=1)
+        flock["total"] = lambda: flock["level"] + flock["nested"].bonus
+        scenario = flock.fork()
+        scenario["nested"].bonus = 5
+        assert scenario["total"] == 7 and flock["total"] == 3
+
+    def test_invalid(self):
+        scenario = self.flock.fork()
+        with raises(ValueError):
+            scenario.fork()
+        with raises(KeyError):
+            del scenario["level"]
+
+    def test_mythica(self):
+        model = import_mythica(Path(__file__).resolve().parents[1] / "examples")
+        character = model.apply_rules(mythica_character(model))
+        sheared = repr(character.shear())
+        scenario = character.fork()
+        scenario["level"] = 9
+        scenario["base_stats"]["Magic"] = 3
+        expected = model.apply_rules(mythica_character(model))
+        expected["level"] = 9
+        expected["base_stats"]["Magic"] = 3
+        assert repr(scenario.shear()) == repr(expected.shear())
+        assert repr(character.shear()) == sheared
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+from functools import partial
+from itertools import count
+
+from pytest import raises
+
+import flock.frame
+from closure_collector.closures import index_reference
+from flock.core import FlockAggregator, FlockDict, FlockList
+from flock.frame import FlockFrame, NotVectorizable
+from flock.util import FlockException
+
+__author__ = "Andy Fundinger"
+
+
+def scaled(flock, key, factor):
+    """A rule function to be bound into partials."""
+    return flock[key] * factor
+
+
+TICKS = count()
+GLOBAL_ORIGIN = FlockDict({"level": 1})
+GLOBAL_ORIGIN["double"] = lambda: GLOBAL_ORIGIN["level"] * 2
+GLOBAL_ORIGIN["tick"] = lambda: next(TICKS)
+
+
+def apply_rules(character):
+    """A small ruleset in the style of the mythica example."""
+    character["double"] = lambda: character["level"] * 2
+    character["label"] = lambda: character["name"].upper()
+    character["grade"] = lambda: "high" if character["level"] > 2 else "low"
+    character["ratio"] = lambda: character["level"] / character["div"]
+    character["tripled"] = partial(scaled, character, "level", 3)
+    character["strength"] = index_reference(character, "stats", "str")
+    character["points"] = {"base": 10}
+    character["points"]["total"] = lambda: character["points"]["base"] + character["double"]
+    return character
+
+
+class FlockFrameTestCase(unittest.TestCase):
+    """
+    Tests of evaluating a ruleset over a table of datasets
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.rows = [{"name": f"name {x}", "level": x, "div": x % 3, "stats": {"str": x * 10}} for x in range(6)]
+        self.origin = apply_rules(FlockDict(self.rows[0]))
+        self.frame = FlockFrame.from_flock(self.origin, self.rows)
+
+    def test_rows_match_flocks(self):
+        for row, data in zip(self.frame.shear(record_errors=True), self.rows, strict=True):
+            expected = apply_rules(FlockDict(data)).shear(record_errors=True)
+            assert list(row) == list(expected)
+            for key, value in expected.items():
+                if isinstance(value, Exception):
+                    assert (type(row[key]), str(row[key]), type(row[key].__cause__)) == (type(value), str(value), type(value.__cause__))
+                else:
+                    assert (row[key], type(row[key])) == (value, type(value))
+
+    def test_access(self):
+        assert len(self.frame) == 6
+        assert self.frame[-1]["tripled"] == 15
+        assert [row["double"] for row in self.frame[1:3]] == [2, 4]
+        assert self.frame.column("points", "total") == [10, 12, 14, 16, 18, 20]
+        assert self.frame.column("points")[2] == {"base": 10, "total": 14}
+        assert self.frame.row(4)["points"]["total"] == 18
+        assert sorted(self.frame.row(4)) == ["div", "double", "grade", "label", "level", "name", "points", "ratio", "stats", "strength", "tripled"]
+        with raises(FlockException):
+            self.frame.column("ratio")
+        with raises(IndexError):
+            self.frame[6]
+
+    def test_rules_over_columns(self):
+        assert self.frame.column("double") == [0, 2, 4, 6, 8, 10]
+        assert set(path for path, array in self.frame.arrays.items() if array is not None) == {("level",)}
+        with raises(NotVectorizable):
+            self.frame.array(("name",))
+
+    def test_rule_calls(self):
+        calls = []
+        origin = FlockDict({"level": 1, "name": "a"})
+        origin["double"] = lambda: calls.append("double") or origin["level"] * 2
+        origin["label"] = lambda: calls.append("label") or origin["name"].upper()
+        origin["shared"] = lambda: calls.append("shared") or len(calls)
+        frame = FlockFrame.from_flock(origin, [{"level": x, "name": str(x)} for x in range(100)])
+        assert frame.column("double")[99] == 198
+        assert frame.column("shared") == [2] * 100
+        assert frame.column("label")[:2] == ["0", "1"]
+        assert (calls.count("double"), calls.count("shared"), calls.count("label")) == (1, 1, 101)
+
+    def test_fallback_errors(self):
+        calls = []
+        origin = FlockDict({"level": 1})
+        origin["grade"] = lambda: "high" if origin["level"] > 2 else "low"
+        origin["broken"] = lambda: calls.append("broken") or origin["level"].missing
+        frame = FlockFrame.from_flock(origin, [{"level": x} for x in range(4)])
+        with self.assertLogs("flock.frame", "DEBUG") as logged:
+            assert frame.column("grade") == ["low", "low", "low", "high"]
+        assert "row by row" in logged.output[0] and "ValueError" in logged.output[0]
+        with raises(AttributeError):
+            frame.column("broken")
+        assert calls == ["broken"]
+
+    def test_exact_integers(self):
+        origin = FlockDict({"x": 1, "y": 0.5})
+        origin["square"] = lambda: origin["x"] * origin["x"]
+        origin["scaled"] = lambda: origin["x"] * origin["y"]
+        frame = FlockFrame.from_flock(origin, [{"x": x, "y": 0.5} for x in (3486784401, 2**40, True)])
+        assert frame.column("square") == [12157665459056928801, 2**80, 1]
+        assert frame.column("scaled") == [1743392200.5, 2**39, 0.5]
+        assert frame.arrays[("x",)].dtype == object and frame.arrays[("y",)].dtype == float
+
+    def test_globals(self):
+        frame = FlockFrame.from_flock(GLOBAL_ORIGIN, [{"level": x} for x in range(3)])
+        assert frame.column("double") == [0, 2, 4]
+        assert len(set(frame.column("tick"))) == 3
+
+    def test_without_numpy(self):
+        original = flock.frame.np
+        flock.frame.np = None
+        try:
+            frame = FlockFrame.from_flock(self.origin, self.rows)
+            assert frame.shear(record_errors=True)[1] == self.frame.shear(record_errors=True)[1]
+            assert not frame.arrays
+        finally:
+            flock.frame.np = original
+
+    def test_columns(self):
+        frame = FlockFrame(self.origin.ruleset(), {"name": ["a", "b"], "level": [1, 4], "div": [1, 2], "stats": [{"str": 1}, {"str": 2}]}, self.origin)
+        assert [row["grade"] for row in frame] == ["low", "high"]
+        with raises(ValueError):
+            FlockFrame(self.origin.ruleset(), {"name": ["a"], "level": [1, 2]}, self.origin)
+
+    def test_missing_keys(self):
+        frame = FlockFrame.from_flock(self.origin, [self.rows[1], {"name": "no level", "div": 1, "stats": {}}])
+        assert "level" not in frame.row(1)
+        sheared = frame.shear_row(1, record_errors=True)
+        assert isinstance(sheared["double"], FlockException) and isinstance(sheared["double"].__cause__, KeyError)
+        assert isinstance(sheared["strength"], FlockException)
+        assert frame[0]["double"] == 2
+
+    def test_unsupported_flocks(self):
+        with raises(TypeError):
+            FlockFrame({"list": FlockList([1, 2])}, [{}])
+        with raises(TypeError):
+            FlockFrame({"totals": FlockAggregator([FlockDict({"a": 1})], sum)}, [{}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from collections.abc import Mapping
+
+from pytest import raises
+
+from closure_collector.core import ClosureCollector, ShearedBase
+from flock.core import FlockAggregator, FlockDict, FlockException, FlockList
+
+__author__ = "Andy Fundinger"
+
+
+def flatten(sheared, path=()):
+    """The (path, value) leaves of a sheared form, for comparison with iter_shear()"""
+    if isinstance(sheared, ShearedBase):
+        sheared = dict(sorted(vars(sheared).items()))
+    if isinstance(sheared, Mapping | list) and sheared:
+        items = sheared.items() if isinstance(sheared, Mapping) else enumerate(sheared)
+        for key, value in items:
+            yield from flatten(value, path + (key,))
+    else:
+        yield path, sheared
+
+
+class IterShearTestCase(unittest.TestCase):
+    """
+    Tests of streaming the leaves of a shear with iter_shear()
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"level": 2, "stats": {"str": 3, "dex": 4}, "empty": {}, "gear": FlockList(["sword", "shield"])})
+        self.flock["double"] = lambda: self.flock["level"] * 2
+        self.flock["stats"]["bonus"] = lambda: self.flock["stats"]["str"] + self.flock["double"]
+        self.flock["sums"] = FlockAggregator([self.flock["stats"], {"str": 1}], sum)
+        self.flock["gear"].append(lambda: self.flock["gear"][0].upper())
+
+    def test_matches_shear(self):
+        leaves = list(self.flock.iter_shear())
+        assert leaves == list(flatten(self.flock.shear()))
+        assert leaves[:2] == [(("double",), 4), (("empty",), {})]
+        assert (("gear", 2), "SWORD") in leaves and (("sums", "str"), 4) in leaves
+        assert list(self.flock["gear"].iter_shear(path=("gear",))) == leaves[2:5]
+
+    def test_streams(self):
+        self.flock["stats"]["bad"] = lambda: 1 / 0
+        leaves = self.flock.iter_shear()
+        assert next(leaves) == (("double",), 4)
+        assert "bonus" not in self.flock["stats"].cache
+        with raises(FlockException):
+            list(leaves)
+
+    def test_record_errors(self):
+        self.flock["stats"]["bad"] = lambda: 1 / 0
+        self.flock["sums"] = FlockAggregator([self.flock["stats"]], sum)
+        leaves = dict(self.flock.iter_shear(record_errors=True))
+        assert isinstance(leaves["stats", "bad"], FlockException)
+        assert isinstance(leaves["sums", "bad"], FlockException)
+        assert leaves["stats", "bonus"] == 7
+        with raises(FlockException):
+            list(self.flock.iter_shear())
+
+    def test_empty(self):
+        assert list(FlockDict().iter_shear()) == [((), {})]
+        assert list(FlockList().iter_shear(path=("x",))) == [(("x",), [])]
+        assert list(FlockAggregator([], sum).iter_shear()) == [((), {})]
+
+    def test_closure_collector(self):
+        collector = ClosureCollector(level=2, nested=FlockDict({"a": 1}))
+        collector.double = lambda: collector.level * 2
+        collector.bad = lambda: 1 / 0
+        leaves = dict(collector.iter_shear(record_errors=True))
+        assert list(leaves) == [("bad",), ("double",), ("level",), ("nested", "a")]
+        assert leaves["double",] == 4 and leaves["nested", "a"] == 1
+        assert isinstance(leaves["bad",], Exception)
+        del collector.bad
+        assert list(collector.iter_shear()) == list(flatten(collector.shear()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+
+from pytest import approx
+
+from closure_collector.core import ClosureCollector
+from closure_collector.dependencies import KEYS
+from closure_collector.metrics import KeyMetrics, Metrics
+from flock.core import SHEARED, FlockAggregator, FlockDict, SourceList
+
+__author__ = "Andy Fundinger"
+
+
+class MetricsTestCase(unittest.TestCase):
+    """
+    Tests of recording per key metrics
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"level": 2, "stats": {"str": 3, "dex": 4}})
+        self.flock["double"] = lambda: self.flock["level"] * 2
+        self.flock["total"] = lambda: self.flock["double"] + sum(self.flock["stats"].values())
+        self.flock["points"] = {"base": 10}
+        self.flock["points"]["spare"] = lambda: self.flock["points"]["base"] - self.flock["double"]
+
+    def counts(self, metrics, path) -> tuple:
+        row = {row.path: row for row in metrics.rows()}[path]
+        return row.evaluations, row.hits, row.misses, row.invalidations
+
+    def test_counts(self):
+        with Metrics() as metrics:
+            self.flock["total"]
+            self.flock["total"]
+            self.flock["level"] = 3
+            self.flock["total"]
+        assert self.counts(metrics, ("total",)) == (2, 1, 2, 1)
+        assert self.counts(metrics, ("double",)) == (2, 0, 2, 1)
+        assert {row.path for row in metrics.rows()} == {("total",), ("double",), ("stats",)}
+
+    def test_times(self):
+        with Metrics() as metrics:
+            self.flock["total"]
+        rows = {row.path: row for row in metrics.rows()}
+        assert rows["total",].time >= rows["double",].time > 0
+        assert rows["total",].self_time == approx(rows["total",].time - rows["double",].time - rows["stats",].time, abs=1e-9)
+        assert rows["double",].self_time == rows["double",].time
+
+    def test_paths(self):
+        self.flock["sums"] = FlockAggregator([self.flock["stats"], {"str": 1}], sum)
+        loose = FlockAggregator([FlockDict({"a": 1})], sum)
+        self.flock["stats"]["loose"] = lambda: loose["a"]
+        collector = ClosureCollector(level=1)
+        collector.double = lambda: collector.level * 2
+        with Metrics() as metrics:
+            self.flock.shear()
+            collector.double
+        paths = [row.path for row in metrics.rows(sort="path")]
+        root = f"<FlockDict at {id(self.flock):#x}>"
+        for path in [("points", "spare"), ("sums", "str"), ("points", (SHEARED, False)), ((SHEARED, False),), ("double",)]:
+            assert (root, *path) in paths
+        assert (f"<FlockAggregator at {id(loose):#x}>", "a") in paths
+        assert (f"<ClosureCollector at {id(collector):#x}>", "double") in paths
+
+    def test_lazy(self):
+        flock = FlockDict({"level": 1}, lazy=True)
+        flock["double"] = lambda: flock["level"] * 2
+        with Metrics() as metrics:
+            flock["double"]
+            flock["level"] = 2
+            flock["double"]
+        assert self.counts(metrics, ("double",)) == (2, 0, 2, 1)
+
+    def test_recording(self):
+        self.flock["total"]
+        metrics = Metrics()
+        metrics.start()
+        self.flock["level"] = 5
+        with Metrics() as inner:
+            self.flock["total"]
+        self.flock["total"]
+        metrics.stop()
+        self.flock["level"] = 6
+        self.flock["total"]
+        assert self.counts(metrics, ("total",)) == (0, 1, 0, 1)
+        assert self.counts(inner, ("total",)) == (1, 0, 1, 0)
+        metrics.reset()
+        assert metrics.rows() == []
+
+    def test_root(self):
+        other = FlockDict({"level": 1})
+        other["double"] = lambda: other["level"] * 2
+        self.flock["sums"] = FlockAggregator(SourceList([self.flock["stats"]]), sum)
+        with self.flock["points"].metrics() as metrics:
+            self.flock["total"]
+            self.flock["sums"]["str"]
+            other["double"]
+        assert metrics.root is self.flock
+        assert {row.path for row in metrics.rows()} == {("total",), ("double",), ("stats",), ("sums",), ("sums", KEYS), ("sums", "str")}
+
+    def test_table(self):
+        with Metrics() as metrics:
+            self.flock.shear()
+        lines = metrics.table(sort="evaluations", limit=3).splitlines()
+        assert len(lines) == 4 and lines[0].split() == ["key", "evals", "time", "ms", "self", "ms", "hits", "misses", "invalid"]
+        assert "points / spare" in metrics.table()
+        assert repr(KeyMetrics(("a",), hits=1)) == "KeyMetrics(('a',), evaluations=0, time=0.0, self_time=0.0, hits=1, misses=0, invalidations=0)"
+
+
+if __name__ == "__main__":
+    unittest.main()
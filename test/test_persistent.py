@@ -0,0 +1,153 @@
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+from pathlib import Path
+
+from pytest import raises
+
+from closure_collector.cache import CachePolicy
+from closure_collector.core import ClosureCollector
+from closure_collector.persistent import PersistentCache
+from flock.core import FlockDict
+from test import helpers
+from test.helpers import CALLS
+
+__author__ = "Andy Fundinger"
+
+RATE = 2
+
+
+def rated(value):
+    """A helper reading a global, as rules may"""
+    return value * RATE
+
+
+def build(cache, level=2):
+    """Build a small model computing through cache"""
+    flock = FlockDict({"level": level, "stats": {"str": 3, "dex": 4}, "name": "Gorm"}, cache_policy=CachePolicy(persistent=cache))
+    flock["double"] = lambda: helpers.called("double", flock["level"] * 2)
+    flock["total"] = lambda: helpers.called("total", flock["double"] + sum(flock["stats"].values()))
+    flock["title"] = lambda: helpers.called("title", f"{flock['name']} the {len(flock['stats'])}")
+    flock["stats"]["best"] = lambda: helpers.called("best", max(flock["stats"]["str"], flock["stats"]["dex"]))
+    return flock
+
+
+class PersistentCacheTestCase(unittest.TestCase):
+    """
+    Tests of storing computed values on disk for later processes
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name) / "results.db"
+        CALLS.clear()
+
+    def cache(self, **kwargs) -> PersistentCache:
+        cache = PersistentCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_reused(self):
+        sheared = build(self.cache()).shear()
+        assert CALLS == {"double": 1, "total": 1, "title": 1, "best": 1}
+        cache = self.cache()
+        flock = build(cache)
+        assert flock.shear() == sheared
+        assert CALLS == {"double": 1, "total": 1, "title": 1, "best": 1}
+        assert cache.stats()["hits"] == 4 and cache.stats()["entries"] == 4
+
+    def test_changed_inputs(self):
+        build(self.cache()).shear()
+        flock = build(self.cache(), level=5)
+        assert flock["total"] == 21 and flock["title"] == "Gorm the 3"
+        assert CALLS == {"double": 2, "total": 2, "title": 1, "best": 1}
+        flock["stats"]["str"] = 9
+        assert flock["total"] == 32 and flock["stats"]["best"] == 9
+        assert CALLS == {"double": 2, "total": 3, "title": 1, "best": 2}
+        assert build(self.cache(), level=5)["total"] == 21
+        assert build(self.cache(), level=5)["total"] == 21
+        assert CALLS["total"] == 4
+
+    def test_changed_rules(self):
+        build(self.cache()).shear()
+        flock = build(self.cache())
+        flock["double"] = lambda: helpers.called("double", flock["level"] * 3)
+        assert flock["total"] == 17
+        assert CALLS == {"double": 2, "total": 2, "best": 1, "title": 1}
+
+    def test_not_stored(self):
+        cache = self.cache()
+        lock = threading.Lock()
+        flock = build(cache)
+        flock["locked"] = lambda: flock["level"] + lock.locked()
+        flock["unpicklable"] = lambda: lambda: flock["level"]
+        assert flock["locked"] == 2 and flock["unpicklable"]() == 2
+        assert len(cache) == 0 and cache.stats()["misses"] == 1
+
+    def test_changed_globals(self):
+        global RATE
+        self.addCleanup(setattr, sys.modules[__name__], "RATE", RATE)
+        for rate, hits in ((2, 0), (3, 0), (3, 3)):
+            RATE = rate
+            cache = self.cache()
+            flock = FlockDict({"x": 10}, cache_policy=CachePolicy(persistent=cache))
+            flock["y"] = lambda: flock["x"] * RATE
+            flock["z"] = lambda: rated(flock["x"])
+            flock["w"] = lambda: [rated(x) for x in (flock["x"],)][0]
+            assert (flock["y"], flock["z"], flock["w"]) == (10 * rate, 10 * rate, 10 * rate)
+            assert cache.stats()["hits"] == hits
+
+    def test_limits(self):
+        cache = self.cache(max_entries=2)
+        build(cache).shear()
+        assert len(cache) == 2 and cache.stats()["evictions"] == 2
+        cache = self.cache(max_bytes=0)
+        cache.clear()
+        build(cache).shear()
+        assert len(cache) == 0
+        with raises(ValueError):
+            PersistentCache(self.path, max_entries=0)
+        cache = pickle.loads(pickle.dumps(self.cache(max_entries=3)))
+        self.addCleanup(cache.close)
+        assert (cache.path, cache.max_entries) == (self.path, 3)
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_closure_collector(self):
+        for _ in range(2):
+            cache = self.cache()
+            collector = ClosureCollector(level=2, cache_policy=CachePolicy(persistent=cache))
+            collector.double = lambda: helpers.called("double", collector.level * 2)
+            assert collector.double == 4
+        assert CALLS["double"] == 1 and cache.stats()["hits"] == 1
+
+    def test_new_process(self):
+        script = textwrap.dedent(
+            f"""
+            from closure_collector.cache import CachePolicy
+            from closure_collector.persistent import PersistentCache
+            from flock.core import FlockDict
+
+            cache = PersistentCache({str(self.path)!r})
+            flock = FlockDict({{"level": 2, "stats": {{"str": 3}}}}, cache_policy=CachePolicy(persistent=cache))
+            flock["total"] = lambda: flock["level"] + sum(flock["stats"].values())
+            flock.shear()
+            print(cache.stats()["hits"], cache.stats()["misses"])
+            """
+        )
+        outputs = []
+        for seed in ("1", "2"):
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path), "PYTHONHASHSEED": seed}
+            outputs.append(subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout.split())
+        assert outputs == [["0", "1"], ["1", "0"]]
+
+
+if __name__ == "__main__":
+    unittest.main()
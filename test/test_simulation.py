@@ -0,0 +1,144 @@
+import random
+import statistics
+import unittest
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from math import isnan
+
+from pytest import approx, raises
+
+from flock.core import FlockAggregator, FlockDict
+from flock.simulation import Statistics, simulate
+
+__author__ = "Andy Fundinger"
+
+
+def model():
+    """A seeded model in the style of examples/simulate_characters.py, defined here so process pools can pickle it."""
+    char = FlockDict({"seed": 0, "bonus": 1})
+    char["rand"] = lambda: random.Random(char["seed"])
+    char["rolls"] = lambda: [char["rand"].randint(1, 6) for _ in range(3)]
+    char["total"] = lambda: sum(char["rolls"]) + char["bonus"]
+    char["luck"] = lambda: random.random() if char["seed"] >= 0 else None
+    char["odd"] = lambda: 1 / (char["seed"] % 2)
+    char["stats"] = {"best": lambda: max(char["rolls"])}
+    return char
+
+
+def uncompilable():
+    """A model whose keys are read through an aggregator, so cannot be compiled."""
+    char = model()
+    char["sums"] = FlockAggregator([char["stats"]], sum)
+    return char
+
+
+def expected(key, seeds):
+    """The values of key for each seed, from a model built for each."""
+    values = []
+    for seed in seeds:
+        random.seed(seed)
+        char = model()
+        char["seed"] = seed
+        values.append(char["stats"]["best"] if key == ("stats", "best") else char[key])
+    return values
+
+
+class StatisticsTestCase(unittest.TestCase):
+    """
+    Tests of running statistics
+    """
+
+    def test_add(self):
+        values = [3, 1.5, 7, 7, 2]
+        running, unbinned = Statistics(0.5), Statistics()
+        for value in values:
+            running.add(value)
+            unbinned.add(value)
+        assert (running.count, running.min, running.max) == (5, 1.5, 7)
+        assert running.mean == approx(statistics.mean(values))
+        assert running.variance == approx(statistics.variance(values))
+        assert running.stdev == approx(statistics.stdev(values))
+        assert running.histogram == Counter(values) and not unbinned.histogram
+        with raises(TypeError):
+            running.add("7")
+
+    def test_merge(self):
+        values = [float(x * x % 17) for x in range(40)]
+        whole, first, second = Statistics(5), Statistics(5), Statistics(5)
+        for value in values:
+            whole.add(value)
+        for value in values[:13]:
+            first.add(value)
+        for value in values[13:]:
+            second.add(value)
+        second.errors = 2
+        first.merge(second)
+        first.merge(Statistics(5))
+        assert (first.count, first.min, first.max, first.errors) == (whole.count, whole.min, whole.max, 2)
+        assert (first.mean, first.variance) == (approx(whole.mean), approx(whole.variance))
+        assert first.histogram == whole.histogram == Counter(value // 5 * 5 for value in values)
+
+    def test_empty(self):
+        empty = Statistics()
+        assert isnan(empty.variance) and empty.min is None
+        assert "count=0" in repr(empty)
+
+
+class SimulateTestCase(unittest.TestCase):
+    """
+    Tests of running a seeded model for many seeds
+    """
+
+    keys = ["total", "luck", "odd", ("stats", "best")]
+
+    def check(self, results, seeds):
+        for key in ["total", "luck", ("stats", "best")]:
+            values = expected(key, seeds)
+            assert results[key].count == len(values)
+            assert results[key].mean == approx(statistics.mean(values))
+            assert results[key].variance == approx(statistics.variance(values))
+            assert (results[key].min, results[key].max) == (min(values), max(values))
+        assert results["total"].histogram == Counter(expected("total", seeds))
+        assert (results["odd"].count, results["odd"].errors, results["odd"].histogram) == (len(seeds) // 2, len(seeds) // 2, Counter({1.0: len(seeds) // 2}))
+
+    bin_widths = {"total": 1, "odd": 1}
+
+    def test_simulate(self):
+        results = simulate(model, range(200), self.keys, bin_widths=self.bin_widths, chunk_size=64)
+        self.check(results, range(200))
+        again = simulate(model, range(200), self.keys, bin_widths=self.bin_widths, chunk_size=64)
+        assert [vars(statistics) for statistics in again.values()] == [vars(statistics) for statistics in results.values()]
+
+    def test_executors(self):
+        serial = simulate(model, range(100), self.keys, bin_widths=self.bin_widths, chunk_size=16)
+        with ThreadPoolExecutor(2) as executor:
+            threaded = simulate(model, range(100), self.keys, executor, bin_widths=self.bin_widths, chunk_size=16)
+        with ProcessPoolExecutor(2) as executor:
+            processes = simulate(model, range(100), self.keys, executor, bin_widths=self.bin_widths, chunk_size=16)
+        for key in self.keys:
+            assert vars(processes[key]) == vars(serial[key])
+            if key != "luck":  # threads share the global random module
+                assert vars(threaded[key]) == vars(serial[key])
+
+    def test_uncompilable(self):
+        results = simulate(uncompilable, range(50), self.keys + [("sums", "best")], bin_widths=self.bin_widths)
+        self.check(results, range(50))
+        assert vars(results["sums", "best"]) == vars(results["stats", "best"])
+
+    def test_other_errors(self):
+        results = simulate(model, range(10), ["total", ("rolls", 5)])
+        assert (results["total"].count, results["total"].errors) == (10, 0)
+        assert (results["rolls", 5].count, results["rolls", 5].errors) == (0, 10)
+
+    def test_options(self):
+        state = random.getstate()
+        results = simulate(model, iter(range(30)), ["total"], seed_key="bonus", bin_widths={"total": 10})
+        assert random.getstate() == state
+        rolled = model()["total"] - 1
+        assert results["total"].histogram == Counter((rolled + bonus) // 10 * 10 for bonus in range(30))
+        with raises(TypeError):
+            simulate(model, range(3), ["rolls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
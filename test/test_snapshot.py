@@ -0,0 +1,97 @@
+import pickle
+import unittest
+from functools import partial
+from io import BytesIO
+
+from pytest import raises
+
+from closure_collector.closures import index_reference
+from closure_collector.core import ClosureCollector
+from closure_collector.snapshot import FORMAT, MAGIC, restore, snapshot
+from flock.core import FlockAggregator, FlockDict, FlockList
+from test.helpers import CALLS, called, scaled
+
+__author__ = "Andy Fundinger"
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """
+    Tests of snapshotting collector trees with their rules and cached values
+    """
+
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+        flock = self.flock = FlockDict({"level": 2, "stats": {"str": 3, "dex": 4}, "gear": FlockList(["sword"])})
+        flock["double"] = lambda: called("double", flock["level"] * 2)
+        flock["total"] = lambda: called("total", flock["double"] + sum(flock["stats"].values()))
+        flock["strength"] = index_reference(flock, "stats", "str")
+        flock["tripled"] = partial(scaled, flock, "level", 3)
+        flock["sums"] = FlockAggregator([flock["stats"], {"str": 1}], sum)
+        flock["gear"].append(lambda: called("gear", flock["gear"][0].upper()))
+
+    def round_trip(self, collector):
+        file = BytesIO()
+        snapshot(collector, file)
+        file.seek(0)
+        return restore(file)
+
+    def test_warm(self):
+        sheared = self.flock.shear()
+        calls = CALLS.copy()
+        restored = self.round_trip(self.flock)
+        assert restored is not self.flock
+        assert restored.shear() == sheared and restored["total"] == 11
+        assert CALLS == calls
+        assert "total" in restored.cache and restored.promises["stats"].root is restored
+
+    def test_invalidation(self):
+        self.flock.shear()
+        restored = self.round_trip(self.flock)
+        restored["stats"]["str"] = 10
+        assert restored["total"] == 18 and restored["strength"] == 10 and restored["sums"]["str"] == 11
+        assert restored["tripled"] == 6 and restored["gear"][1] == "SWORD"
+        assert self.flock["total"] == 11
+        assert CALLS["total"] == 2 and CALLS["scaled"] == 1
+
+    def test_cold(self):
+        restored = self.round_trip(self.flock)
+        assert restored.shear() == self.flock.shear()
+
+    def test_lazy(self):
+        flock = FlockDict({"level": 2}, lazy=True)
+        flock["double"] = lambda: called("double", flock["level"] * 2)
+        flock["double"]
+        restored = self.round_trip(flock)
+        assert restored["double"] == 4 and CALLS["double"] == 1
+        restored["level"] = 5
+        assert restored["double"] == 10
+
+    def test_closure_collector(self):
+        collector = ClosureCollector(level=2, nested=ClosureCollector(bonus=1))
+        collector.double = lambda: collector.level * 2 + collector.nested.bonus
+        collector.double
+        restored = self.round_trip(collector)
+        assert restored.double == 5 and "double" in restored.cache
+        restored.level = 3
+        assert restored.double == 7
+
+    def test_unassigned(self):
+        rule = lambda: later  # noqa: E731
+        restored = self.round_trip([rule, rule])
+        assert restored[0] is restored[1]
+        with raises(NameError):
+            restored[0]()
+        later = 1  # noqa: F841
+
+    def test_invalid(self):
+        with raises(ValueError):
+            restore(BytesIO(pickle.dumps({"not": "a snapshot"})))
+        with raises(ValueError, match="Python 2.7"):
+            restore(BytesIO(pickle.dumps((MAGIC, FORMAT, (2, 7), 1))))
+        with raises(ValueError, match="format"):
+            restore(BytesIO(pickle.dumps((MAGIC, FORMAT + 1, (2, 7), 1))))
+
+
+if __name__ == "__main__":
+    unittest.main()
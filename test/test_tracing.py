@@ -0,0 +1,77 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from closure_collector.tracing import Trace
+from flock.core import FlockAggregator, FlockDict, SourceList
+
+__author__ = "Andy Fundinger"
+
+
+class TraceTestCase(unittest.TestCase):
+    """
+    Tests of tracing evaluations as Chrome trace events
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.flock = FlockDict({"level": 2, "stats": {"str": 3}})
+        self.flock["double"] = lambda: self.flock["level"] * 2
+        self.flock["total"] = lambda: self.flock["double"] + self.flock["stats"]["bonus"]
+        self.flock["stats"]["bonus"] = lambda: self.flock["stats"]["str"] + 1
+        self.flock["sums"] = FlockAggregator(SourceList([self.flock["stats"]]), sum)
+
+    def spans(self, trace) -> dict:
+        return {event["name"]: event for event in trace.events() if event["ph"] == "X"}
+
+    def test_nesting(self):
+        other = FlockDict({"level": 1})
+        other["double"] = lambda: other["level"] * 2
+        with self.flock["stats"].trace() as trace:
+            self.flock["total"]
+            self.flock["total"]
+            self.flock["sums"]["bonus"]
+            other["double"]
+        spans = self.spans(trace)
+        assert set(spans) == {"total", "double", "stats / bonus", "sums", "sums / KEYS", "sums / bonus"}
+        assert [event["name"] for event in trace.events() if event["ph"] == "X"].count("total") == 1
+        outer = spans["total"]
+        for name in ("double", "stats / bonus"):
+            inner = spans[name]
+            assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+            assert inner["tid"] == outer["tid"]
+        assert spans["sums / bonus"]["ts"] >= outer["ts"] + outer["dur"]
+        assert (spans["total"]["cat"], spans["sums / bonus"]["cat"]) == ("FlockDict", "FlockAggregator")
+        assert trace.rows()[0].evaluations == 1
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "trace.json"
+            with self.flock.trace(path):
+                self.flock.shear()
+            trace = json.loads(path.read_text())
+        names = [event["name"] for event in trace["traceEvents"]]
+        assert "total" in names and "(SHEARED, False)" in names
+        assert [event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"] == ["MainThread"]
+
+    def test_threads(self):
+        trace = Trace()
+        trace.start()
+        thread = threading.Thread(target=lambda: self.flock["double"], name="worker")
+        thread.start()
+        thread.join()
+        self.flock["total"]
+        trace.stop()
+        self.flock["level"] = 5
+        self.flock["total"]
+        spans = self.spans(trace)
+        assert spans["double"]["tid"] != spans["total"]["tid"]
+        assert sorted(event["args"]["name"] for event in trace.events() if event["ph"] == "M") == ["MainThread", "worker"]
+        trace.reset()
+        assert trace.events() == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,11 @@
+import functools
+import inspect
 import logging
 import unittest
 
 import pytest
 
-from closure_collector.util import is_rule
+from closure_collector.util import Constant, code_parameters, is_rule, parameter_count, takes_no_arguments
 from flock import FlockDict
 from flock.util import patch
 
@@ -47,12 +49,72 @@ def mk_closure(kr):
         (ProbeClassRule(), True),
         (ProbeClassRule, True),
         (tir, True),
+        (Constant(5), False),
+        (Constant("text"), False),
+        (Constant({}), True),
     ],
 )
 def test_is_rule(func, is_it):
     assert is_rule(func) == is_it
 
 
+def keyword_only(*, a, b=2):
+    pass
+
+
+def positional_only(a, b, /, c):
+    pass
+
+
+def everything(a, *args, b, **kwargs):
+    pass
+
+
+@functools.wraps(keyword_only)
+def wrapped(*args, **kwargs):
+    pass
+
+
+@pytest.mark.parametrize(
+    "func",
+    [
+        lambda: 3,
+        lambda x: x,
+        lambda x=1: x,
+        keyword_only,
+        positional_only,
+        everything,
+        wrapped,
+        ProbeObject(),
+        ProbeObject().__call__,
+        ProbeObject,
+        FlockDict(),
+        functools.partial(positional_only, 1),
+        functools.partial(positional_only, 1, 2, 3),
+        functools.partial(everything, 1, 2, 3),
+        functools.partial(keyword_only, a=1),
+        functools.partial(functools.partial(positional_only, 1), 2),
+        abs,
+        len,
+        mk_closure(5),
+    ],
+)
+def test_parameter_count(func):
+    assert parameter_count(func) == len(inspect.signature(func).parameters)
+
+
+def test_parameter_counts_are_bounded():
+    for count in range(code_parameters.cache_info().maxsize + 10):
+        func = eval(compile(f"lambda {', '.join(f'a{i}' for i in range(count % 5))}: {count}", f"<rule {count}>", "eval"))
+        assert parameter_count(func) == count % 5
+    assert code_parameters.cache_info().currsize == code_parameters.cache_info().maxsize
+
+
+@pytest.mark.parametrize(("value", "expected"), [(3, False), ("text", False), (None, False), (lambda: 3, True), (lambda x: x, False)])
+def test_takes_no_arguments(value, expected):
+    assert takes_no_arguments(value) == expected
+
+
 class PatchTestCase(unittest.TestCase):
     def setUp(self):
         super().setUp()
@@ -0,0 +1,134 @@
+import statistics
+import unittest
+from collections import Counter
+
+from pytest import importorskip, raises
+
+from closure_collector.vectorized import has_floats, is_numeric, reduce_rows, reducer
+from flock.core import FlockAggregator, FlockDict, SourceList
+from flock.util import FlockException
+
+np = importorskip("numpy")
+
+__author__ = "Andy Fundinger"
+
+
+def total(values):
+    """Add up values of any type, numbers or Counters."""
+    return sum(values[1:], values[0])
+
+
+def tally(x):
+    """A rule giving a Counter, like the bonuses totalled by cross_total in the mythica example."""
+    return lambda: Counter(x=x)
+
+
+class ReducerTestCase(unittest.TestCase):
+    """
+    Tests of choosing and applying NumPy reductions
+    """
+
+    def test_reducer(self):
+        assert reducer(sum) is np.sum
+        assert reducer(statistics.mean) is np.mean
+        assert reducer(np.add) == np.add.reduce
+        assert reducer(np.prod) is np.prod
+        custom = lambda array, axis: array.sum(axis=axis)
+        assert reducer(lambda values: 0, custom) is custom
+        with raises(ValueError):
+            reducer(lambda values: 0)
+
+    def test_is_numeric(self):
+        assert is_numeric([1, 2.5, True, np.int64(3), np.float32(1)])
+        assert not is_numeric([1, "2"])
+        assert not is_numeric([1, Counter(a=1)])
+        assert not is_numeric([1, 1j])
+        assert has_floats([1, np.float32(1)]) and not has_floats([1, np.int64(1)])
+
+    def test_reduce_rows(self):
+        assert reduce_rows(np.sum, {"a": [1, 2], "b": [3, 4]}) == {"a": 3, "b": 7}
+        assert reduce_rows(np.sum, {}) == {}
+        assert reduce_rows(np.sum, {"big": [2**70, 1]}) == {}
+
+    def test_integer_overflow(self):
+        assert reduce_rows(np.sum, {"wraps": [2**62, 2**62, 2**62], "fits": [2**61, 2**61, 2**61]}) == {"fits": 3 * 2**61}
+        assert reduce_rows(np.prod, {"wraps": [2**40, 2**40], "fits": [2**20, 2**20]}) == {"fits": 2**40}
+        assert reduce_rows(np.sum, {"wraps": [2**62, 2**62]}) == {}
+        sources = [FlockDict({"big": 2**62, "small": 1}) for _ in range(4)]
+        aggregator = FlockAggregator(sources, sum, vectorized=True)
+        assert aggregator.shear() == {"big": 2**64, "small": 4}
+
+
+class VectorizedAggregatorTestCase(unittest.TestCase):
+    """
+    Tests of aggregators reducing numeric values with NumPy
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.sources = [FlockDict({"count": x, "weight": x / 4, "tally": tally(x)}) for x in range(1, 6)]
+        self.sources[0]["bonus"] = 10
+        self.calls = []
+
+    def counted_sum(self, array, axis):
+        self.calls.append(array.shape)
+        return array.sum(axis=axis)
+
+    def test_matches_plain_aggregation(self):
+        numeric = [FlockDict({key: value for key, value in source.items() if key != "tally"}) for source in self.sources]
+        for fn in (sum, min, max, statistics.mean, statistics.median):
+            plain = FlockAggregator(numeric, fn).shear()
+            vectorized = FlockAggregator(numeric, fn, vectorized=True).shear()
+            assert vectorized == plain
+            if fn in (sum, min, max):
+                assert [type(value) for value in vectorized.values()] == [type(value) for value in plain.values()]
+
+    def test_one_call_per_group(self):
+        aggregator = FlockAggregator(SourceList(self.sources), total, vectorized=self.counted_sum)
+        assert aggregator["count"] == 15
+        assert aggregator.shear() == {"count": 15, "weight": 3.75, "tally": Counter(x=15), "bonus": 10}
+        assert sorted(self.calls) == [(1, 1), (1, 5), (1, 5)]
+        assert aggregator.reduced() == {"count": 15, "weight": 3.75, "bonus": 10}
+
+    def test_non_numeric_values_fall_back(self):
+        aggregator = FlockAggregator(self.sources, total, vectorized=np.sum)
+        assert aggregator["tally"] == Counter(x=15)
+        assert aggregator["count"] == 15
+        self.sources[1]["count"] = "two"
+        assert "count" not in aggregator.reduced()
+        with raises(FlockException):
+            aggregator["count"]
+
+    def test_changes(self):
+        aggregator = FlockAggregator(SourceList(self.sources), sum, vectorized=self.counted_sum)
+        reader = FlockDict({"total": lambda: aggregator["count"] + aggregator["bonus"]})
+        assert reader["total"] == 25
+        self.sources[1]["count"] = 20
+        assert reader["total"] == 43
+        self.sources[2]["bonus"] = 5
+        assert (aggregator["bonus"], aggregator.reduced()["bonus"]) == (15, 15)
+        aggregator.sources.append(FlockDict({"count": 100}))
+        assert reader["total"] == 148
+        assert len(self.calls) == 12
+
+    def test_lazy(self):
+        sources = [FlockDict({"count": x}, lazy=True) for x in range(3)]
+        aggregator = FlockAggregator(sources, max, lazy=True, vectorized=True)
+        assert aggregator["count"] == 2
+        sources[0]["count"] = 7
+        assert aggregator["count"] == 7
+
+    def test_untracked(self):
+        sources = [{"count": 1}, {"count": 2}]
+        aggregator = FlockAggregator(sources, sum, vectorized=True)
+        assert aggregator["count"] == 3
+        sources[0]["count"] = 5
+        assert aggregator["count"] == 7
+
+    def test_unknown_function(self):
+        with raises(ValueError):
+            FlockAggregator(self.sources, lambda values: 0, vectorized=True)
+
+
+if __name__ == "__main__":
+    unittest.main()